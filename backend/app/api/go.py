@@ -0,0 +1,124 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from typing import Dict, Any, List
+import io
+
+from starlette.concurrency import run_in_threadpool
+
+from ..models.schemas import GOntologyRequest, GOSimilarityRequest, GOEnrichmentRequest
+from ..services.data_ingestion import DataIngestionService
+from ..services.go_enrichment import enrichment_indexes
+from ..services.go_similarity import (
+    GODag, go_ontologies, group_annotations, MAX_SIMILARITY_MATRIX
+)
+from .orthologue import get_orthogroup_genes
+
+router = APIRouter(prefix="/api/go", tags=["go"])
+
+
+@router.post("/ontologies")
+async def load_ontology(request: GOntologyRequest) -> Dict[str, Any]:
+    """Load GO from a dataset produced by the upload endpoint (GO OWL)"""
+    try:
+        dag = await run_in_threadpool(GODag.from_dataset, request.data)
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid GO dataset: {e}")
+    if not dag.n_terms:
+        raise HTTPException(status_code=400, detail="The dataset contains no GO terms")
+    return go_ontologies.add(dag).summary()
+
+
+@router.post("/ontologies/upload")
+async def upload_ontology(file: UploadFile = File(...)) -> Dict[str, Any]:
+    """Load GO from an OBO file (go-basic.obo) or an OWL/RDF/Turtle file"""
+    try:
+        if file.filename.endswith(".obo"):
+            lines = io.TextIOWrapper(file.file, encoding="utf-8")
+            dag = await run_in_threadpool(GODag.from_obo, lines)
+        else:
+            data = await DataIngestionService().process_file(file)
+            dag = await run_in_threadpool(GODag.from_dataset, data)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not dag.n_terms:
+        raise HTTPException(status_code=400, detail=f"No GO terms found in {file.filename}")
+    return go_ontologies.add(dag).summary()
+
+
+@router.get("/ontologies")
+async def list_ontologies() -> List[Dict[str, Any]]:
+    """List the loaded ontologies"""
+    return go_ontologies.list()
+
+
+@router.post("/similarity")
+def go_similarity(request: GOSimilarityRequest) -> Dict[str, Any]:
+    """Semantic similarity of GO-annotated genes, or of orthogroups when
+    ``groups`` maps each group to its member genes
+
+    Returns the similarity of the requested ``pairs``, otherwise the
+    ``top_k`` most similar entities of each entity, plus the full matrix
+    when ``matrix`` is set (up to MAX_SIMILARITY_MATRIX entities).
+    """
+    annotations, corpus = request.annotations, None
+    if request.groups is not None:
+        annotations, corpus = group_annotations(request.annotations, request.groups), request.annotations
+    try:
+        engine = go_ontologies.similarity(request.ontology_id, annotations, request.ic_source, corpus,
+                                          request.namespace)
+        result = {"measure": request.measure, **engine.summary()}
+        if request.pairs is not None:
+            if any(len(pair) != 2 for pair in request.pairs):
+                raise ValueError("pairs must be lists of two IDs")
+            scores = engine.pair_similarity([tuple(pair) for pair in request.pairs], request.measure)
+            result["pairs"] = [{"first": first, "second": second, "score": score}
+                               for (first, second), score in zip(request.pairs, scores)]
+            return result
+        if request.matrix and len(engine.entity_ids) > MAX_SIMILARITY_MATRIX:
+            raise ValueError(f"The full matrix is limited to {MAX_SIMILARITY_MATRIX} entities; use top_k")
+        result["matches"] = engine.top_matches(request.measure, request.top_k)
+        if request.matrix:
+            result["matrix"] = {"ids": engine.entity_ids,
+                                "values": engine.similarity_matrix(request.measure).round(6).tolist()}
+    except KeyError:
+        raise HTTPException(status_code=404,
+                            detail=f"Ontology '{request.ontology_id}' not found; load it again")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return result
+
+
+@router.post("/enrichment")
+def go_enrichment(request: GOEnrichmentRequest) -> Dict[str, Any]:
+    """GO term enrichment of a gene list and/or the genes of orthogroups
+    (restricted to ``species`` when set) against a species' annotations
+
+    ``annotations`` maps every gene of the population to its GO terms. The
+    propagated table is kept per ontology and species, so later requests
+    for the same species may leave it out. With ``fdr`` null every tested
+    term is reported.
+    """
+    try:
+        dag = go_ontologies.get(request.ontology_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Ontology '{request.ontology_id}' not found; load it again")
+    try:
+        index = enrichment_indexes.species_index(dag, request.species, request.annotations)
+    except KeyError:
+        raise HTTPException(status_code=404,
+                            detail=f"No annotations cached for species '{request.species}'; send them again")
+
+    study_genes = list(request.genes or [])
+    for orthogroup_id in request.orthogroup_ids or []:
+        genes_by_species = get_orthogroup_genes(orthogroup_id)
+        if not genes_by_species:
+            raise HTTPException(status_code=404, detail=f"Orthogroup '{orthogroup_id}' not found")
+        for species, genes in genes_by_species.items():
+            if request.species is None or species == request.species:
+                study_genes.extend(genes)
+    if not study_genes:
+        raise HTTPException(status_code=400, detail="Provide genes or orthogroup_ids")
+    try:
+        result = index.enrich(study_genes, request.fdr, request.min_count, request.namespace)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ontology_id": request.ontology_id, "species": request.species, **result}
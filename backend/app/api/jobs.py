@@ -0,0 +1,73 @@
+from fastapi import APIRouter, HTTPException
+from typing import Dict, Any, List
+
+from ..models.schemas import AnalysisJobRequest
+from ..services.analysis_jobs import analysis_jobs, JobQueueFull
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"], on_shutdown=[analysis_jobs.shutdown])
+
+
+def _get_job(job_id: str):
+    try:
+        return analysis_jobs.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+
+
+@router.post("", status_code=202)
+def submit_job(request: AnalysisJobRequest) -> Dict[str, Any]:
+    """Queue an analysis and return its job ID for polling
+
+    Hashing the dataset, reading the result cache and starting the worker
+    pool all block, so this runs in the threadpool.
+    """
+    try:
+        job = analysis_jobs.submit(request.data, request.parameters, request.timeout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.summary()
+
+
+@router.get("")
+async def list_jobs() -> List[Dict[str, Any]]:
+    """Summaries of queued, running and recently finished jobs"""
+    return analysis_jobs.list()
+
+
+@router.get("/stats")
+async def job_stats() -> Dict[str, Any]:
+    """Queue occupancy, outcomes and timing metrics"""
+    return analysis_jobs.stats()
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str) -> Dict[str, Any]:
+    """Status and progress of a job"""
+    return _get_job(job_id).summary()
+
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str) -> Dict[str, Any]:
+    """Result of a completed job (409 while it is unfinished or if it failed)"""
+    job = _get_job(job_id)
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail={
+            "message": f"Job '{job_id}' is {job.status}",
+            "status": job.status,
+            "progress": job.progress,
+            "error": job.error
+        })
+    return job.result
+
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str) -> Dict[str, Any]:
+    """Cancel a job; running jobs stop at their next progress report or
+    are terminated after a grace period"""
+    try:
+        job = analysis_jobs.cancel(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job.summary()
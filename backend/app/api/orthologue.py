@@ -1,10 +1,20 @@
 from fastapi import APIRouter, HTTPException, Path, Query
 from typing import List, Dict, Any, Optional
 import os
+import numpy as np
 import pandas as pd
 import logging
 from collections import defaultdict
 from ..models.phylo import OrthologueSearchRequest, OrthologueSearchResponse, OrthologueData, OrthoSpeciesCount
+from ..services.compact_tree import induced_subtree
+from ..services.newick_writer import write_newick
+from ..services.tree_cache import tree_cache
+from ..services.tree_layout import get_tree_layout, validate_layout_types, add_layout_to_nodes
+from ..services.taxonium_format import validate_encoding, nodes_to_columns, encode_taxonium
+from ..services.ancestral_reconstruction import reconstruct_gain_loss, RECONSTRUCTION_METHODS
+from ..services.clade_aggregation import get_clade_membership, aggregate_clades
+from ..services.gene_trees import GeneTreeStore
+from ..services.reconciliation import reconcile
 from ete3 import Tree
 
 # Create router
@@ -24,11 +34,17 @@ DATA_DIR = os.environ.get("ORTHOFINDER_DATA_DIR", os.path.join(BASE_DIR, "data/o
 TREE_FILE = os.path.join(DATA_DIR, "SpeciesTree_nameSp_completeGenome110124.tree")
 ORTHOGROUPS_FILE = os.path.join(DATA_DIR, "Orthogroups_clean_121124.txt")
 SPECIES_MAPPING_FILE = os.path.join(DATA_DIR, "Table_S1_Metadata_angiosperm_species.csv")
+# OrthoFinder Gene_Trees directory, or a concatenated "<orthogroup>\t<newick>" archive
+GENE_TREES_PATH = os.environ.get("ORTHOFINDER_GENE_TREES", os.path.join(DATA_DIR, "Gene_Trees"))
 
 # Cache for the data to avoid reloading
 _orthogroups_data = None
 _species_mapping = None
 _species_tree = None
+_species_copy_numbers = None
+_gain_loss_results = {}
+_clade_summary = None
+_gene_tree_store = None
 
 def load_orthogroups_data():
     """Load orthogroups data from CSV file"""
@@ -182,6 +198,170 @@ def get_orthogroup_genes(orthogroup_id: str) -> Dict[str, List[str]]:
     
     return genes_by_species
 
+def resolve_leaf_species(node_name: str, species_names,
+                         species_mapping: Dict[str, Dict[str, str]]) -> Optional[str]:
+    """Match a tree leaf name to one of the given species names"""
+    # Species tree leaves may carry Newick quotes around the name
+    for name in (node_name, node_name.strip("'\"")):
+        if name in species_names:
+            return name
+        full_name = species_mapping['newick_to_full'].get(name)
+        if full_name in species_names:
+            return full_name
+    return None
+
+def get_leaf_orthologue_count(node_name: str, species_counts: Dict[str, int],
+                              species_mapping: Dict[str, Dict[str, str]]) -> int:
+    """Match a tree leaf name to its orthologue count"""
+    species = resolve_leaf_species(node_name, species_counts, species_mapping)
+    return species_counts[species] if species is not None else 0
+
+def load_species_copy_numbers() -> Dict[str, Any]:
+    """Build the species-tree nodes x orthogroups gene copy-number matrix
+
+    Rows follow the preorder of the cached species tree; internal rows and
+    leaves without an orthogroup column stay zero, the latter flagged in
+    ``missing_leaves``.
+    """
+    global _species_copy_numbers
+    if _species_copy_numbers is None:
+        df = load_orthogroups_data()
+        entry = tree_cache.put(load_species_tree())
+        tree = entry.tree
+        species_mapping = load_species_mapping()
+
+        # Genes are comma separated, so a cell holds (commas + 1) copies;
+        # species columns without any gene are read as floats, hence the cast
+        cells = df[df.columns[1:]].astype("string").fillna("")
+        counts = (cells.apply(lambda col: col.str.count(',') + 1)
+                  .where(cells.apply(lambda col: col.str.strip() != ''), 0)
+                  .astype(np.int32).to_numpy())
+
+        species_columns = {name: i for i, name in enumerate(df.columns[1:])}
+        copy_numbers = np.zeros((tree.n_nodes, len(df)), dtype=np.int32)
+        species_leaves = {}
+        unmapped = []
+        missing_leaves = np.zeros(tree.n_nodes, dtype=bool)
+        for leaf in np.flatnonzero(tree.is_leaf):
+            species = resolve_leaf_species(tree.names[leaf], species_columns, species_mapping)
+            if species is None:
+                unmapped.append(tree.names[leaf])
+                missing_leaves[leaf] = True
+            else:
+                copy_numbers[leaf] = counts[:, species_columns[species]]
+                species_leaves[species] = int(leaf)
+        if unmapped:
+            logger.warning(f"{len(unmapped)} species tree leaves have no orthogroup column; "
+                           "they are treated as missing data")
+
+        _species_copy_numbers = {
+            "orthogroups": df[df.columns[0]].astype(str).tolist(),
+            "copy_numbers": copy_numbers,
+            "species_leaves": species_leaves,
+            "unmapped_leaves": unmapped,
+            "missing_leaves": missing_leaves
+        }
+    return _species_copy_numbers
+
+def get_clade_summary() -> Dict[str, Any]:
+    """Aggregate every orthogroup over every species tree clade in one batch"""
+    global _clade_summary
+    if _clade_summary is None:
+        data = load_species_copy_numbers()
+        entry = tree_cache.put(load_species_tree())
+        tree = entry.tree
+        membership = get_clade_membership(entry)
+        leaf_copy_numbers = data["copy_numbers"][tree.is_leaf]
+
+        gene_count = np.zeros(tree.n_nodes)
+        orthogroup_count = np.zeros(tree.n_nodes)
+        present_fraction = np.zeros(tree.n_nodes)
+        # Column blocks keep the nodes x orthogroups products small
+        for start in range(0, leaf_copy_numbers.shape[1], 8192):
+            block = leaf_copy_numbers[:, start:start + 8192]
+            aggregates = aggregate_clades(tree, membership, block)
+            gene_count += aggregates["sum"].sum(axis=1)
+            orthogroup_count += (aggregates["sum"] > 0).sum(axis=1)
+            present_fraction += aggregates["present_fraction"].sum(axis=1)
+
+        _clade_summary = {
+            "gene_count": gene_count,
+            "orthogroup_count": orthogroup_count,
+            "mean_present_fraction": present_fraction / max(leaf_copy_numbers.shape[1], 1)
+        }
+    return _clade_summary
+
+def get_gene_tree_store() -> GeneTreeStore:
+    """Get the lazily indexed store of OrthoFinder gene trees"""
+    global _gene_tree_store
+    if _gene_tree_store is None:
+        _gene_tree_store = GeneTreeStore(GENE_TREES_PATH, tree_cache)
+    return _gene_tree_store
+
+def load_gene_tree(orthogroup_id: str):
+    """Load the cached gene tree of an orthogroup"""
+    store = get_gene_tree_store()
+    if not store.available:
+        raise HTTPException(status_code=404, detail=f"No gene trees found at {store.path}")
+    try:
+        return store.get(orthogroup_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No gene tree for orthogroup {orthogroup_id}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Invalid gene tree for {orthogroup_id}: {str(e)}")
+
+def map_gene_leaves(gene_tree, orthogroup_id: str, species_leaves: Dict[str, int]) -> np.ndarray:
+    """Map gene-tree leaves to species-tree leaves
+
+    OrthoFinder gene tree leaves are named "<species>_<gene>", and both
+    parts may contain underscores. Genes are looked up in the orthogroup
+    table first, then by the longest prefix that is a known species, then
+    by their gene part in the table.
+    """
+    gene_species = {}
+    for species, genes in get_orthogroup_genes(orthogroup_id).items():
+        gene_species.update(dict.fromkeys(genes, species))
+    
+    leaf_species = np.full(gene_tree.n_nodes, -1, dtype=np.int64)
+    for leaf in np.flatnonzero(gene_tree.is_leaf):
+        name = gene_tree.names[leaf].strip("'\"")
+        species = gene_species.get(name)
+        if species is None:
+            splits = [i for i, char in enumerate(name) if char == "_"]
+            species = next((name[:i] for i in reversed(splits) if name[:i] in species_leaves), None)
+            if species is None:
+                species = next((gene_species[name[i + 1:]] for i in splits if name[i + 1:] in gene_species), None)
+        if species in species_leaves:
+            leaf_species[leaf] = species_leaves[species]
+    return leaf_species
+
+def get_reconciliation(orthogroup_id: str) -> Dict[str, Any]:
+    """Reconcile an orthogroup's gene tree with the species tree (cached per tree)"""
+    data = load_species_copy_numbers()
+    species_entry = tree_cache.put(load_species_tree())
+    gene_entry = load_gene_tree(orthogroup_id)
+
+    def build():
+        leaf_species = map_gene_leaves(gene_entry.tree, orthogroup_id, data["species_leaves"])
+        result = reconcile(gene_entry.tree, species_entry.lca, leaf_species)
+        result["unmapped_genes"] = [
+            gene_entry.tree.names[leaf] for leaf in np.flatnonzero(gene_entry.tree.is_leaf & (leaf_species < 0))
+        ]
+        return result
+
+    return gene_entry.get_derived(("reconciliation", species_entry.tree_id), build)
+
+def get_gain_loss(method: str) -> Dict[str, Any]:
+    """Get the cached gain/loss reconstruction of every orthogroup"""
+    if method not in _gain_loss_results:
+        data = load_species_copy_numbers()
+        # The species tree may have been evicted by other uploads since
+        tree = tree_cache.put(load_species_tree()).tree
+        logger.info(f"Reconstructing {method} gain/loss for {len(data['orthogroups'])} orthogroups")
+        _gain_loss_results[method] = reconstruct_gain_loss(tree, data["copy_numbers"] > 0, method,
+                                                           missing_leaves=data["missing_leaves"])
+    return _gain_loss_results[method]
+
 @router.post("/search", response_model=OrthologueSearchResponse)
 async def search_orthologues(request: OrthologueSearchRequest):
     """Search for orthologues of a given gene ID"""
@@ -272,10 +452,21 @@ async def search_orthologues_taxonium(request: OrthologueSearchRequest):
             "message": standard_response.message
         }
     
+    try:
+        layouts = validate_layout_types(request.layouts)
+        # Binary payloads cannot be embedded in this JSON response
+        encoding = validate_encoding(request.encoding, ("rows", "columnar"))
+    except ValueError as e:
+        return {
+            "success": False,
+            "message": str(e)
+        }
+    
     try:
         # Parse the tree using ETE3
         tree_string = standard_response.newick_tree
-        tree = Tree(tree_string, format=1)
+        entry = tree_cache.put(tree_string)
+        tree = entry.tree.to_ete()
         
         # Convert to Taxonium format
         taxonium_data = {
@@ -285,6 +476,14 @@ async def search_orthologues_taxonium(request: OrthologueSearchRequest):
                     {
                         "name": "orthologueCount",
                         "type": "continuous"
+                    },
+                    {
+                        "name": "maxOrthologueCount",
+                        "type": "continuous"
+                    },
+                    {
+                        "name": "speciesPresentFraction",
+                        "type": "continuous"
                     }
                 ]
             }
@@ -292,6 +491,22 @@ async def search_orthologues_taxonium(request: OrthologueSearchRequest):
         
         # Create a map of species names to orthologue counts
         species_counts = {item.species_name: item.count for item in standard_response.counts_by_species}
+        species_mapping = load_species_mapping()
+        
+        # Optionally restrict the tree to the species carrying orthologues
+        pruned = False
+        if request.prune_tree:
+            index = entry.lca
+            present = [
+                index.tree.names[leaf] for leaf in np.flatnonzero(index.tree.is_leaf)
+                if get_leaf_orthologue_count(index.tree.names[leaf], species_counts, species_mapping) > 0
+            ]
+            if present:
+                pruned_tree = induced_subtree(index, present)
+                tree = pruned_tree.to_ete()
+                tree_string = write_newick(pruned_tree)
+                entry = tree_cache.put(tree_string, pruned_tree)
+                pruned = True
         
         # Add node data in Taxonium format
         node_id = 0
@@ -312,17 +527,7 @@ async def search_orthologues_taxonium(request: OrthologueSearchRequest):
             # Get orthologue count if this is a leaf node with a species name
             orthologue_count = 0
             if node.is_leaf():
-                # Try to map the node name to a full species name if needed
-                species_mapping = load_species_mapping()
-                node_name = node.name
-                
-                # Try different ways to match the node name to a species
-                if node_name in species_counts:
-                    orthologue_count = species_counts[node_name]
-                elif node_name in species_mapping['newick_to_full']:
-                    full_name = species_mapping['newick_to_full'][node_name]
-                    if full_name in species_counts:
-                        orthologue_count = species_counts[full_name]
+                orthologue_count = get_leaf_orthologue_count(node.name, species_counts, species_mapping)
             
             # Add node to Taxonium data
             taxonium_data["nodes"].append({
@@ -337,6 +542,27 @@ async def search_orthologues_taxonium(request: OrthologueSearchRequest):
                 }
             })
         
+        # Aggregate leaf counts over every clade (nodes are listed in preorder)
+        nodes = taxonium_data["nodes"]
+        leaves = np.flatnonzero(entry.tree.is_leaf)
+        leaf_counts = np.array([nodes[leaf]["orthologueCount"] for leaf in leaves])
+        aggregates = aggregate_clades(entry.tree, get_clade_membership(entry), leaf_counts)
+        for node_data, total, maximum, fraction in zip(
+                nodes, aggregates["sum"].tolist(), aggregates["max"].tolist(),
+                aggregates["present_fraction"].tolist()):
+            node_data["orthologueCount"] = int(total)
+            node_data["metadata"]["orthologueCount"] = int(total)
+            node_data["metadata"]["maxOrthologueCount"] = int(maximum)
+            node_data["metadata"]["speciesPresentFraction"] = fraction
+        
+        # Add precomputed coordinates (nodes are listed in preorder)
+        if layouts:
+            add_layout_to_nodes(nodes, get_tree_layout(entry), layouts)
+        
+        if encoding == "columnar":
+            columns, metadata_columns = nodes_to_columns(nodes)
+            taxonium_data = encode_taxonium(columns, metadata_columns, taxonium_data["metadata"], encoding)
+        
         # Merge with original orthologue data
         result = {
             "success": True,
@@ -345,6 +571,7 @@ async def search_orthologues_taxonium(request: OrthologueSearchRequest):
             "orthologues": [ortho.dict() for ortho in standard_response.orthologues],
             "counts_by_species": [count.dict() for count in standard_response.counts_by_species],
             "newick_tree": tree_string,
+            "pruned": pruned,
             "taxonium_tree": taxonium_data
         }
         
@@ -355,4 +582,171 @@ async def search_orthologues_taxonium(request: OrthologueSearchRequest):
             "success": False,
             "message": f"Error creating Taxonium format: {str(e)}",
             "regular_response": standard_response.dict()
-        } 
\ No newline at end of file
+        } 
+
+@router.get("/gain_loss", response_model=Dict[str, Any])
+def get_orthogroup_gain_loss(method: str = Query("dollo", description="dollo or fitch")):
+    """Get orthogroup gain/loss counts on every species tree branch"""
+    if method not in RECONSTRUCTION_METHODS:
+        raise HTTPException(status_code=400, detail=f"Unsupported method '{method}'. Use one of: {', '.join(RECONSTRUCTION_METHODS)}")
+    
+    data = load_species_copy_numbers()
+    result = get_gain_loss(method)
+    tree = tree_cache.put(load_species_tree()).tree
+    
+    branches = []
+    for node in range(tree.n_nodes):
+        branches.append({
+            "id": node,
+            "parentId": int(tree.parent[node]) if node > 0 else None,
+            "name": tree.names[node],
+            "gains": int(result["branch_gains"][node]),
+            "losses": int(result["branch_losses"][node])
+        })
+    
+    return {
+        "success": True,
+        "method": method,
+        "orthogroup_count": len(data["orthogroups"]),
+        "unmapped_leaves": data["unmapped_leaves"],
+        "branches": branches
+    }
+
+@router.get("/gain_loss/{orthogroup_id}", response_model=Dict[str, Any])
+def get_single_orthogroup_gain_loss(orthogroup_id: str,
+                                    method: str = Query("dollo", description="dollo or fitch")):
+    """Get the origin node and gain/loss branches of one orthogroup"""
+    if method not in RECONSTRUCTION_METHODS:
+        raise HTTPException(status_code=400, detail=f"Unsupported method '{method}'. Use one of: {', '.join(RECONSTRUCTION_METHODS)}")
+    
+    data = load_species_copy_numbers()
+    try:
+        column = data["orthogroups"].index(orthogroup_id)
+    except ValueError:
+        return {
+            "success": False,
+            "message": f"Orthogroup {orthogroup_id} not found"
+        }
+    
+    tree = tree_cache.put(load_species_tree()).tree
+    origin = int(get_gain_loss(method)["origin"][column])
+    
+    # Re-running one column gives the individual branches with events
+    events = reconstruct_gain_loss(tree, data["copy_numbers"][:, column:column + 1] > 0, method,
+                                   missing_leaves=data["missing_leaves"])
+    return {
+        "success": True,
+        "method": method,
+        "orthogroup_id": orthogroup_id,
+        "origin": None if origin < 0 else {
+            "node_id": origin,
+            "name": tree.names[origin],
+            "clade_leaves": [tree.names[i] for i in tree.subtree_leaves(origin)]
+        },
+        "gain_nodes": np.flatnonzero(events["branch_gains"]).tolist(),
+        "loss_nodes": np.flatnonzero(events["branch_losses"]).tolist()
+    }
+
+@router.get("/clade_counts", response_model=Dict[str, Any])
+def get_clade_orthologue_counts(orthogroup_id: Optional[str] = Query(None)):
+    """Get orthologue counts aggregated over every species tree clade
+
+    With an orthogroup ID, returns the sum, maximum and species-present
+    fraction of its gene copies per clade; otherwise returns dataset-wide
+    gene and orthogroup totals per clade.
+    """
+    data = load_species_copy_numbers()
+    entry = tree_cache.put(load_species_tree())
+    tree = entry.tree
+    
+    if orthogroup_id is not None:
+        try:
+            column = data["orthogroups"].index(orthogroup_id)
+        except ValueError:
+            return {
+                "success": False,
+                "message": f"Orthogroup {orthogroup_id} not found"
+            }
+        leaf_copy_numbers = data["copy_numbers"][tree.is_leaf, column]
+        aggregates = aggregate_clades(tree, get_clade_membership(entry), leaf_copy_numbers)
+        values = {
+            "orthologueCount": aggregates["sum"],
+            "maxOrthologueCount": aggregates["max"],
+            "speciesPresentFraction": aggregates["present_fraction"]
+        }
+    else:
+        summary = get_clade_summary()
+        values = {
+            "geneCount": summary["gene_count"],
+            "orthogroupCount": summary["orthogroup_count"],
+            "meanPresentFraction": summary["mean_present_fraction"]
+        }
+    
+    nodes = []
+    for node in range(tree.n_nodes):
+        node_data = {
+            "id": node,
+            "parentId": int(tree.parent[node]) if node > 0 else None,
+            "name": tree.names[node]
+        }
+        for key, column in values.items():
+            node_data[key] = float(column[node])
+        nodes.append(node_data)
+    
+    return {
+        "success": True,
+        "orthogroup_id": orthogroup_id,
+        "nodes": nodes
+    }
+
+@router.get("/gene_trees", response_model=Dict[str, Any])
+async def get_gene_tree_store_summary():
+    """Get the location and size of the gene tree store"""
+    store = get_gene_tree_store()
+    return {"success": True, **store.summary()}
+
+@router.get("/gene_tree/{orthogroup_id}", response_model=Dict[str, Any])
+async def get_gene_tree(orthogroup_id: str):
+    """Get the gene tree of an orthogroup, loaded on demand from the store"""
+    entry = load_gene_tree(orthogroup_id)
+    return {
+        "success": True,
+        "orthogroup_id": orthogroup_id,
+        **entry.summary(),
+        "newick": entry.newick
+    }
+
+@router.get("/reconcile/{orthogroup_id}", response_model=Dict[str, Any])
+def reconcile_gene_tree(orthogroup_id: str):
+    """Map an orthogroup's gene tree onto the species tree
+
+    Every gene-tree node gets its species-tree node (LCA mapping), an event
+    (leaf, speciation, duplication, or none for nodes with a single mapped
+    child) and the number of gene losses on the branch above it.
+    """
+    result = get_reconciliation(orthogroup_id)
+    gene_tree = load_gene_tree(orthogroup_id).tree
+    species_tree = tree_cache.put(load_species_tree()).tree
+    
+    nodes = []
+    for node in range(gene_tree.n_nodes):
+        species = int(result["mapping"][node])
+        nodes.append({
+            "id": node,
+            "parentId": int(gene_tree.parent[node]) if node > 0 else None,
+            "name": gene_tree.names[node],
+            "species_node": species if species >= 0 else None,
+            "species": species_tree.names[species] if species >= 0 else None,
+            "event": result["events"][node],
+            "losses": int(result["losses"][node])
+        })
+    
+    return {
+        "success": True,
+        "orthogroup_id": orthogroup_id,
+        "duplications": result["duplications"],
+        "speciations": result["speciations"],
+        "losses": result["total_losses"],
+        "unmapped_genes": result["unmapped_genes"],
+        "nodes": nodes
+    }
@@ -1,22 +1,52 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
-from typing import Dict, Any, Optional, List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Dict, Any, Optional, List, AsyncIterator
 import os
 import tempfile
 import shutil
 import uuid
 import json
+import gzip
 import pathlib
+import numpy as np
 from Bio import Phylo
+from starlette.concurrency import run_in_threadpool
 try:
     from ete3 import Tree, TreeStyle, NodeStyle, faces, AttrFace
 except ImportError:
     raise ImportError("ETE Toolkit not installed. Please install it with 'pip install ete3==3.1.1'")
 
-from ..models.phylo import PhyloNodeData, TreeData, newick_to_dict, NodeMutation
+from ..models.phylo import (
+    PhyloNodeData, TreeData, MRCARequest, PruneRequest, LODRequest, RegisterTreeRequest,
+    PatristicRequest, ConsensusRequest, TreeCollectionRequest, CladeQueryRequest, NewickExportRequest,
+    newick_to_dict, NodeMutation
+)
+from ..services.compact_tree import CompactTree, induced_subtree
+from ..services.tree_cache import CachedTree, tree_cache
+from ..services.tree_layout import get_tree_layout, validate_layout_types, layout_columns
+from ..services.taxonium_format import (
+    BINARY_MEDIA_TYPE, validate_encoding, tree_columns, nodes_to_columns, encode_taxonium,
+    column_to_list
+)
+from ..services.tree_annotations import (
+    AnnotationTable, annotation_tables, get_tree_annotations, annotated_nodes
+)
+from ..services.tree_lod import get_tree_lod
+from ..services.newick_writer import write_newick, iter_newick
+from ..services.tree_distances import get_patristic_matrix, patristic_distances, MAX_PATRISTIC_LEAVES
+from ..services.tree_parsers import TreeStreamReader, NewickStreamParser, detect_tree_format, DEFAULT_CHUNK_SIZE
+from ..services.consensus import BipartitionCounter, leaf_bit_order, build_consensus, consensus_threshold
+from ..services.clade_index import CladeIndex, clade_indexes, compare_splits, compare_tree_splits
+from .orthologue import load_species_tree
 
 router = APIRouter(prefix="/api/phylo", tags=["phylo"])
 
+# Trees up to this size are also returned inline as Newick and JSON
+INLINE_TREE_MAX_NODES = 5000
+
+# Trees kept from a multi-tree upload (e.g. a bootstrap or posterior sample)
+MAX_UPLOAD_TREES = 1000
+
 # --- Models ---
 
 class PhyloRequest(PhyloNodeData):
@@ -71,72 +101,154 @@ def newick_to_dict(newick_str: str) -> NodeData:
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid Newick format: {str(e)}")
 
+def compact_to_dict(tree: CompactTree) -> Dict[str, Any]:
+    """Convert a compact tree to the nested dictionary returned by uploads"""
+    nodes = []
+    for index in range(tree.n_nodes):
+        name = tree.names[index]
+        node = {
+            "id": name or f"node_{index}",
+            "name": name,
+            "branch_length": float(tree.branch_lengths[index])
+        }
+        if not tree.is_leaf[index]:
+            node["children"] = []
+        if index > 0:
+            nodes[tree.parent[index]]["children"].append(node)
+        nodes.append(node)
+    return nodes[0]
+
+def compact_to_node_data(tree: CompactTree) -> NodeData:
+    """Convert a compact tree to the ``newick_to_dict`` representation"""
+    nodes: List[Optional[NodeData]] = [None] * tree.n_nodes
+    for index in reversed(range(tree.n_nodes)):
+        length = float(tree.branch_lengths[index])
+        support = float(tree.support[index])
+        children = [nodes[child] for child in tree.children(index)]
+        nodes[index] = NodeData(
+            id=tree.names[index] or f"node_{index}",
+            name=tree.names[index],
+            length=length if length != 0 else None,
+            support=None if np.isnan(support) else support,
+            children=children if children else None
+        )
+    return nodes[0]
+
+def resolve_tree(newick: Optional[str] = None, tree_id: Optional[str] = None,
+                 use_species_tree: bool = False) -> CachedTree:
+    """Look up a cached tree by ID, or parse and cache a Newick string"""
+    if tree_id:
+        try:
+            return tree_cache.get(tree_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Tree '{tree_id}' not found; upload the Newick string again")
+    if not newick:
+        if not use_species_tree:
+            raise HTTPException(status_code=400, detail="Newick string or tree_id is required")
+        newick = load_species_tree()
+    try:
+        return tree_cache.put(newick)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid Newick format: {str(e)}")
+
 # --- API Endpoints ---
 
+@router.post("/trees", response_model=Dict[str, Any])
+async def register_tree(data: RegisterTreeRequest):
+    """Parse and cache a tree so later requests can refer to it by tree_id"""
+    return resolve_tree(data.newick).summary()
+
+@router.get("/trees/{tree_id}", response_model=Dict[str, Any])
+async def get_registered_tree(tree_id: str):
+    """Get a cached tree by its ID"""
+    entry = resolve_tree(tree_id=tree_id)
+    return {**entry.summary(), "newick": entry.newick}
+
+@router.get("/cache", response_model=Dict[str, Any])
+async def get_tree_cache_stats():
+    """Get parsed-tree cache statistics"""
+    return tree_cache.stats()
+
+async def register_upload(chunks: AsyncIterator[bytes], filename: Optional[str] = None,
+                          tree_format: Optional[str] = None,
+                          reroot_outgroup: Optional[str] = None) -> Dict[str, Any]:
+    """Parse an uploaded tree file chunk by chunk and cache its trees
+
+    Chunks are parsed as they arrive, so the file is never held in memory
+    as a whole; only the compact arrays of the parsed trees are kept.
+    """
+    reader = None
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if reader is None:
+                reader = TreeStreamReader(tree_format or detect_tree_format(filename, chunk), MAX_UPLOAD_TREES)
+            await run_in_threadpool(reader.feed, chunk)
+        if reader is None:
+            raise HTTPException(status_code=400, detail="Uploaded tree file is empty")
+        await run_in_threadpool(reader.close)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Error parsing tree file: {str(e)}")
+
+    entries = [tree_cache.add(tree_id, tree) for tree_id, tree in zip(reader.tree_ids, reader.trees)]
+    if reroot_outgroup:
+        tree = entries[0].tree.to_ete()
+        try:
+            tree.set_outgroup(tree & reroot_outgroup)
+        except Exception:
+            raise HTTPException(status_code=400, detail=f"Outgroup '{reroot_outgroup}' not found in tree")
+        rerooted = CompactTree.from_ete(tree)
+        entries[0] = tree_cache.put(write_newick(rerooted), rerooted)
+
+    entry = entries[0]
+    result = {
+        "tree_id": entry.tree_id,
+        "tree_ids": [item.tree_id for item in entries],
+        "format": reader.tree_format,
+        "num_trees": reader.num_trees,
+        "bytes_read": reader.num_bytes,
+        "num_leaves": int(entry.tree.is_leaf.sum()),
+        "num_nodes": entry.tree.n_nodes
+    }
+    if entry.tree.n_nodes <= INLINE_TREE_MAX_NODES:
+        result["newick"] = entry.newick
+        result["tree"] = compact_to_dict(entry.tree)
+    return result
+
 @router.post("/upload", response_model=Dict[str, Any])
 async def upload_tree_file(
     file: UploadFile = File(...),
-    reroot_outgroup: Optional[str] = Form(None)
+    reroot_outgroup: Optional[str] = Form(None),
+    tree_format: Optional[str] = Form(None)
 ):
-    """Upload a phylogenetic tree in Newick format"""
-    try:
-        # Read the file content directly
-        content = await file.read()
-        newick_str = content.decode("utf-8").strip()
-        
-        # Validate simple Newick format
-        if not newick_str.endswith(';'):
-            return JSONResponse(
-                status_code=400,
-                content={"detail": "Invalid Newick format: string must end with semicolon (;)"}
-            )
-        
-        # Create a simplified tree structure manually
-        # This is a simplified approach to avoid ETE3 dependency issues
-        try:
-            # Extract leaf names (very simple approach)
-            leaf_names = []
-            for segment in newick_str.replace(';', '').replace('(', '').replace(')', '').split(','):
-                # Extract name before any colon
-                name = segment.split(':')[0].strip()
-                if name:
-                    leaf_names.append(name)
-            
-            # Create a simple tree with just the leaf nodes
-            tree_dict = {
-                "id": "root",
-                "name": "root",
-                "branch_length": 0,
-                "children": [
-                    {"id": name, "name": name, "branch_length": 0.1} 
-                    for name in leaf_names
-                ]
-            }
-            
-            return {
-                "newick": newick_str,
-                "tree": tree_dict,
-                "num_leaves": len(leaf_names),
-                "num_nodes": len(leaf_names) + 1
-            }
-                
-        except Exception as parsing_error:
-            return JSONResponse(
-                status_code=400,
-                content={"detail": f"Error parsing Newick: {str(parsing_error)}"}
-            )
-    except Exception as e:
-        return JSONResponse(
-            status_code=500,
-            content={"detail": f"Error processing tree file: {str(e)}"}
-        )
+    """Upload a phylogenetic tree in Newick, NEXUS or PhyloXML format"""
+    async def read_chunks():
+        while True:
+            chunk = await file.read(DEFAULT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    return await register_upload(read_chunks(), file.filename, tree_format, reroot_outgroup)
+
+@router.post("/upload/stream", response_model=Dict[str, Any])
+async def upload_tree_stream(
+    request: Request,
+    filename: Optional[str] = None,
+    tree_format: Optional[str] = None,
+    reroot_outgroup: Optional[str] = None
+):
+    """Upload a tree file as the raw request body, parsing it while it arrives"""
+    return await register_upload(request.stream(), filename, tree_format, reroot_outgroup)
 
 @router.post("/reroot", response_model=Dict[str, Any])
 async def reroot_tree(data: TreeData):
     """Reroot a tree using the specified outgroup"""
+    entry = resolve_tree(data.newick, data.tree_id)
     try:
-        # Parse the tree from the provided Newick string
-        tree = Tree(data.newick, format=1)
+        # Rebuild a mutable tree from the cached arrays instead of re-parsing
+        tree = entry.tree.to_ete()
         
         # Find the outgroup node
         outgroup_nodes = tree.search_nodes(name=data.outgroup)
@@ -148,48 +260,119 @@ async def reroot_tree(data: TreeData):
         tree.set_outgroup(outgroup)
         
         # Return the rerooted tree
+        compact = CompactTree.from_ete(tree)
+        newick_str = write_newick(compact)
+        rerooted = tree_cache.put(newick_str, compact)
         return {
-            "newick": tree.write(format=1),
-            "tree": newick_to_dict(tree.write(format=1)).dict()
+            "newick": newick_str,
+            "tree_id": rerooted.tree_id,
+            "tree": compact_to_node_data(compact).dict()
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error rerooting tree: {str(e)}")
 
+def resolve_annotations(entry: CachedTree, data: Dict[str, Any],
+                        annotations_key: str = "annotations",
+                        table_key: str = "table_id") -> Dict[str, np.ndarray]:
+    """Join a registered table and/or inline per-name annotations onto a tree"""
+    columns = {}
+    if data.get(table_key):
+        try:
+            table = annotation_tables.get(data[table_key])
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Annotation table '{data[table_key]}' not found; upload it again")
+        joined = get_tree_annotations(entry, table)["columns"]
+        selected = data.get("columns") or list(joined)
+        missing = [column for column in selected if column not in joined]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Columns not found in annotation table: {', '.join(missing)}")
+        columns.update({column: joined[column] for column in selected})
+    if data.get(annotations_key):
+        try:
+            table = AnnotationTable.from_dict(data[annotations_key])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        columns.update(table.join(entry.tree)["columns"])
+    return columns
+
+@router.post("/annotations/tables", response_model=Dict[str, Any])
+async def upload_annotation_table(
+    file: UploadFile = File(...),
+    key_column: Optional[str] = Form(None)
+):
+    """Register a CSV/TSV table of node annotations keyed by node name
+
+    The key column defaults to the first column. Refer to the table by its
+    ``table_id`` in ``/annotate`` and ``/to_taxonium``.
+    """
+    try:
+        table = await run_in_threadpool(AnnotationTable.from_csv, file.file, file.filename, key_column)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return annotation_tables.add(table).summary()
+
+@router.get("/annotations/tables", response_model=List[Dict[str, Any]])
+async def list_annotation_tables():
+    """List the registered annotation tables"""
+    return annotation_tables.list()
+
 @router.post("/annotate", response_model=Dict[str, Any])
 async def annotate_tree(data: Dict[str, Any]):
-    """Annotate a tree with additional data"""
+    """Annotate a tree with additional data
+
+    Annotations come from a registered table (``table_id``, optionally
+    restricted to ``columns``) and/or an inline ``annotations`` dict keyed
+    by node name. They are joined onto all nodes at once and returned as
+    one array per column, in preorder node order.
+    """
+    entry = resolve_tree(data.get("newick"), data.get("tree_id"))
+    columns = resolve_annotations(entry, data)
     try:
-        # Parse the tree from the provided Newick string
-        tree = Tree(data["newick"], format=1)
-        annotations = data.get("annotations", {})
-        
-        # Apply annotations to nodes
-        for node in tree.traverse():
-            node_name = node.name
-            if node_name in annotations:
-                for key, value in annotations[node_name].items():
-                    setattr(node, key, value)
-        
-        # Return the annotated tree
         result = {
-            "newick": tree.write(format=1),
-            "tree": newick_to_dict(tree.write(format=1)).dict()
+            "tree_id": entry.tree_id,
+            "table_id": data.get("table_id"),
+            "num_nodes": entry.tree.n_nodes,
+            "num_annotated": int(annotated_nodes(entry.tree, columns).sum()),
+            "names": entry.tree.names,
+            "annotations": {column: column_to_list(values) for column, values in columns.items()}
         }
+        if entry.tree.n_nodes <= INLINE_TREE_MAX_NODES:
+            result["newick"] = entry.newick
+            result["tree"] = compact_to_node_data(entry.tree).dict()
         
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error annotating tree: {str(e)}")
 
+@router.post("/newick")
+async def export_newick(data: NewickExportRequest):
+    """Stream a tree as Newick, optionally with support labels and NHX tags
+
+    Annotation columns (from a registered table and/or inline annotations)
+    are written as ``[&&NHX:column=value]`` comments on the matching nodes.
+    """
+    if not 1 <= data.precision <= 17:
+        raise HTTPException(status_code=400, detail="precision must be between 1 and 17")
+    entry = resolve_tree(data.newick, data.tree_id)
+    nhx = resolve_annotations(entry, data.dict())
+    return StreamingResponse(
+        iter_newick(entry.tree, data.precision, data.support, nhx),
+        media_type="text/plain",
+        headers={"X-Tree-Id": entry.tree_id}
+    )
+
 @router.post("/compare", response_model=Dict[str, Any])
 async def compare_trees(data: Dict[str, Any]):
     """Compare two trees and identify differences"""
+    entry1 = resolve_tree(data.get("tree1"), data.get("tree1_id"))
+    entry2 = resolve_tree(data.get("tree2"), data.get("tree2_id"))
+    index = resolve_collection(data["collection_id"]) if data.get("collection_id") else None
     try:
-        tree1 = Tree(data["tree1"], format=1)
-        tree2 = Tree(data["tree2"], format=1)
-        
         # Get the set of leaf names in each tree
-        leaves1 = {leaf.name for leaf in tree1.get_leaves()}
-        leaves2 = {leaf.name for leaf in tree2.get_leaves()}
+        leaves1 = {entry1.tree.names[i] for i in np.flatnonzero(entry1.tree.is_leaf)}
+        leaves2 = {entry2.tree.names[i] for i in np.flatnonzero(entry2.tree.is_leaf)}
         
         # Find leaves that are in one tree but not the other
         unique_to_tree1 = leaves1 - leaves2
@@ -198,13 +381,29 @@ async def compare_trees(data: Dict[str, Any]):
         # Common leaves between both trees
         common_leaves = leaves1 & leaves2
         
-        return {
+        result = {
             "unique_to_tree1": list(unique_to_tree1),
             "unique_to_tree2": list(unique_to_tree2),
             "common_leaves": list(common_leaves),
             "tree1_leaf_count": len(leaves1),
-            "tree2_leaf_count": len(leaves2)
+            "tree2_leaf_count": len(leaves2),
+            "tree1_id": entry1.tree_id,
+            "tree2_id": entry2.tree_id
         }
+        
+        # Robinson-Foulds distance over the common leaves, reusing the split
+        # keys of an indexed collection when both trees belong to it
+        if index is not None and entry1.tree_id in index.tree_ids and entry2.tree_id in index.tree_ids:
+            result.update(compare_splits(index.tree_keys(index.position(entry1.tree_id)),
+                                         index.tree_keys(index.position(entry2.tree_id)),
+                                         index.n_leaves))
+        elif len(common_leaves) >= 4:
+            tree1, tree2 = entry1.tree, entry2.tree
+            if unique_to_tree1 or unique_to_tree2:
+                tree1 = induced_subtree(entry1.lca, sorted(common_leaves))
+                tree2 = induced_subtree(entry2.lca, sorted(common_leaves))
+            result.update(compare_tree_splits(tree1, tree2))
+        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error comparing trees: {str(e)}")
 
@@ -281,62 +480,399 @@ async def get_example_tree():
 
 @router.post("/to_taxonium", response_model=Dict[str, Any])
 async def convert_to_taxonium(data: Dict[str, Any]):
-    """Convert a Newick tree to Taxonium-compatible format"""
+    """Convert a Newick tree to Taxonium-compatible format
+
+    Pass ``layouts`` (``rectangular`` and/or ``radial``) to include
+    precomputed node coordinates, ``annotation_table_id`` to add the
+    columns of a registered annotation table as node metadata, and
+    ``encoding`` (``columnar`` or ``binary``) for a compact payload instead
+    of one object per node.
+    """
     try:
-        newick_str = data.get("newick")
-        if not newick_str:
-            raise HTTPException(status_code=400, detail="Newick string is required")
-        
-        # Parse the tree using ETE3
-        tree = Tree(newick_str, format=1)
-        
-        # Convert to Taxonium format
-        taxonium_data = {
-            "nodes": [],
-            "metadata": {
-                "colorings": [
-                    {
-                        "name": "orthologueCount",
-                        "type": "continuous"
-                    }
-                ]
-            }
-        }
+        layouts = validate_layout_types(data.get("layouts"))
+        encoding = validate_encoding(data.get("encoding"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    entry = resolve_tree(data.get("newick"), data.get("tree_id"))
+    # Join annotation tables and any per-name metadata from the request
+    annotations = resolve_annotations(entry, data, "node_metadata", "annotation_table_id")
+    try:
+        # Node fields come straight from the preorder arrays of the tree
+        tree = entry.tree
+        columns, metadata_columns = tree_columns(tree)
+        metadata_columns.update(annotations)
         
-        # Add node data in Taxonium format
-        node_id = 0
-        node_map = {}  # Map to keep track of node ids
+        # Add precomputed coordinates
+        if layouts:
+            layout = get_tree_layout(entry, data.get("use_branch_lengths", True))
+            columns.update(layout_columns(layout, layouts))
         
-        # Traverse the tree and build the nodes
-        for node in tree.traverse("preorder"):
-            # Create current node
-            current_id = node_id
-            node_id += 1
-            node_map[node] = current_id
-            
-            # Get parent id if it exists
-            parent_id = None
-            if node.up and node.up in node_map:
-                parent_id = node_map[node.up]
-            
-            # Add node to Taxonium data
-            taxonium_data["nodes"].append({
-                "id": current_id,
-                "parentId": parent_id,
-                "name": node.name or "",
-                "branch_length": node.dist,
-                "metadata": {
-                    "support": getattr(node, "support", None)
+        metadata = {
+            "colorings": [
+                {
+                    "name": "orthologueCount",
+                    "type": "continuous"
                 }
-            })
-        
-        # Add any additional metadata from the request
-        node_metadata = data.get("node_metadata", {})
-        for node_data in taxonium_data["nodes"]:
-            node_name = node_data["name"]
-            if node_name in node_metadata:
-                node_data["metadata"].update(node_metadata[node_name])
-        
+            ],
+            "tree_id": entry.tree_id
+        }
+        taxonium_data = encode_taxonium(columns, metadata_columns, metadata, encoding)
+        if encoding == "binary":
+            return Response(content=taxonium_data, media_type=BINARY_MEDIA_TYPE,
+                            headers={"X-Tree-Id": entry.tree_id})
         return taxonium_data
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error converting to Taxonium format: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error converting to Taxonium format: {str(e)}")
+
+@router.post("/mrca", response_model=Dict[str, Any])
+async def find_mrca(data: MRCARequest):
+    """Find the most recent common ancestor of a set of leaves
+
+    Uses the cached LCA index of the tree (the species tree when no Newick
+    string is given), so each pairwise query is O(1).
+    """
+    if not data.leaves and not data.pairs:
+        raise HTTPException(status_code=400, detail="Provide leaves or pairs to query")
+    if any(len(pair) != 2 for pair in data.pairs):
+        raise HTTPException(status_code=400, detail="Each pair must contain exactly two node names")
+
+    entry = resolve_tree(data.newick, data.tree_id, use_species_tree=True)
+    index = entry.lca
+    try:
+        result = {"tree_id": entry.tree_id}
+        if data.leaves:
+            result["mrca"] = index.mrca(data.leaves)
+
+        if data.pairs:
+            tree = index.tree
+            first = tree.leaf_indices([pair[0] for pair in data.pairs])
+            second = tree.leaf_indices([pair[1] for pair in data.pairs])
+            ancestors = index.lca_many(first, second)
+            result["pairs"] = [
+                {
+                    "pair": pair,
+                    "node_id": int(node),
+                    "name": tree.names[node],
+                    "depth": int(tree.depth[node])
+                }
+                for pair, node in zip(data.pairs, ancestors)
+            ]
+
+        return result
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+@router.post("/prune", response_model=Dict[str, Any])
+async def prune_tree(data: PruneRequest):
+    """Restrict a tree to the given leaves, collapsing unary nodes"""
+    if not data.leaves:
+        raise HTTPException(status_code=400, detail="At least one leaf is required")
+
+    entry = resolve_tree(data.newick, data.tree_id, use_species_tree=True)
+    try:
+        pruned = induced_subtree(entry.lca, data.leaves)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+    newick_str = write_newick(pruned)
+    return {
+        "newick": newick_str,
+        "tree_id": tree_cache.put(newick_str, pruned).tree_id,
+        "num_leaves": int(pruned.is_leaf.sum()),
+        "num_nodes": pruned.n_nodes
+    }
+
+@router.post("/lod", response_model=Dict[str, Any])
+async def get_tree_level_of_detail(data: LODRequest):
+    """Get the Taxonium nodes visible at a zoom level and viewport
+
+    Clades that do not fit the zoom level's node budget are returned as
+    collapsed summary nodes, so the payload stays bounded for any tree size.
+    """
+    if data.max_nodes is not None and data.max_nodes < 1:
+        raise HTTPException(status_code=400, detail="max_nodes must be positive")
+    try:
+        encoding = validate_encoding(data.encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    entry = resolve_tree(data.newick, data.tree_id, use_species_tree=True)
+    result = get_tree_lod(entry).to_taxonium(data.zoom, data.y_min, data.y_max, data.max_nodes, data.node_metadata)
+    result["metadata"]["tree_id"] = entry.tree_id
+    if encoding == "rows":
+        return result
+
+    columns, metadata_columns = nodes_to_columns(result["nodes"])
+    payload = encode_taxonium(columns, metadata_columns, result["metadata"], encoding)
+    if encoding == "binary":
+        return Response(content=payload, media_type=BINARY_MEDIA_TYPE, headers={"X-Tree-Id": entry.tree_id})
+    return payload
+
+@router.post("/patristic")
+async def get_patristic_distances(data: PatristicRequest):
+    """Get the leaf x leaf patristic distance matrix of a tree
+
+    Defaults to the species tree. With ``format="binary"`` the matrix is
+    returned as gzip-compressed little-endian float32 values in row-major
+    order, in the leaf order listed by the JSON response. Trees with more
+    than MAX_PATRISTIC_LEAVES leaves need a ``leaves`` selection of at
+    most that size.
+    """
+    if data.format not in ("json", "binary"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'binary'")
+    if data.leaves and len(data.leaves) > MAX_PATRISTIC_LEAVES:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {MAX_PATRISTIC_LEAVES} leaves can be compared at once")
+    
+    entry = resolve_tree(data.newick, data.tree_id, use_species_tree=True)
+    tree = entry.tree
+    leaves = np.flatnonzero(tree.is_leaf)
+    if not data.leaves and len(leaves) > MAX_PATRISTIC_LEAVES:
+        raise HTTPException(status_code=400, detail=(
+            f"The tree has {len(leaves)} leaves; select at most {MAX_PATRISTIC_LEAVES} with 'leaves'"))
+    
+    if data.leaves:
+        try:
+            selected = tree.leaf_indices(data.leaves)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=str(e.args[0]))
+        positions = np.searchsorted(leaves, selected)
+        if np.any(leaves[np.minimum(positions, len(leaves) - 1)] != selected):
+            raise HTTPException(status_code=400, detail="Patristic distances are only available between leaves")
+        if len(leaves) <= MAX_PATRISTIC_LEAVES:
+            matrix = get_patristic_matrix(entry)[np.ix_(positions, positions)]
+        else:
+            # Only the selected rows and columns of a large tree
+            matrix = await run_in_threadpool(patristic_distances, entry.lca, selected)
+        leaves = selected
+    else:
+        matrix = get_patristic_matrix(entry)
+    
+    if data.format == "binary":
+        return Response(
+            content=gzip.compress(matrix.astype("<f4").tobytes()),
+            media_type="application/octet-stream",
+            headers={
+                "Content-Encoding": "gzip",
+                "X-Tree-Id": entry.tree_id,
+                "X-Matrix-Shape": f"{matrix.shape[0]},{matrix.shape[1]}"
+            }
+        )
+    
+    return {
+        "tree_id": entry.tree_id,
+        "leaves": [tree.names[leaf] for leaf in leaves],
+        # Values are stored as float32; round away the widening noise
+        "matrix": np.round(matrix.astype(np.float64), 6).tolist()
+    }
+
+def consensus_response(counter: BipartitionCounter, method: str, threshold: Optional[float],
+                       encoding: str) -> Dict[str, Any]:
+    """Build a consensus tree, cache it and describe it"""
+    try:
+        tree = build_consensus(counter, method, threshold)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Label internal nodes with their support values
+    newick_str = write_newick(tree, support=True)
+    entry = tree_cache.put(newick_str, tree)
+    
+    metadata = {
+        "colorings": [
+            {
+                "name": "support",
+                "type": "continuous"
+            }
+        ],
+        "tree_id": entry.tree_id
+    }
+    return {
+        "tree_id": entry.tree_id,
+        "method": method,
+        "threshold": consensus_threshold(method, threshold),
+        "num_trees": counter.num_trees,
+        "num_leaves": counter.n_leaves,
+        "num_splits": int((~tree.is_leaf).sum()) - 1,
+        "newick": newick_str,
+        "tree": compact_to_node_data(tree).dict(),
+        "taxonium_tree": encode_taxonium(*tree_columns(tree), metadata, encoding)
+    }
+
+def collect_trees(newicks: List[str], tree_ids: List[str]) -> Dict[str, List[Any]]:
+    """Gather cached trees by ID and parse Newick strings (each may hold
+    several ``;``-terminated trees) into one collection"""
+    trees = [resolve_tree(tree_id=tree_id).tree for tree_id in tree_ids]
+    ids = list(tree_ids)
+    try:
+        for newick_str in newicks:
+            parser = NewickStreamParser()
+            parser.feed(newick_str)
+            trees.extend(parser.close())
+            ids.extend(parser.tree_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid Newick format: {str(e)}")
+    if not trees:
+        raise HTTPException(status_code=400, detail="Provide newicks or tree_ids")
+    return {"trees": trees, "tree_ids": ids}
+
+async def count_uploaded_trees(file: UploadFile, tree_format: Optional[str],
+                               counter_class=BipartitionCounter) -> BipartitionCounter:
+    """Count the splits of every tree in an uploaded file while it is parsed
+
+    Trees are handed to the counter chunk by chunk, so bootstrap or
+    posterior samples of any length are never held in memory together.
+    """
+    reader = None
+    counter = None
+
+    async def count(trees: List[CompactTree]) -> None:
+        nonlocal counter
+        if trees:
+            if counter is None:
+                counter = counter_class(leaf_bit_order(trees[0]))
+            await run_in_threadpool(counter.add_all, trees)
+
+    try:
+        while True:
+            chunk = await file.read(DEFAULT_CHUNK_SIZE)
+            if not chunk:
+                break
+            if reader is None:
+                reader = TreeStreamReader(tree_format or detect_tree_format(file.filename, chunk))
+            await run_in_threadpool(reader.feed, chunk)
+            await count(reader.drain())
+        if reader is None:
+            raise ValueError("Uploaded tree file is empty")
+        await run_in_threadpool(reader.close)
+        await count(reader.drain())
+    finally:
+        if counter is not None:
+            counter.close()
+    if isinstance(counter, CladeIndex):
+        counter.set_tree_ids(reader.tree_ids)
+    return counter
+
+def resolve_collection(collection_id: str) -> CladeIndex:
+    """Look up an indexed tree collection"""
+    try:
+        return clade_indexes.get(collection_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Tree collection '{collection_id}' not found; index the trees again")
+
+@router.post("/consensus", response_model=Dict[str, Any])
+async def build_consensus_tree(data: ConsensusRequest):
+    """Build a majority-rule or strict consensus of a tree collection
+
+    Trees are given as an indexed ``collection_id``, or as cached
+    ``tree_ids`` and/or Newick strings, and must share the same leaves.
+    Internal nodes carry the fraction of input trees containing their split.
+    """
+    try:
+        consensus_threshold(data.method, data.threshold)
+        encoding = validate_encoding(data.encoding, ("rows", "columnar"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if data.collection_id:
+        return consensus_response(resolve_collection(data.collection_id), data.method, data.threshold, encoding)
+    
+    trees = collect_trees(data.newicks, data.tree_ids)["trees"]
+    try:
+        counter = BipartitionCounter(leaf_bit_order(trees[0]))
+        try:
+            await run_in_threadpool(counter.add_all, trees)
+        finally:
+            counter.close()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return consensus_response(counter, data.method, data.threshold, encoding)
+
+@router.post("/consensus/upload", response_model=Dict[str, Any])
+async def build_consensus_from_file(
+    file: UploadFile = File(...),
+    method: str = Form("majority"),
+    threshold: Optional[float] = Form(None),
+    tree_format: Optional[str] = Form(None),
+    encoding: str = Form("rows")
+):
+    """Build a consensus of every tree in an uploaded Newick/NEXUS/PhyloXML file"""
+    try:
+        consensus_threshold(method, threshold)
+        encoding = validate_encoding(encoding, ("rows", "columnar"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        counter = await count_uploaded_trees(file, tree_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Error building consensus: {str(e)}")
+    
+    return consensus_response(counter, method, threshold, encoding)
+
+@router.post("/collections", response_model=Dict[str, Any])
+async def index_tree_collection(data: TreeCollectionRequest):
+    """Index a collection of trees by their clades for support queries
+
+    The returned ``collection_id`` can be queried with
+    ``/collections/{collection_id}/clades`` and passed to ``/consensus``
+    and ``/compare`` without re-sending or re-parsing the trees.
+    """
+    collected = collect_trees(data.newicks, data.tree_ids)
+    try:
+        index = CladeIndex(leaf_bit_order(collected["trees"][0]))
+        try:
+            await run_in_threadpool(index.add_trees, collected["trees"], collected["tree_ids"])
+        finally:
+            index.close()
+        await run_in_threadpool(index.counts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return clade_indexes.add(index).summary()
+
+@router.post("/collections/upload", response_model=Dict[str, Any])
+async def index_tree_collection_file(
+    file: UploadFile = File(...),
+    tree_format: Optional[str] = Form(None)
+):
+    """Index every tree of an uploaded Newick/NEXUS/PhyloXML file by its clades"""
+    try:
+        index = await count_uploaded_trees(file, tree_format, CladeIndex)
+        await run_in_threadpool(index.counts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Error indexing tree file: {str(e)}")
+    
+    return clade_indexes.add(index).summary()
+
+@router.get("/collections", response_model=List[Dict[str, Any]])
+async def list_tree_collections():
+    """List the indexed tree collections"""
+    return clade_indexes.list()
+
+@router.get("/collections/{collection_id}", response_model=Dict[str, Any])
+async def get_tree_collection(collection_id: str):
+    """Describe an indexed tree collection"""
+    index = resolve_collection(collection_id)
+    result = index.summary()
+    result["tree_ids"] = index.tree_ids
+    return result
+
+@router.post("/collections/{collection_id}/clades", response_model=Dict[str, Any])
+async def query_clade_support(collection_id: str, data: CladeQueryRequest):
+    """Count the trees of a collection containing each clade
+
+    A clade is a list of leaf names; since splits are unrooted, a clade and
+    its complement are the same query.
+    """
+    index = resolve_collection(collection_id)
+    try:
+        results = [index.query(leaves, data.include_tree_ids) for leaves in data.clades]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "collection_id": collection_id,
+        "num_trees": index.num_trees,
+        "clades": results
+    }
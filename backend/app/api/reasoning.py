@@ -0,0 +1,75 @@
+from fastapi import APIRouter, HTTPException
+from typing import Dict, Any, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from ..models.schemas import SubsumptionIndexRequest, TripleUpdateRequest
+from ..services.subsumption_index import SubsumptionIndex, subsumption_indexes
+
+router = APIRouter(prefix="/api/reasoning", tags=["reasoning"])
+
+
+def _get_index(index_id: str) -> SubsumptionIndex:
+    try:
+        return subsumption_indexes.get(index_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Subsumption index {index_id} not found")
+
+
+@router.post("/indexes")
+async def create_index(request: SubsumptionIndexRequest) -> Dict[str, Any]:
+    """Materialise the subsumption closure of a dataset's hierarchy"""
+    if not request.relations:
+        raise HTTPException(status_code=400, detail="At least one hierarchy relation is required")
+    try:
+        index = await run_in_threadpool(SubsumptionIndex.from_data, request.data, request.relations)
+    except (KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid dataset: {e}")
+    return {"index_id": subsumption_indexes.add(index), **index.summary()}
+
+
+@router.get("/indexes")
+async def list_indexes() -> List[Dict[str, Any]]:
+    """List the registered subsumption indexes"""
+    return subsumption_indexes.list()
+
+
+@router.get("/indexes/{index_id}/is_ancestor")
+async def is_ancestor(index_id: str, ancestor: str, descendant: str) -> Dict[str, Any]:
+    """Whether ``ancestor`` subsumes ``descendant``"""
+    index = _get_index(index_id)
+    return {"ancestor": ancestor, "descendant": descendant, "is_ancestor": index.is_ancestor(ancestor, descendant)}
+
+
+@router.get("/indexes/{index_id}/descendants")
+async def get_descendants(index_id: str, node: str, limit: Optional[int] = None) -> Dict[str, Any]:
+    """All (or the first ``limit``) subclasses of a node"""
+    index = _get_index(index_id)
+    if limit is not None and limit < 0:
+        raise HTTPException(status_code=400, detail="limit must not be negative")
+    try:
+        return {"node": node, "count": index.descendant_count(node), "descendants": index.descendants(node, limit)}
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Node {node} not found in the hierarchy")
+
+
+@router.get("/indexes/{index_id}/ancestors")
+async def get_ancestors(index_id: str, node: str) -> Dict[str, Any]:
+    """All superclasses of a node"""
+    index = _get_index(index_id)
+    try:
+        return {"node": node, "ancestors": index.ancestors(node)}
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Node {node} not found in the hierarchy")
+
+
+@router.post("/indexes/{index_id}/triples")
+async def update_triples(index_id: str, request: TripleUpdateRequest) -> Dict[str, Any]:
+    """Add and remove hierarchy triples, keeping the closure up to date;
+    triples that would close a cycle are rejected"""
+    index = _get_index(index_id)
+    try:
+        changes = await run_in_threadpool(index.update, request.add, request.remove)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Triples need a source and a target: missing {e}")
+    return {**changes, **index.summary()}
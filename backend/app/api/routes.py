@@ -7,6 +7,7 @@ import os
 from ..services.data_ingestion import DataIngestionService
 from ..services.semantic_reasoning import SemanticReasoningService
 from ..services.visualization import VisualizationService
+from ..services.analysis_cache import analysis_results
 from ..models.schemas import ProcessedDataResponse, AnalysisRequest, VisualizationRequest
 from .biological_routes import router as biological_router
 from .phylo import router as phylo_router
@@ -66,7 +67,10 @@ async def analyze_data(
 ):
     """Analyze biological data using semantic reasoning"""
     try:
-        result = reasoning_service.analyze(request.data, request.parameters)
+        result, _ = analysis_results.get_or_compute(
+            request.data, request.parameters,
+            lambda: reasoning_service.analyze(request.data, request.parameters)
+        )
         return result
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Analysis error: {str(e)}")
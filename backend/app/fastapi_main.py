@@ -17,6 +17,11 @@ try:
     )
     from .api.phylo import router as phylo_router
     from .api.orthologue import router as orthologue_router
+    from .api.jobs import router as jobs_router
+    from .api.go import router as go_router
+    from .api.reasoning import router as reasoning_router
+    from .services.semantic_reasoning import SemanticReasoningService
+    from .services.analysis_cache import analysis_results
 except ImportError:
     # For direct module execution
     from app.models.biological_models import (
@@ -26,6 +31,11 @@ except ImportError:
     )
     from app.api.phylo import router as phylo_router
     from app.api.orthologue import router as orthologue_router
+    from app.api.jobs import router as jobs_router
+    from app.api.go import router as go_router
+    from app.api.reasoning import router as reasoning_router
+    from app.services.semantic_reasoning import SemanticReasoningService
+    from app.services.analysis_cache import analysis_results
 
 # Create FastAPI app
 app = FastAPI(
@@ -512,47 +522,57 @@ async def visualize(data: Dict[str, Any]):
     
     return visualization_data
 
-# Analysis endpoint
+# Helper function to load an uploaded dataset
+def load_dataset(data_id: str) -> Optional[Dict[str, Any]]:
+    file_path = os.path.join(UPLOAD_FOLDER, f"{os.path.basename(data_id)}_data.json")
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+# Analysis endpoint (a plain function, so analyses run in the threadpool)
 @app.post("/analyze")
 @app.post("/api/analyze")
-async def analyze(data: Dict[str, Any]):
-    """Analyze the uploaded data"""
+def analyze(data: Dict[str, Any]):
+    """Analyze an uploaded dataset (or one sent as "data")
+
+    Results are cached by dataset content, analysis type and parameters,
+    so repeated views of the same analysis are served from the cache.
+    """
     # Extract data from the request
     data_id = data.get('dataId')
     analysis_type = data.get('analysisType', 'basic')
+    parameters = dict(data.get('parameters') or {}, analysis_type=analysis_type)
     
-    # For demo purposes, return dummy analysis data
-    analysis_results = {
-        "id": data_id,
-        "type": analysis_type,
-        "results": {
-            "summary": {
-                "totalEntities": 25,
-                "totalRelations": 40,
-                "uniqueEntityTypes": 5,
-                "uniqueRelationTypes": 8
-            },
-            "metrics": {
-                "density": 0.75,
-                "centrality": {
-                    "node1": 0.8,
-                    "node2": 0.6,
-                    "node3": 0.4
-                },
-                "clustering": 0.65
-            },
-            "patterns": [
-                {"name": "Pattern 1", "frequency": 5, "significance": 0.8},
-                {"name": "Pattern 2", "frequency": 3, "significance": 0.6}
-            ]
-        }
-    }
+    dataset = data.get('data')
+    if dataset is not None:
+        # Inline datasets have no ID to track changes under
+        data_id = None
+    else:
+        if not data_id:
+            return JSONResponse(content={"error": "No dataId or data provided"}, status_code=400)
+        dataset = load_dataset(data_id)
+        if dataset is None:
+            return JSONResponse(content={"error": f"Dataset not found: {data_id}"}, status_code=404)
+    
+    try:
+        results, _ = analysis_results.get_or_compute(
+            dataset, parameters,
+            lambda: SemanticReasoningService().analyze(dataset, parameters),
+            dataset_id=data_id
+        )
+    except (ValueError, KeyError) as e:
+        return JSONResponse(content={"error": f"Analysis error: {str(e)}"}, status_code=400)
     
-    return analysis_results
+    return results
 
 # Include routers
 app.include_router(phylo_router)
 app.include_router(orthologue_router)
+app.include_router(jobs_router)
+app.include_router(go_router)
+app.include_router(reasoning_router)
 
 # Run the app with uvicorn if this file is executed directly
 if __name__ == "__main__":
@@ -30,9 +30,74 @@ PhyloNodeData.model_rebuild()
 
 class TreeData(BaseModel):
     """Model for tree data"""
-    newick: str
+    newick: Optional[str] = None
+    tree_id: Optional[str] = None
     outgroup: Optional[str] = None
 
+class RegisterTreeRequest(BaseModel):
+    """Request model for caching a tree under its content hash"""
+    newick: str
+
+class ConsensusRequest(BaseModel):
+    """Request model for consensus trees of a tree collection"""
+    newicks: List[str] = []
+    tree_ids: List[str] = []
+    collection_id: Optional[str] = None
+    method: str = "majority"
+    threshold: Optional[float] = None
+    encoding: str = "rows"
+
+class TreeCollectionRequest(BaseModel):
+    """Request model for indexing a collection of trees by their clades"""
+    newicks: List[str] = []
+    tree_ids: List[str] = []
+
+class CladeQueryRequest(BaseModel):
+    """Request model for clade support queries against a tree collection"""
+    clades: List[List[str]]
+    include_tree_ids: bool = True
+
+class MRCARequest(BaseModel):
+    """Request model for most recent common ancestor queries"""
+    newick: Optional[str] = None
+    tree_id: Optional[str] = None
+    leaves: List[str] = []
+    pairs: List[List[str]] = []
+
+class LODRequest(BaseModel):
+    """Request model for level-of-detail tree views"""
+    newick: Optional[str] = None
+    tree_id: Optional[str] = None
+    zoom: int = 0
+    y_min: Optional[float] = None
+    y_max: Optional[float] = None
+    max_nodes: Optional[int] = None
+    node_metadata: Dict[str, Dict[str, Any]] = {}
+    encoding: str = "rows"
+
+class PatristicRequest(BaseModel):
+    """Request model for patristic distance matrices"""
+    newick: Optional[str] = None
+    tree_id: Optional[str] = None
+    leaves: Optional[List[str]] = None
+    format: str = "json"
+
+class NewickExportRequest(BaseModel):
+    """Request model for Newick export with optional NHX annotations"""
+    newick: Optional[str] = None
+    tree_id: Optional[str] = None
+    precision: int = 6
+    support: bool = False
+    table_id: Optional[str] = None
+    columns: Optional[List[str]] = None
+    annotations: Dict[str, Dict[str, Any]] = {}
+
+class PruneRequest(BaseModel):
+    """Request model for restricting a tree to a subset of leaves"""
+    newick: Optional[str] = None
+    tree_id: Optional[str] = None
+    leaves: List[str]
+
 def newick_to_dict(newick_str: str) -> PhyloNodeData:
     """Convert Newick string to dictionary representation"""
     try:
@@ -93,6 +158,9 @@ class PhyloTree(BaseModel):
 class OrthologueSearchRequest(BaseModel):
     """Request model for orthologue search"""
     gene_id: str
+    prune_tree: bool = False
+    layouts: List[str] = []
+    encoding: str = "rows"
     
 class OrthologueData(BaseModel):
     """Model for orthologue data"""
@@ -14,6 +14,47 @@ class AnalysisRequest(BaseModel):
     data: Dict[str, Any]
     parameters: Dict[str, Any] = Field(default_factory=dict)
 
+class AnalysisJobRequest(AnalysisRequest):
+    """Request model for a background analysis job"""
+    timeout: Optional[float] = None
+
+class GOntologyRequest(BaseModel):
+    """Request model for loading GO from an ingested OWL/RDF dataset"""
+    data: Dict[str, Any]
+
+class GOSimilarityRequest(BaseModel):
+    """Request model for GO semantic similarity of genes or orthogroups"""
+    ontology_id: str
+    annotations: Dict[str, List[str]]
+    groups: Optional[Dict[str, List[str]]] = None
+    measure: str = "resnik"
+    ic_source: str = "annotation"
+    namespace: Optional[str] = None
+    pairs: Optional[List[List[str]]] = None
+    top_k: int = 10
+    matrix: bool = False
+
+class GOEnrichmentRequest(BaseModel):
+    """Request model for GO enrichment of a gene list or orthogroups"""
+    ontology_id: str
+    species: Optional[str] = None
+    annotations: Optional[Dict[str, List[str]]] = None
+    genes: Optional[List[str]] = None
+    orthogroup_ids: Optional[List[str]] = None
+    fdr: Optional[float] = 0.05
+    min_count: int = 2
+    namespace: Optional[str] = None
+
+class SubsumptionIndexRequest(BaseModel):
+    """Request model for indexing the class hierarchy of a dataset"""
+    data: Dict[str, Any]
+    relations: List[str] = Field(default_factory=lambda: ["subClassOf", "partOf", "part_of"])
+
+class TripleUpdateRequest(BaseModel):
+    """Request model for adding and removing hierarchy triples"""
+    add: List[Dict[str, Any]] = Field(default_factory=list)
+    remove: List[Dict[str, Any]] = Field(default_factory=list)
+
 class VisualizationRequest(BaseModel):
     """Request model for visualization generation"""
     data: Dict[str, Any]
@@ -0,0 +1,280 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional, Tuple
+
+import numpy as np
+
+# Default memory budget of cached analysis results (64 MB of JSON)
+DEFAULT_ANALYSIS_CACHE_BYTES = 64 * 1024 * 1024
+
+# Default budget of the on-disk store (1 GB)
+DEFAULT_ANALYSIS_DISK_BYTES = 1024 * 1024 * 1024
+
+DEFAULT_ANALYSIS_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "analysis_cache")
+
+# Parameters that change how a result is computed but not the result itself
+IGNORED_PARAMETERS = {"processes"}
+
+# Dataset ID -> content hash index kept next to the cached results
+DATASET_INDEX = "datasets.json"
+
+AnalysisKey = Tuple[str, str]
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _canonical_json(value: Any) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def dataset_hash(data: Dict[str, Any]) -> str:
+    """Content address of a dataset's nodes and edges
+
+    Any change to a node, an edge or their attributes gives a new hash, so
+    results cached for the old content are never returned for the new one.
+    """
+    return hashlib.sha1(_canonical_json({"nodes": data.get("nodes", []), "edges": data.get("edges", [])})).hexdigest()
+
+
+def _normalize_value(value: Any) -> Any:
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {str(key): _normalize_value(item) for key, item in value.items() if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize_value(item) for item in value]
+    return value
+
+
+def normalize_parameters(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """Canonical analysis parameters: unset (None) values and
+    IGNORED_PARAMETERS dropped, integral floats written as integers and
+    the analysis type defaulted to "basic" as in ``analyze``"""
+    normalized = {key: _normalize_value(value) for key, value in parameters.items()
+                  if value is not None and key not in IGNORED_PARAMETERS}
+    normalized.setdefault("analysis_type", "basic")
+    return normalized
+
+
+def analysis_key(data: Dict[str, Any], parameters: Dict[str, Any]) -> AnalysisKey:
+    """Cache key of an analysis: dataset content hash and parameter hash"""
+    return dataset_hash(data), hashlib.sha1(_canonical_json(normalize_parameters(parameters))).hexdigest()
+
+
+class AnalysisResultCache:
+    """LRU cache of analysis results backed by an on-disk store
+
+    Results live in memory up to ``max_bytes`` of serialised JSON and are
+    written through to ``directory`` as ``<dataset hash>/<parameter
+    hash>.json``, so they survive restarts and memory eviction. The disk
+    store drops its least recently used files beyond ``max_disk_bytes``.
+    Datasets registered under an ID have the results of their previous
+    content removed when that content changes. Without a directory the
+    cache is memory-only.
+    """
+
+    def __init__(self, directory: Optional[str] = DEFAULT_ANALYSIS_CACHE_DIR,
+                 max_bytes: int = DEFAULT_ANALYSIS_CACHE_BYTES,
+                 max_disk_bytes: int = DEFAULT_ANALYSIS_DISK_BYTES):
+        self.directory = directory or None
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.total_bytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[AnalysisKey, Tuple[Any, int]]" = OrderedDict()
+        self._datasets: Dict[str, str] = {}
+        self._lock = threading.RLock()
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load()
+
+    def _path(self, key: AnalysisKey) -> str:
+        return os.path.join(self.directory, key[0], key[1] + ".json")
+
+    def _result_files(self):
+        for dataset_entry in os.scandir(self.directory):
+            if dataset_entry.is_dir():
+                for entry in os.scandir(dataset_entry.path):
+                    if entry.name.endswith(".json"):
+                        yield entry
+
+    def _load(self) -> None:
+        """Measure the disk store and read the dataset index"""
+        self.disk_bytes = sum(entry.stat().st_size for entry in self._result_files())
+        try:
+            with open(os.path.join(self.directory, DATASET_INDEX)) as f:
+                self._datasets = json.load(f)
+        except (OSError, ValueError):
+            self._datasets = {}
+
+    def get(self, key: AnalysisKey) -> Optional[Any]:
+        """Cached result of an analysis, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    payload = f.read()
+                os.utime(path)
+            except OSError:
+                pass
+            else:
+                result = json.loads(payload)
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, result, len(payload))
+                return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: AnalysisKey, result: Any) -> None:
+        """Cache a result in memory and write it to the disk store"""
+        payload = json.dumps(result, separators=(",", ":"), default=_json_default).encode("utf-8")
+        with self._lock:
+            self._remember(key, result, len(payload))
+
+        if self.directory is not None:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so readers never see a partial file
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(payload)
+            os.replace(temporary, path)
+            with self._lock:
+                self.disk_bytes += len(payload)
+                if self.disk_bytes > self.max_disk_bytes:
+                    self._prune_disk()
+
+    def get_or_compute(self, data: Dict[str, Any], parameters: Dict[str, Any],
+                       compute: Callable[[], Any], dataset_id: Optional[str] = None) -> Tuple[Any, bool]:
+        """Return the cached result of an analysis, computing it on a miss,
+        and whether it came from the cache. Errors are not cached."""
+        key = analysis_key(data, parameters)
+        if dataset_id is not None:
+            self.track_dataset(dataset_id, key[0])
+        result = self.get(key)
+        if result is not None:
+            return result, True
+        result = compute()
+        self.put(key, result)
+        return result, False
+
+    def track_dataset(self, dataset_id: str, content_hash: str) -> None:
+        """Record a dataset's current content, dropping the results of its
+        previous content unless another dataset still has it"""
+        with self._lock:
+            previous = self._datasets.get(dataset_id)
+            if previous == content_hash:
+                return
+            self._datasets[dataset_id] = content_hash
+            stale = previous is not None and previous not in self._datasets.values()
+            self._save_index()
+        if stale:
+            self.invalidate(previous)
+
+    def invalidate(self, content_hash: str) -> None:
+        """Remove every cached result of a dataset content hash"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == content_hash]:
+                self.total_bytes -= self._entries.pop(key)[1]
+            if self.directory is not None:
+                dataset_dir = os.path.join(self.directory, content_hash)
+                if os.path.isdir(dataset_dir):
+                    self.disk_bytes -= sum(entry.stat().st_size for entry in os.scandir(dataset_dir)
+                                           if entry.name.endswith(".json"))
+                    shutil.rmtree(dataset_dir, ignore_errors=True)
+
+    def _remember(self, key: AnalysisKey, result: Any, nbytes: int) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= previous[1]
+        self._entries[key] = (result, nbytes)
+        self.total_bytes += nbytes
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_bytes) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_bytes
+
+    def _prune_disk(self) -> None:
+        """Delete the least recently used result files until the disk
+        store is within budget"""
+        files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                        for entry in self._result_files()))
+        self.disk_bytes = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.disk_bytes -= size
+            dataset_dir = os.path.dirname(path)
+            if not os.listdir(dataset_dir):
+                os.rmdir(dataset_dir)
+
+    def _save_index(self) -> None:
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, DATASET_INDEX)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(self._datasets, f)
+        os.replace(temporary, path)
+
+    def clear(self) -> None:
+        """Remove every cached result, in memory and on disk"""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+            self._datasets = {}
+            if self.directory is not None:
+                shutil.rmtree(self.directory, ignore_errors=True)
+                os.makedirs(self.directory, exist_ok=True)
+                self.disk_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache occupancy and hit statistics"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_bytes": self.disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "directory": self.directory,
+                "datasets": len(self._datasets),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses
+            }
+
+
+analysis_results = AnalysisResultCache(
+    os.environ.get("ANALYSIS_CACHE_DIR", DEFAULT_ANALYSIS_CACHE_DIR),
+    int(os.environ.get("ANALYSIS_CACHE_MAX_BYTES", DEFAULT_ANALYSIS_CACHE_BYTES)),
+    int(os.environ.get("ANALYSIS_CACHE_DISK_BYTES", DEFAULT_ANALYSIS_DISK_BYTES))
+)
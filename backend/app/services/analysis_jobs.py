@@ -0,0 +1,415 @@
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional
+
+from .analysis_cache import analysis_results, analysis_key
+from .progress import set_reporter, ComputationStopped
+from .semantic_reasoning import SemanticReasoningService
+
+FINISHED_STATES = ("completed", "failed", "cancelled", "timeout")
+
+# Analyses run at the same time, one per worker process
+DEFAULT_ANALYSIS_WORKERS = min(4, os.cpu_count() or 1)
+
+# Jobs waiting for a worker before submissions are refused
+MAX_QUEUED_JOBS = 64
+
+# Finished jobs (and their results) kept for polling
+MAX_FINISHED_JOBS = 256
+
+# Seconds a job may run unless its submission sets another limit
+DEFAULT_JOB_TIMEOUT = 600.0
+
+# Extra seconds a cancelled or timed-out job gets to stop by itself before
+# its worker is terminated
+TIMEOUT_GRACE = 5.0
+
+# Minimum seconds between progress messages sent by a running job
+PROGRESS_INTERVAL = 0.25
+
+# Workers are started fresh rather than forked from the threaded server
+JOB_START_METHOD = "spawn"
+
+
+class JobCancelled(ComputationStopped):
+    """Raised inside a job when its cancellation has been requested"""
+
+
+class JobTimeout(ComputationStopped):
+    """Raised inside a job when it runs past its deadline"""
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when MAX_QUEUED_JOBS jobs are already waiting"""
+
+
+class _JobReporter:
+    """Progress callback of a job in its worker process
+
+    Forwards at most one update per PROGRESS_INTERVAL, and stops the job
+    by raising once it is cancelled or past its deadline.
+    """
+
+    def __init__(self, job_id: str, updates, cancel_event, deadline: Optional[float]):
+        self.job_id = job_id
+        self.updates = updates
+        self.cancel_event = cancel_event
+        self.deadline = deadline
+        self.pid = os.getpid()
+        self._last = 0.0
+
+    def __call__(self, fraction: float, stage: Optional[str]) -> None:
+        now = time.monotonic()
+        if fraction < 1.0 and now - self._last < PROGRESS_INTERVAL:
+            return
+        self._last = now
+        if self.deadline is not None and now > self.deadline:
+            raise JobTimeout(f"Job {self.job_id} exceeded its time limit")
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"Job {self.job_id} was cancelled")
+        self.updates.put((self.job_id, fraction, stage, self.pid))
+
+
+def _run_job(job_id: str, data: Dict[str, Any], parameters: Dict[str, Any],
+             updates, cancel_event, timeout: Optional[float]) -> Dict[str, Any]:
+    """Run one analysis in a worker process"""
+    if cancel_event.is_set():
+        raise JobCancelled(f"Job {job_id} was cancelled")
+    deadline = time.monotonic() + timeout if timeout else None
+    updates.put((job_id, 0.0, "started", os.getpid()))
+    set_reporter(_JobReporter(job_id, updates, cancel_event, deadline))
+    try:
+        return SemanticReasoningService().analyze(data, parameters)
+    finally:
+        set_reporter(None)
+
+
+class AnalysisJob:
+    """State of one submitted analysis"""
+
+    def __init__(self, job_id: str, parameters: Dict[str, Any], timeout: Optional[float]):
+        self.job_id = job_id
+        self.parameters = parameters
+        self.timeout = timeout
+        self.status = "queued"
+        self.progress = 0.0
+        self.stage: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.cached = False
+        self.cancel_requested = False
+        self.stop_requested_at: Optional[float] = None
+        self.key = None
+        self.future: Optional[Future] = None
+        self.cancel_event = None
+        # Worker running the job, and what is needed to submit it again
+        self.pid: Optional[int] = None
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.args: Optional[tuple] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def summary(self) -> Dict[str, Any]:
+        """Job state without its result"""
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.job_id,
+            "analysis_type": self.parameters.get("analysis_type", "basic"),
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "stage": self.stage,
+            "cached": self.cached,
+            "cancel_requested": self.cancel_requested,
+            "timeout": self.timeout,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "wait_seconds": round((self.started_at or end) - self.submitted_at, 4),
+            "run_seconds": round(end - self.started_at, 4) if self.started_at else None,
+            "error": self.error
+        }
+
+
+class AnalysisJobQueue:
+    """In-process queue running analyses in a bounded worker process pool
+
+    Jobs are served from the analysis result cache when possible. Running
+    jobs report progress through ``progress.report_progress`` over a
+    manager queue read by a listener thread, which also times jobs out.
+    Cancellation and time limits are cooperative first: the job stops at
+    its next progress report. A job still running TIMEOUT_GRACE seconds
+    later has its worker terminated; the pool is replaced and the other
+    jobs it held are submitted again. Finished jobs are kept for polling,
+    oldest dropped first.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_ANALYSIS_WORKERS, max_queued: int = MAX_QUEUED_JOBS,
+                 max_finished: int = MAX_FINISHED_JOBS, default_timeout: float = DEFAULT_JOB_TIMEOUT):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.default_timeout = default_timeout
+        self.submitted = 0
+        self.cache_hits = 0
+        self.finished_counts: Counter = Counter()
+        self.started = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+        self.max_run = 0.0
+        self._jobs: "OrderedDict[str, AnalysisJob]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Pools whose workers were terminated; their jobs are resubmitted
+        self._retired_pools: List[ProcessPoolExecutor] = []
+        self._manager = None
+        self._updates = None
+        self._listener: Optional[threading.Thread] = None
+
+    def _start(self) -> None:
+        """Start the worker pool, the manager and the listener on first use"""
+        if self._manager is None:
+            context = multiprocessing.get_context(JOB_START_METHOD)
+            self._manager = context.Manager()
+            self._updates = self._manager.Queue()
+            self._listener = threading.Thread(target=self._listen, name="analysis-job-listener", daemon=True)
+            self._listener.start()
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context(JOB_START_METHOD))
+
+    def submit(self, data: Dict[str, Any], parameters: Dict[str, Any],
+               timeout: Optional[float] = None) -> AnalysisJob:
+        """Queue an analysis and return its job
+
+        Raises ValueError for an invalid time limit and JobQueueFull when
+        too many jobs are waiting.
+        """
+        timeout = self.default_timeout if timeout is None else float(timeout)
+        if timeout <= 0:
+            raise ValueError("timeout must be positive")
+        # Each job gets one process; nested pools would oversubscribe the host
+        parameters = dict(parameters, processes=1)
+        job = AnalysisJob(uuid.uuid4().hex, parameters, timeout)
+        job.key = analysis_key(data, parameters)
+
+        cached = analysis_results.get(job.key)
+        if cached is not None:
+            job.result = cached
+            job.cached = True
+            with self._lock:
+                self.submitted += 1
+                self.cache_hits += 1
+                self._jobs[job.job_id] = job
+                self._finish(job, "completed")
+            return job
+
+        with self._lock:
+            queued = sum(1 for other in self._jobs.values() if other.status == "queued")
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"{queued} analysis jobs are already queued")
+            self._start()
+            job.cancel_event = self._manager.Event()
+            self.submitted += 1
+            self._jobs[job.job_id] = job
+            job.args = (_run_job, job.job_id, data, parameters, self._updates, job.cancel_event, timeout)
+            self._submit(job)
+        return job
+
+    def _submit(self, job: AnalysisJob) -> None:
+        """Hand a job to the worker pool (called with the lock held)"""
+        try:
+            job.future = self._pool.submit(*job.args)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); replace the pool
+            self._pool = None
+            self._start()
+            job.future = self._pool.submit(*job.args)
+        job.pool = self._pool
+        future = job.future
+        future.add_done_callback(lambda done: self._complete(job, done))
+
+    def get(self, job_id: str) -> AnalysisJob:
+        """Look up a job, raising KeyError for unknown or dropped jobs"""
+        with self._lock:
+            return self._jobs[job_id]
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [job.summary() for job in self._jobs.values()]
+
+    def cancel(self, job_id: str) -> AnalysisJob:
+        """Cancel a job: queued jobs are dropped, running ones stop at their
+        next progress report (or are terminated TIMEOUT_GRACE seconds
+        later), finished ones are left alone"""
+        with self._lock:
+            job = self._jobs[job_id]
+            if job.finished:
+                return job
+            job.cancel_requested = True
+            job.stop_requested_at = time.time()
+            job.cancel_event.set()
+            if job.future is not None and job.future.cancel():
+                self._finish(job, "cancelled")
+            return job
+
+    def _complete(self, job: AnalysisJob, future: Future) -> None:
+        """Record the outcome of a job's future"""
+        if future is not job.future:
+            return
+        if future.cancelled():
+            with self._lock:
+                if not job.finished:
+                    self._finish(job, "cancelled")
+            return
+        error = future.exception()
+        if error is None:
+            result = future.result()
+            analysis_results.put(job.key, result)
+            with self._lock:
+                if not job.finished:
+                    job.result = result
+                    job.progress = 1.0
+                    self._finish(job, "completed")
+            return
+        with self._lock:
+            if job.finished:
+                return
+            if isinstance(error, BrokenProcessPool) and job.pool in self._retired_pools:
+                # Another job's worker was terminated; run this one again
+                job.status = "queued"
+                job.started_at = None
+                job.progress = 0.0
+                job.stage = None
+                job.pid = None
+                if self._pool is None:
+                    self._start()
+                self._submit(job)
+                return
+            if isinstance(error, JobCancelled):
+                self._finish(job, "cancelled")
+            elif isinstance(error, JobTimeout):
+                self._finish(job, "timeout", str(error))
+            else:
+                self._finish(job, "failed", f"{type(error).__name__}: {error}")
+
+    def _finish(self, job: AnalysisJob, status: str, error: Optional[str] = None) -> None:
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        job.args = None
+        self.finished_counts[status] += 1
+        if job.started_at is not None:
+            run = job.finished_at - job.started_at
+            self.started += 1
+            self.total_wait += job.started_at - job.submitted_at
+            self.total_run += run
+            self.max_run = max(self.max_run, run)
+        finished = [job_id for job_id, other in self._jobs.items() if other.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _listen(self) -> None:
+        """Apply progress messages from the workers and time jobs out"""
+        while True:
+            try:
+                job_id, fraction, stage, pid = self._updates.get(timeout=1.0)
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                return
+            else:
+                with self._lock:
+                    job = self._jobs.get(job_id)
+                    if job is not None and not job.finished:
+                        if job.status == "queued":
+                            job.status = "running"
+                            job.started_at = time.time()
+                        job.pid = pid
+                        job.progress = max(job.progress, fraction)
+                        job.stage = stage
+            self._check_timeouts()
+
+    def _check_timeouts(self) -> None:
+        """Stop jobs that overran their limit, or were cancelled, without
+        stopping by themselves: they are reported as timed out (or
+        cancelled) and their workers terminated"""
+        now = time.time()
+        with self._lock:
+            for job in list(self._jobs.values()):
+                if job.status != "running":
+                    continue
+                if job.stop_requested_at is None and job.timeout is not None \
+                        and now > job.started_at + job.timeout:
+                    job.stop_requested_at = now
+                    job.cancel_event.set()
+                if job.stop_requested_at is not None and now > job.stop_requested_at + TIMEOUT_GRACE:
+                    if job.cancel_requested:
+                        self._finish(job, "cancelled")
+                    else:
+                        self._finish(job, "timeout", f"Job {job.job_id} exceeded its time limit")
+                    self._terminate(job)
+
+    def _terminate(self, job: AnalysisJob) -> None:
+        """Kill the worker of a job (called with the lock held)
+
+        A pool with a killed worker is broken, so it is retired first: new
+        jobs go to a fresh pool and the retired pool's other jobs are
+        resubmitted when their futures fail.
+        """
+        if job.pool is not None and job.pool not in self._retired_pools:
+            self._retired_pools.append(job.pool)
+            if self._pool is job.pool:
+                self._pool = None
+            job.pool.shutdown(wait=False)
+        if job.pid is not None:
+            try:
+                os.kill(job.pid, signal.SIGTERM)
+            except OSError:
+                pass
+        # Keep only the retired pools whose jobs may still be resubmitted
+        active = {id(other.pool) for other in self._jobs.values() if not other.finished}
+        self._retired_pools = [pool for pool in self._retired_pools if id(pool) in active or pool is job.pool]
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue occupancy, outcomes and timing metrics"""
+        with self._lock:
+            states = Counter(job.status for job in self._jobs.values())
+            return {
+                "workers": self.max_workers,
+                "max_queued": self.max_queued,
+                "queued": states["queued"],
+                "running": states["running"],
+                "retained_jobs": len(self._jobs),
+                "submitted": self.submitted,
+                "cache_hits": self.cache_hits,
+                "finished": dict(self.finished_counts),
+                "mean_wait_seconds": round(self.total_wait / self.started, 4) if self.started else None,
+                "mean_run_seconds": round(self.total_run / self.started, 4) if self.started else None,
+                "max_run_seconds": round(self.max_run, 4)
+            }
+
+    def shutdown(self) -> None:
+        """Cancel waiting jobs and stop the workers and the manager"""
+        with self._lock:
+            pool, manager = self._pool, self._manager
+            self._pool = self._manager = None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+
+
+analysis_jobs = AnalysisJobQueue(int(os.environ.get("ANALYSIS_WORKERS", DEFAULT_ANALYSIS_WORKERS)))
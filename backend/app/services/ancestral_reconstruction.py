@@ -0,0 +1,128 @@
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from .compact_tree import CompactTree
+
+RECONSTRUCTION_METHODS = ("dollo", "fitch")
+
+# Orthogroups processed per block, bounding the nodes x orthogroups arrays
+DEFAULT_BLOCK_SIZE = 8192
+
+
+def _dollo_states(tree: CompactTree, presence: np.ndarray, missing: np.ndarray) -> Dict[str, np.ndarray]:
+    """Dollo parsimony: a single origin at the LCA of the present leaves
+
+    Leaves with missing data are assumed present inside the origin clade,
+    so they never add a loss.
+    """
+    counts = tree.postorder_sum(presence.astype(np.int32))
+    total = counts[0]
+    possible = counts + tree.postorder_sum(missing.astype(np.int32))[:, np.newaxis]
+
+    # The origin is the deepest node whose subtree holds every present leaf
+    contains_all = counts == total[np.newaxis, :]
+    origin = np.argmax(contains_all * (tree.depth[:, np.newaxis] + 1), axis=0)
+
+    # Present on every node inside the origin clade with a present (or
+    # missing) leaf below
+    nodes = np.arange(tree.n_nodes)[:, np.newaxis]
+    in_clade = (nodes >= origin) & (nodes < origin + tree.subtree_size[origin])
+    states = in_clade & (possible > 0)
+    states[:, total == 0] = False
+    origin[total == 0] = -1
+    return {"states": states, "origin": origin}
+
+
+def _fitch_states(tree: CompactTree, presence: np.ndarray, missing: np.ndarray) -> Dict[str, np.ndarray]:
+    """Fitch parsimony over 0/1 states, allowing multifurcations
+
+    Leaves with missing data start with both states, so they take their
+    parent's state.
+    """
+    has_absent = ~presence | missing[:, np.newaxis]
+    has_present = presence | missing[:, np.newaxis]
+    count_absent = np.zeros(presence.shape, dtype=np.int32)
+    count_present = np.zeros(presence.shape, dtype=np.int32)
+
+    # Postorder: an internal node keeps the states seen in most children
+    for level in reversed(tree.levels):
+        internal = level[~tree.is_leaf[level]]
+        if len(internal):
+            best = np.maximum(count_absent[internal], count_present[internal])
+            has_absent[internal] = count_absent[internal] == best
+            has_present[internal] = count_present[internal] == best
+        if level[0] != 0:
+            np.add.at(count_absent, tree.parent[level], has_absent[level])
+            np.add.at(count_present, tree.parent[level], has_present[level])
+
+    # Preorder: the root prefers absence, children keep the parent's state
+    # whenever it is in their set
+    states = np.zeros(presence.shape, dtype=bool)
+    states[0] = ~has_absent[0]
+    for level in tree.levels[1:]:
+        parent_state = states[tree.parent[level]]
+        states[level] = np.where(parent_state, has_present[level], ~has_absent[level])
+
+    # The shallowest gain is reported as the origin
+    gains = states.copy()
+    gains[1:] &= ~states[tree.parent[1:]]
+    has_gain = gains.any(axis=0)
+    origin = np.argmax(gains * (tree.n_nodes - tree.depth[:, np.newaxis]), axis=0)
+    origin[~has_gain] = -1
+    return {"states": states, "origin": origin}
+
+
+def reconstruct_gain_loss(tree: CompactTree, leaf_presence: np.ndarray, method: str = "dollo",
+                          block_size: int = DEFAULT_BLOCK_SIZE,
+                          missing_leaves: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """Map orthogroup gains and losses onto the branches of a tree
+
+    ``leaf_presence`` is a boolean nodes x orthogroups matrix whose leaf rows
+    give the observed presence (internal rows are ignored). All orthogroups
+    are reconstructed together, one level-synchronous pass per block of
+    columns, instead of one tree walk per family.
+
+    Gains and losses are counted on the branch above each node; a gain at
+    the root marks orthogroups that were already present at the root.
+    Leaves flagged in the boolean ``missing_leaves`` vector (e.g. species
+    without data) are treated as unknown rather than absent.
+    """
+    if method not in RECONSTRUCTION_METHODS:
+        raise ValueError(f"Unsupported reconstruction method: {method}")
+    missing = np.zeros(tree.n_nodes, dtype=bool) if missing_leaves is None else np.asarray(missing_leaves, dtype=bool)
+    missing = missing & tree.is_leaf
+    presence = np.asarray(leaf_presence, dtype=bool) & tree.is_leaf[:, np.newaxis] & ~missing[:, np.newaxis]
+    n_orthogroups = presence.shape[1]
+
+    branch_gains = np.zeros(tree.n_nodes, dtype=np.int64)
+    branch_losses = np.zeros(tree.n_nodes, dtype=np.int64)
+    origin = np.full(n_orthogroups, -1, dtype=np.int64)
+    orthogroup_gains = np.zeros(n_orthogroups, dtype=np.int64)
+    orthogroup_losses = np.zeros(n_orthogroups, dtype=np.int64)
+
+    reconstruct = _dollo_states if method == "dollo" else _fitch_states
+    for start in range(0, n_orthogroups, block_size):
+        block = slice(start, start + block_size)
+        result = reconstruct(tree, presence[:, block], missing)
+        states = result["states"]
+
+        parent_states = np.zeros_like(states)
+        parent_states[1:] = states[tree.parent[1:]]
+        gains = states & ~parent_states
+        losses = parent_states & ~states
+
+        branch_gains += gains.sum(axis=1)
+        branch_losses += losses.sum(axis=1)
+        orthogroup_gains[block] = gains.sum(axis=0)
+        orthogroup_losses[block] = losses.sum(axis=0)
+        origin[block] = result["origin"]
+
+    return {
+        "method": method,
+        "branch_gains": branch_gains,
+        "branch_losses": branch_losses,
+        "origin": origin,
+        "orthogroup_gains": orthogroup_gains,
+        "orthogroup_losses": orthogroup_losses
+    }
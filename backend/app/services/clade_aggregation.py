@@ -0,0 +1,58 @@
+from typing import Dict
+
+import numpy as np
+from scipy import sparse
+
+from .compact_tree import CompactTree
+from .tree_cache import CachedTree
+
+
+def clade_membership_matrix(tree: CompactTree) -> sparse.csr_matrix:
+    """Sparse nodes x leaves matrix with a 1 where a leaf lies in a node's clade
+
+    Leaf columns follow preorder. Because each clade's leaves are
+    contiguous in preorder, row ``v`` is the leaf range starting at
+    ``leaf_first[v]``, and the matrix is assembled without a tree walk.
+    """
+    leaf_flags = tree.is_leaf.astype(np.int64)
+    leaf_first = np.cumsum(leaf_flags) - leaf_flags
+    counts = tree.leaf_count
+
+    indptr = np.concatenate(([0], np.cumsum(counts)))
+    # Column indices: leaf_first[v], leaf_first[v] + 1, ... for every row
+    row_starts = np.repeat(leaf_first - indptr[:-1], counts)
+    indices = row_starts + np.arange(indptr[-1])
+    data = np.ones(indptr[-1], dtype=np.float64)
+    return sparse.csr_matrix((data, indices, indptr), shape=(tree.n_nodes, int(leaf_flags.sum())))
+
+
+def get_clade_membership(entry: CachedTree) -> sparse.csr_matrix:
+    """Return the cached clade-membership matrix of a tree"""
+    return entry.get_derived("clade_membership", lambda: clade_membership_matrix(entry.tree))
+
+
+def aggregate_clades(tree: CompactTree, membership: sparse.csr_matrix,
+                     leaf_values: np.ndarray) -> Dict[str, np.ndarray]:
+    """Aggregate per-leaf values (leaves x columns, preorder) over every clade
+
+    Sums and present-species counts are sparse matrix products; maxima use
+    one ``reduceat`` over the contiguous leaf range of each clade.
+    """
+    values = np.asarray(leaf_values, dtype=np.float64)
+    vector = values.ndim == 1
+    if vector:
+        values = values[:, np.newaxis]
+
+    sums = membership @ values
+    present = membership @ (values > 0).astype(np.float64)
+    present_fraction = present / tree.leaf_count[:, np.newaxis]
+
+    first = membership.indices[membership.indptr[:-1]]
+    bounds = np.column_stack((first, first + tree.leaf_count)).ravel()
+    padded = np.vstack((values, np.zeros((1, values.shape[1]))))
+    maxima = np.maximum.reduceat(padded, bounds, axis=0)[::2]
+
+    result = {"sum": sums, "max": maxima, "present_fraction": present_fraction}
+    if vector:
+        result = {key: column[:, 0] for key, column in result.items()}
+    return result
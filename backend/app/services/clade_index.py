@@ -0,0 +1,194 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+
+from .compact_tree import CompactTree
+from .consensus import BipartitionCounter, leaf_bit_order
+
+# Tree collections kept in memory, least recently used dropped first
+MAX_TREE_COLLECTIONS = 16
+
+
+class CladeIndex(BipartitionCounter):
+    """Inverted index from canonical split keys to the trees containing them
+
+    Trees are added once (their splits counted as for a consensus); the
+    index is then built with a single sort of every split key: a
+    compressed sparse row layout lists the trees of each distinct split,
+    and a hash map from key bytes to row answers a clade query with one
+    dictionary lookup. Adding more trees invalidates the index, which is
+    rebuilt on the next query.
+    """
+
+    def __init__(self, leaf_order: Dict[str, int], max_workers: Optional[int] = None):
+        super().__init__(leaf_order, max_workers)
+        self.tree_ids: List[str] = []
+        self._rows: Optional[Dict[bytes, int]] = None
+        self._counted: Optional[Dict[str, np.ndarray]] = None
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._trees = np.zeros(0, dtype=np.int64)
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_trees(cls, trees: Sequence[CompactTree], tree_ids: Sequence[str]) -> "CladeIndex":
+        """Index a collection whose first tree defines the leaf order"""
+        if not trees:
+            raise ValueError("No trees to index")
+        index = cls(leaf_bit_order(trees[0]))
+        try:
+            index.add_trees(trees, tree_ids)
+        finally:
+            index.close()
+        return index
+
+    @property
+    def collection_id(self) -> str:
+        """Content address of the collection: a hash of its tree IDs"""
+        return hashlib.sha1("\n".join(self.tree_ids).encode("utf-8")).hexdigest()
+
+    def add_trees(self, trees: Sequence[CompactTree], tree_ids: Optional[Sequence[str]] = None) -> None:
+        """Count a batch of trees, naming them by ``tree_ids`` or position"""
+        if tree_ids is not None and len(tree_ids) != len(trees):
+            raise ValueError("Every indexed tree needs a tree ID")
+        start = self.num_trees
+        super().add_trees(trees)
+        with self._lock:
+            self.tree_ids.extend(tree_ids if tree_ids is not None else
+                                 [str(position) for position in range(start, self.num_trees)])
+            self._rows = None
+            self._counted = None
+
+    def set_tree_ids(self, tree_ids: Sequence[str]) -> None:
+        """Rename the indexed trees once their IDs are known (e.g. after a
+        NEXUS upload has been read to the end)"""
+        if len(tree_ids) != self.num_trees:
+            raise ValueError("Every indexed tree needs a tree ID")
+        with self._lock:
+            self.tree_ids = list(tree_ids)
+            self._positions = {}
+
+    def _build(self) -> None:
+        with self._lock:
+            if self._rows is not None:
+                return
+            if not self._keys:
+                self._counted = super().counts()
+                self._rows = {}
+                return
+            sizes = np.array([len(keys) for keys in self._keys], dtype=np.int64)
+            keys, inverse, counts = np.unique(np.concatenate(self._keys), return_inverse=True, return_counts=True)
+            inverse = inverse.ravel()
+            length_sums = np.bincount(inverse, weights=np.concatenate(self._lengths), minlength=len(keys))
+
+            order = np.argsort(inverse, kind="stable")
+            self._trees = np.repeat(np.arange(len(sizes)), sizes)[order]
+            self._indptr = np.concatenate(([0], np.cumsum(counts)))
+            self._counted = {"keys": keys, "counts": counts, "mean_lengths": length_sums / counts}
+            self._rows = {key.tobytes(): row for row, key in enumerate(keys)}
+
+    def counts(self) -> Dict[str, np.ndarray]:
+        """Distinct splits with their tree counts, shared with the consensus"""
+        self._build()
+        return self._counted
+
+    def position(self, tree_id: str) -> int:
+        """Position of an indexed tree, raising KeyError when absent"""
+        if len(self._positions) != len(self.tree_ids):
+            self._positions = {tree_id: position for position, tree_id in enumerate(self.tree_ids)}
+        return self._positions[tree_id]
+
+    def trees_with_clade(self, leaves: Sequence[str]) -> np.ndarray:
+        """Positions of the trees containing a clade (or its complement)"""
+        key = self.clade_key(leaves)
+        if key is None:
+            return np.arange(self.num_trees)
+        self._build()
+        row = self._rows.get(key)
+        if row is None:
+            return np.zeros(0, dtype=np.int64)
+        return self._trees[self._indptr[row]:self._indptr[row + 1]]
+
+    def query(self, leaves: Sequence[str], include_tree_ids: bool = True) -> Dict[str, Any]:
+        """Number and fraction of trees supporting a clade"""
+        positions = self.trees_with_clade(leaves)
+        result = {
+            "leaves": list(leaves),
+            "count": len(positions),
+            "support": len(positions) / self.num_trees if self.num_trees else 0.0
+        }
+        if include_tree_ids:
+            result["tree_ids"] = [self.tree_ids[position] for position in positions]
+        return result
+
+    def summary(self) -> Dict[str, Any]:
+        """Short description of the collection"""
+        return {
+            "collection_id": self.collection_id,
+            "num_trees": self.num_trees,
+            "num_leaves": self.n_leaves,
+            "num_splits": len(self.counts()["keys"])
+        }
+
+
+def compare_splits(first: np.ndarray, second: np.ndarray, n_leaves: int) -> Dict[str, Any]:
+    """Robinson-Foulds comparison of two trees' split key sets"""
+    shared = len(np.intersect1d(first, second, assume_unique=True))
+    distance = len(first) + len(second) - 2 * shared
+    # Each of two binary unrooted trees has at most n - 3 non-trivial splits
+    max_distance = 2 * (n_leaves - 3)
+    return {
+        "shared_splits": shared,
+        "splits_unique_to_tree1": len(first) - shared,
+        "splits_unique_to_tree2": len(second) - shared,
+        "robinson_foulds": distance,
+        "normalized_robinson_foulds": distance / max_distance if max_distance > 0 else 0.0
+    }
+
+
+def compare_tree_splits(tree1: CompactTree, tree2: CompactTree) -> Dict[str, Any]:
+    """Robinson-Foulds comparison of two trees over the same leaves"""
+    counter = BipartitionCounter(leaf_bit_order(tree1), max_workers=1)
+    first = counter.tree_splits(tree1)["keys"]
+    second = counter.tree_splits(tree2)["keys"]
+    return compare_splits(first, second, counter.n_leaves)
+
+
+class CladeIndexStore:
+    """Registered tree collections, looked up by collection ID"""
+
+    def __init__(self, max_collections: int = MAX_TREE_COLLECTIONS):
+        self.max_collections = max_collections
+        self._indexes: "OrderedDict[str, CladeIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, index: CladeIndex) -> CladeIndex:
+        """Register a collection, returning the existing one for identical trees"""
+        collection_id = index.collection_id
+        with self._lock:
+            existing = self._indexes.get(collection_id)
+            if existing is not None:
+                self._indexes.move_to_end(collection_id)
+                return existing
+            self._indexes[collection_id] = index
+            while len(self._indexes) > self.max_collections:
+                self._indexes.popitem(last=False)
+            return index
+
+    def get(self, collection_id: str) -> CladeIndex:
+        """Look up a collection, raising KeyError when unknown or evicted"""
+        with self._lock:
+            index = self._indexes[collection_id]
+            self._indexes.move_to_end(collection_id)
+            return index
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            indexes = list(self._indexes.values())
+        return [index.summary() for index in indexes]
+
+
+clade_indexes = CladeIndexStore()
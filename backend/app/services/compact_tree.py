@@ -0,0 +1,266 @@
+from typing import Dict, Any, Optional, Sequence
+
+import numpy as np
+from ete3 import Tree
+
+
+def label_support(label: str) -> float:
+    """Support value of an internal node label as read with ETE3
+    ``format=1``: the label itself when numeric, otherwise NaN (no support
+    value)"""
+    try:
+        return float(label)
+    except ValueError:
+        return np.nan
+
+
+class CompactTree:
+    """Array-backed rooted tree stored in preorder
+
+    Node ``0`` is the root and every node's parent has a smaller index, so the
+    subtree of node ``i`` is the contiguous preorder interval
+    ``[i, i + subtree_size[i])``.
+    """
+
+    def __init__(self, parent: Sequence[int], names: Sequence[str],
+                 branch_lengths: Sequence[float], support: Optional[Sequence[float]] = None):
+        self.parent = np.asarray(parent, dtype=np.int64)
+        self.names = [str(name) for name in names]
+        self.branch_lengths = np.asarray(branch_lengths, dtype=np.float64)
+        if support is None:
+            self.support = np.full(len(self.names), np.nan)
+        else:
+            self.support = np.asarray(support, dtype=np.float64)
+
+        self.n_nodes = len(self.parent)
+        if self.n_nodes == 0:
+            raise ValueError("Tree has no nodes")
+        if self.parent[0] != -1 or np.any(self.parent[1:] >= np.arange(1, self.n_nodes)):
+            raise ValueError("Parent array is not in preorder")
+
+        # Children in CSR layout (children keep their preorder order)
+        self.child_count = np.bincount(self.parent[1:], minlength=self.n_nodes)
+        self.child_offsets = np.concatenate(([0], np.cumsum(self.child_count)))
+        self.child_index = np.argsort(self.parent[1:], kind="stable") + 1
+        self.is_leaf = self.child_count == 0
+
+        # Depth (in edges) and distance from the root
+        self.depth, self.root_distance = self._ancestor_sums()
+
+        # Nodes grouped by depth, used for level-synchronous passes
+        order = np.argsort(self.depth, kind="stable")
+        splits = np.flatnonzero(np.diff(self.depth[order])) + 1
+        self.levels = np.split(order, splits)
+
+        # Subtree sizes and leaf counts (postorder accumulation)
+        self.subtree_size = self.postorder_sum(np.ones(self.n_nodes, dtype=np.int64))
+        self.leaf_count = self.postorder_sum(self.is_leaf.astype(np.int64))
+
+        self.name_to_index = {}
+        for index, name in enumerate(self.names):
+            if name and name not in self.name_to_index:
+                self.name_to_index[name] = index
+        # Names that kept their Newick quotes can also be looked up without
+        for index, name in enumerate(self.names):
+            unquoted = name.strip("'\"")
+            if unquoted and unquoted != name and unquoted not in self.name_to_index:
+                self.name_to_index[unquoted] = index
+
+    @classmethod
+    def from_ete(cls, tree: Tree) -> "CompactTree":
+        """Build a compact tree from an ETE3 tree
+
+        ETE3 gives every node a support of 1.0 unless one is read, so, as
+        in the streaming parsers, support comes from numeric internal
+        labels and is NaN elsewhere.
+        """
+        node_map = {}
+        parent, names, lengths, support = [], [], [], []
+        for node in tree.traverse("preorder"):
+            node_map[node] = len(parent)
+            parent.append(node_map[node.up] if node.up is not None and node is not tree else -1)
+            names.append(node.name or "")
+            lengths.append(node.dist)
+            support.append(np.nan if node.is_leaf() else label_support(node.name or ""))
+        return cls(parent, names, lengths, support)
+
+    @classmethod
+    def from_newick(cls, newick_str: str) -> "CompactTree":
+        """Parse a Newick string into a compact tree"""
+        return cls.from_ete(Tree(newick_str, format=1))
+
+    def to_ete(self) -> Tree:
+        """Convert back to an ETE3 tree"""
+        nodes = []
+        for index in range(self.n_nodes):
+            if index == 0:
+                node = Tree()
+            else:
+                node = nodes[self.parent[index]].add_child()
+            node.name = self.names[index]
+            node.dist = float(self.branch_lengths[index])
+            if not np.isnan(self.support[index]):
+                node.support = float(self.support[index])
+            nodes.append(node)
+        return nodes[0]
+
+    def _ancestor_sums(self):
+        """Compute depth and root distance by pointer jumping"""
+        ancestor = self.parent.copy()
+        ancestor[0] = 0
+        depth = np.ones(self.n_nodes, dtype=np.int64)
+        depth[0] = 0
+        distance = np.where(np.isnan(self.branch_lengths), 0.0, self.branch_lengths)
+        distance[0] = 0.0
+
+        # Each round doubles the jump length, so this takes log2(height) rounds
+        while np.any(ancestor != 0):
+            depth = depth + depth[ancestor]
+            distance = distance + distance[ancestor]
+            ancestor = ancestor[ancestor]
+        return depth, distance
+
+    def postorder_sum(self, values: np.ndarray) -> np.ndarray:
+        """Sum node values over each subtree, deepest level first"""
+        return self.postorder_reduce(values, np.add)
+
+    def postorder_reduce(self, values: np.ndarray, ufunc: np.ufunc) -> np.ndarray:
+        """Reduce node values over each subtree with a NumPy ufunc"""
+        totals = np.array(values, copy=True)
+        for level in reversed(self.levels[1:]):
+            ufunc.at(totals, self.parent[level], totals[level])
+        return totals
+
+    def children(self, node: int) -> np.ndarray:
+        """Return the children of a node"""
+        return self.child_index[self.child_offsets[node]:self.child_offsets[node + 1]]
+
+    def subtree_leaves(self, node: int) -> np.ndarray:
+        """Return the leaf indices below a node"""
+        end = node + self.subtree_size[node]
+        return node + np.flatnonzero(self.is_leaf[node:end])
+
+    def leaf_indices(self, names: Sequence[str]) -> np.ndarray:
+        """Map node names to indices, raising on unknown names"""
+        missing = [name for name in names if name not in self.name_to_index]
+        if missing:
+            raise KeyError(f"Nodes not found in tree: {', '.join(missing[:10])}")
+        return np.array([self.name_to_index[name] for name in names], dtype=np.int64)
+
+
+class LCAIndex:
+    """Lowest common ancestor index (Euler tour plus sparse-table RMQ)
+
+    Preprocessing is O(n log n); each pairwise query is O(1) and a query over
+    k nodes is O(k).
+    """
+
+    def __init__(self, tree: CompactTree):
+        self.tree = tree
+        n = tree.n_nodes
+
+        # In preorder, the first visit of node i happens after i entries and
+        # after returning from the i - depth[i] nodes that are not its ancestors
+        self.first = 2 * np.arange(n, dtype=np.int64) - tree.depth
+        euler = np.empty(2 * n - 1, dtype=np.int64)
+        euler[self.first] = np.arange(n)
+        # Returning to the parent right after leaving a child's subtree
+        euler[self.first[1:] + 2 * tree.subtree_size[1:] - 1] = tree.parent[1:]
+        self.euler = euler
+
+        # Sparse table of the shallowest node for every power-of-two window
+        depth = tree.depth
+        table = [euler]
+        span = 1
+        while 2 * span <= len(euler):
+            previous = table[-1]
+            left = previous[:len(previous) - span]
+            right = previous[span:]
+            table.append(np.where(depth[left] <= depth[right], left, right))
+            span *= 2
+        self.table = table
+
+    def lca_many(self, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+        """Vectorised pairwise LCA of two index arrays"""
+        first_u = self.first[np.asarray(u, dtype=np.int64)]
+        first_v = self.first[np.asarray(v, dtype=np.int64)]
+        lo = np.minimum(first_u, first_v)
+        hi = np.maximum(first_u, first_v)
+        level = np.floor(np.log2(hi - lo + 1)).astype(np.int64)
+
+        result = np.empty(len(lo), dtype=np.int64)
+        for k in np.unique(level):
+            mask = level == k
+            left = self.table[k][lo[mask]]
+            right = self.table[k][hi[mask] - (1 << k) + 1]
+            result[mask] = np.where(self.tree.depth[left] <= self.tree.depth[right], left, right)
+        return result
+
+    def lca(self, u: int, v: int) -> int:
+        """Pairwise LCA of two node indices"""
+        lo, hi = sorted((int(self.first[u]), int(self.first[v])))
+        k = (hi - lo + 1).bit_length() - 1
+        left = self.table[k][lo]
+        right = self.table[k][hi - (1 << k) + 1]
+        return int(left if self.tree.depth[left] <= self.tree.depth[right] else right)
+
+    def lca_of(self, nodes: Sequence[int]) -> int:
+        """LCA of a node set: the LCA of its first and last Euler visits"""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        if len(nodes) == 0:
+            raise ValueError("At least one node is required")
+        first = self.first[nodes]
+        return self.lca(int(nodes[np.argmin(first)]), int(nodes[np.argmax(first)]))
+
+    def mrca(self, names: Sequence[str]) -> Dict[str, Any]:
+        """Describe the most recent common ancestor of named nodes"""
+        tree = self.tree
+        indices = tree.leaf_indices(names)
+        node = self.lca_of(indices)
+        clade = tree.subtree_leaves(node)
+        query_leaves = {int(i) for i in indices if tree.is_leaf[i]}
+        return {
+            "node_id": node,
+            "name": tree.names[node],
+            "depth": int(tree.depth[node]),
+            "root_distance": float(tree.root_distance[node]),
+            "clade_leaves": [tree.names[i] for i in clade],
+            "clade_size": int(len(clade)),
+            "is_monophyletic": query_leaves == set(clade.tolist()),
+        }
+
+
+def induced_subtree(index: LCAIndex, names: Sequence[str]) -> CompactTree:
+    """Restrict a tree to the named nodes
+
+    Builds the virtual tree over the retained nodes: sorting them in preorder
+    and adding the LCAs of adjacent pairs yields exactly the branching nodes
+    of the induced subtree, so unary nodes are collapsed and branch lengths
+    are summed in O(k log k) for k retained nodes.
+    """
+    tree = index.tree
+    retained = np.unique(tree.leaf_indices(names))
+    if len(retained) > 1:
+        ancestors = index.lca_many(retained[:-1], retained[1:])
+        retained = np.unique(np.concatenate((retained, ancestors)))
+
+    # Node indices are preorder positions, so a stack of open intervals
+    # gives each retained node its nearest retained ancestor
+    parent = np.full(len(retained), -1, dtype=np.int64)
+    stack = []
+    for position, node in enumerate(retained):
+        while stack and node >= retained[stack[-1]] + tree.subtree_size[retained[stack[-1]]]:
+            stack.pop()
+        if stack:
+            parent[position] = stack[-1]
+        stack.append(position)
+
+    branch_lengths = np.zeros(len(retained))
+    branch_lengths[1:] = tree.root_distance[retained[1:]] - tree.root_distance[retained[parent[1:]]]
+    return CompactTree(
+        parent,
+        [tree.names[node] for node in retained],
+        branch_lengths,
+        tree.support[retained]
+    )
+
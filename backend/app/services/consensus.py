@@ -0,0 +1,240 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .compact_tree import CompactTree
+
+CONSENSUS_METHODS = ("majority", "strict")
+
+# Trees handed to the worker pool per batch
+DEFAULT_BATCH_SIZE = 256
+
+
+def leaf_bit_order(tree: CompactTree) -> Dict[str, int]:
+    """Bit position of every leaf name, in the preorder of a reference tree"""
+    names = [tree.names[leaf] for leaf in np.flatnonzero(tree.is_leaf)]
+    order = {name: bit for bit, name in enumerate(names)}
+    if len(order) != len(names):
+        raise ValueError("Leaf names must be unique to compare trees")
+    return order
+
+
+def split_keys(clades: np.ndarray) -> np.ndarray:
+    """View rows of packed leaf bitsets as hashable fixed-size byte keys"""
+    clades = np.ascontiguousarray(clades, dtype=np.uint64)
+    return clades.view(np.dtype((np.void, clades.shape[1] * 8))).ravel()
+
+
+def keys_to_clades(keys: np.ndarray, n_words: int) -> np.ndarray:
+    """Unpack byte keys back into rows of packed leaf bitsets"""
+    return np.frombuffer(keys.tobytes(), dtype=np.uint64).reshape(len(keys), n_words)
+
+
+def clade_membership(clades: np.ndarray, n_leaves: int) -> np.ndarray:
+    """Boolean splits x leaves matrix of packed leaf bitsets"""
+    as_bytes = np.ascontiguousarray(clades, dtype="<u8").view(np.uint8)
+    return np.unpackbits(as_bytes, axis=1, bitorder="little")[:, :n_leaves].astype(bool)
+
+
+class BipartitionCounter:
+    """Count unrooted bipartitions (splits) over a collection of trees
+
+    Every split is a bitset over the leaves packed into uint64 words. A
+    tree's clade bitsets are XORs of prefix sums of one-hot leaf rows, since
+    the leaves of a clade are contiguous in preorder. Splits are stored on
+    the side without the first leaf, so both sides of an edge give the same
+    key. Per-tree work runs in a thread pool owned by the counter (shut
+    down by ``close``); the counts are merged with one ``np.unique`` over
+    all keys at the end.
+    """
+
+    def __init__(self, leaf_order: Dict[str, int], max_workers: Optional[int] = None):
+        self.leaf_order = leaf_order
+        self.leaf_names = sorted(leaf_order, key=leaf_order.get)
+        self.n_leaves = len(leaf_order)
+        self.n_words = max((self.n_leaves + 63) // 64, 1)
+        self.max_workers = max_workers or min(32, os.cpu_count() or 1)
+        self.num_trees = 0
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+        mask = np.full(self.n_words, np.iinfo(np.uint64).max, dtype=np.uint64)
+        if self.n_leaves % 64:
+            mask[-1] = np.uint64((1 << (self.n_leaves % 64)) - 1)
+        self._mask = mask
+        self._keys: List[np.ndarray] = []
+        self._lengths: List[np.ndarray] = []
+        self._leaf_lengths = np.zeros(self.n_leaves)
+
+    def clade_key(self, leaves: Sequence[str]) -> Optional[bytes]:
+        """Canonical split key of a clade given by leaf names
+
+        Returns ``None`` for trivial splits (fewer than two leaves on either
+        side), which every tree contains.
+        """
+        try:
+            bits = np.unique(np.array([self.leaf_order[name] for name in leaves], dtype=np.int64))
+        except KeyError as e:
+            raise ValueError(f"Leaf {e.args[0]} is not in the reference leaf set")
+        if len(bits) < 2 or len(bits) > self.n_leaves - 2:
+            return None
+        clade = np.zeros((1, self.n_words), dtype=np.uint64)
+        np.bitwise_or.at(clade[0], bits >> 6, np.left_shift(np.uint64(1), (bits & 63).astype(np.uint64)))
+        if clade[0, 0] & np.uint64(1):
+            clade = ~clade & self._mask
+        return split_keys(clade)[0].tobytes()
+
+    def tree_keys(self, position: int) -> np.ndarray:
+        """Split keys of the counted tree at ``position``"""
+        return self._keys[position]
+
+    def tree_splits(self, tree: CompactTree) -> Dict[str, np.ndarray]:
+        """Unique non-trivial split keys of one tree, with their branch lengths"""
+        leaves = np.flatnonzero(tree.is_leaf)
+        if len(leaves) != self.n_leaves:
+            raise ValueError(f"All trees must have the same {self.n_leaves} leaves; found a tree with {len(leaves)}")
+        try:
+            bits = np.array([self.leaf_order[tree.names[leaf]] for leaf in leaves], dtype=np.int64)
+        except KeyError as e:
+            raise ValueError(f"Leaf {e.args[0]} is not in the reference leaf set")
+
+        onehot = np.zeros((len(leaves), self.n_words), dtype=np.uint64)
+        onehot[np.arange(len(leaves)), bits >> 6] = np.left_shift(np.uint64(1), (bits & 63).astype(np.uint64))
+        prefix = np.zeros((len(leaves) + 1, self.n_words), dtype=np.uint64)
+        np.bitwise_xor.accumulate(onehot, axis=0, out=prefix[1:])
+
+        leaf_flags = tree.is_leaf.astype(np.int64)
+        leaf_first = np.cumsum(leaf_flags) - leaf_flags
+        nodes = np.flatnonzero((tree.leaf_count >= 2) & (tree.leaf_count <= self.n_leaves - 2))
+        nodes = nodes[nodes > 0]
+        clades = prefix[leaf_first[nodes] + tree.leaf_count[nodes]] ^ prefix[leaf_first[nodes]]
+
+        # Store every split on the side that excludes leaf 0
+        flip = (clades[:, 0] & np.uint64(1)).astype(bool)
+        clades[flip] = ~clades[flip] & self._mask
+
+        keys, inverse = np.unique(split_keys(clades), return_inverse=True)
+        lengths = np.bincount(inverse.ravel(), weights=np.nan_to_num(tree.branch_lengths[nodes]),
+                              minlength=len(keys))
+        leaf_lengths = np.zeros(self.n_leaves)
+        leaf_lengths[bits] = np.nan_to_num(tree.branch_lengths[leaves])
+        return {"keys": keys, "lengths": lengths, "leaf_lengths": leaf_lengths}
+
+    def add_trees(self, trees: Sequence[CompactTree]) -> None:
+        """Count the splits of a batch of trees in parallel"""
+        if self.max_workers > 1 and len(trees) > 1:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="split-counter")
+            results = list(self._pool.map(self.tree_splits, trees))
+        else:
+            results = [self.tree_splits(tree) for tree in trees]
+
+        for result in results:
+            self._keys.append(result["keys"])
+            self._lengths.append(result["lengths"])
+            self._leaf_lengths += result["leaf_lengths"]
+        self.num_trees += len(results)
+
+    def add_all(self, trees: Iterable[CompactTree], batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        """Count the splits of any iterable of trees, batch by batch"""
+        batch = []
+        for tree in trees:
+            batch.append(tree)
+            if len(batch) >= batch_size:
+                self.add_trees(batch)
+                batch = []
+        if batch:
+            self.add_trees(batch)
+
+    def close(self) -> None:
+        """Shut down the worker threads once counting is done (adding more
+        trees starts a new pool)"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def counts(self) -> Dict[str, np.ndarray]:
+        """Distinct splits with the number of trees containing each one and
+        their mean branch length"""
+        if not self._keys:
+            empty = np.zeros(0, dtype=split_keys(np.zeros((0, self.n_words))).dtype)
+            return {"keys": empty, "counts": np.zeros(0, dtype=np.int64), "mean_lengths": np.zeros(0)}
+        keys, inverse, counts = np.unique(np.concatenate(self._keys), return_inverse=True, return_counts=True)
+        length_sums = np.bincount(inverse.ravel(), weights=np.concatenate(self._lengths), minlength=len(keys))
+        return {"keys": keys, "counts": counts, "mean_lengths": length_sums / counts}
+
+    def mean_leaf_lengths(self) -> np.ndarray:
+        """Mean terminal branch length of every leaf"""
+        return self._leaf_lengths / max(self.num_trees, 1)
+
+
+def consensus_threshold(method: str, threshold: Optional[float] = None) -> float:
+    """Fraction of trees a split must exceed (majority) or reach (strict)"""
+    if method not in CONSENSUS_METHODS:
+        raise ValueError(f"Unsupported consensus method: {method}. Use one of: {', '.join(CONSENSUS_METHODS)}")
+    if method == "strict":
+        return 1.0
+    threshold = 0.5 if threshold is None else threshold
+    if not 0.5 <= threshold <= 1.0:
+        raise ValueError("Majority-rule threshold must be between 0.5 and 1")
+    return threshold
+
+
+def build_consensus(counter: BipartitionCounter, method: str = "majority",
+                    threshold: Optional[float] = None) -> CompactTree:
+    """Build the consensus tree of the counted trees
+
+    Majority-rule keeps splits found in more than ``threshold`` of the trees
+    (at least half, so the kept splits are compatible); strict, like a
+    threshold of 1, keeps splits found in every tree. Internal nodes carry the fraction of trees
+    supporting them and the mean length of their branch. The tree is rooted
+    on the side of the first leaf.
+    """
+    threshold = consensus_threshold(method, threshold)
+    if counter.num_trees == 0:
+        raise ValueError("No trees to build a consensus from")
+
+    counted = counter.counts()
+    if threshold == 1.0:
+        keep = counted["counts"] == counter.num_trees
+    else:
+        keep = counted["counts"] > threshold * counter.num_trees
+    clades = keys_to_clades(counted["keys"][keep], counter.n_words)
+    support = counted["counts"][keep] / counter.num_trees
+    lengths = counted["mean_lengths"][keep]
+
+    # Laminar splits: placing them largest first, each split's parent is the
+    # current owner of its leaves
+    membership = clade_membership(clades, counter.n_leaves)
+    order = np.argsort(-membership.sum(axis=1), kind="stable")
+    n_clades = len(order)
+    owner = np.zeros(counter.n_leaves, dtype=np.int64)
+    clade_parent = np.zeros(n_clades + 1, dtype=np.int64)
+    for position, split in enumerate(order, start=1):
+        members = membership[split]
+        clade_parent[position] = owner[members][0]
+        owner[members] = position
+
+    # Nodes: root, clades (largest first), then leaves; renumber in preorder
+    parent = np.concatenate(([-1], clade_parent[1:], owner))
+    names = [""] * (n_clades + 1) + counter.leaf_names
+    branch_lengths = np.concatenate(([0.0], lengths[order], counter.mean_leaf_lengths()))
+    node_support = np.concatenate(([np.nan], support[order], np.full(counter.n_leaves, np.nan)))
+
+    children: List[List[int]] = [[] for _ in range(len(parent))]
+    for node in range(1, len(parent)):
+        children[parent[node]].append(node)
+    preorder = []
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        preorder.append(node)
+        stack.extend(reversed(children[node]))
+    preorder = np.array(preorder, dtype=np.int64)
+    rank = np.empty_like(preorder)
+    rank[preorder] = np.arange(len(preorder))
+
+    new_parent = np.where(parent[preorder] >= 0, rank[np.maximum(parent[preorder], 0)], -1)
+    return CompactTree(new_parent, [names[node] for node in preorder],
+                       branch_lengths[preorder], node_support[preorder])
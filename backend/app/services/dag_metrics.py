@@ -0,0 +1,115 @@
+from itertools import islice
+from typing import Dict, Any, List
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+from .progress import report_progress
+
+# Cycles listed when a hierarchy is not a DAG
+DEFAULT_MAX_CYCLES = 10
+
+
+def _adjacency(sources: np.ndarray, targets: np.ndarray, n: int) -> sp.csr_matrix:
+    return sp.csr_matrix((np.ones(len(sources), dtype=np.int8), (sources, targets)), shape=(n, n))
+
+
+def _neighbours(adjacency: sp.csr_matrix, nodes: np.ndarray) -> np.ndarray:
+    """Concatenated CSR rows of ``nodes`` (one entry per edge)"""
+    starts = adjacency.indptr[nodes]
+    counts = adjacency.indptr[nodes + 1] - starts
+    if not counts.sum():
+        return np.zeros(0, dtype=adjacency.indices.dtype)
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    return adjacency.indices[np.arange(counts.sum()) + offsets]
+
+
+def longest_path_levels(adjacency: sp.csr_matrix) -> np.ndarray:
+    """Longest path length from any source node (no incoming edge) to each
+    node by Kahn's algorithm, one frontier per level: every edge is visited
+    once, so this is O(V + E). Nodes on or below a cycle keep -1."""
+    n = adjacency.shape[0]
+    remaining = np.bincount(adjacency.indices, minlength=n)
+    level = np.full(n, -1, dtype=np.int64)
+    frontier = np.flatnonzero(remaining == 0)
+    depth = 0
+    while len(frontier):
+        level[frontier] = depth
+        targets = _neighbours(adjacency, frontier)
+        remaining -= np.bincount(targets, minlength=n)
+        candidates = np.unique(targets)
+        frontier = candidates[remaining[candidates] == 0]
+        depth += 1
+    return level
+
+
+def shortest_path_levels(adjacency: sp.csr_matrix, starts: np.ndarray) -> np.ndarray:
+    """Multi-source BFS distance from ``starts`` (-1 when unreachable)"""
+    n = adjacency.shape[0]
+    level = np.full(n, -1, dtype=np.int64)
+    frontier = np.asarray(starts, dtype=np.int64)
+    depth = 0
+    while len(frontier):
+        level[frontier] = depth
+        candidates = np.unique(_neighbours(adjacency, frontier))
+        frontier = candidates[level[candidates] < 0]
+        depth += 1
+    return level
+
+
+def hierarchy_metrics(children: np.ndarray, parents: np.ndarray, n: int,
+                      max_cycles: int = DEFAULT_MAX_CYCLES) -> Dict[str, Any]:
+    """Root distances, heights, level histograms and cycles of a hierarchy
+
+    Nodes are ``0..n-1`` and each ``children[i] -> parents[i]`` edge is an
+    is-a link. Depth is the longest path from a root (node without
+    parents), level the shortest one, and height the longest path down to
+    a leaf. All three are frontier-by-frontier dynamic programs in O(V + E).
+    Cycles are only searched inside strongly connected components of the
+    nodes the topological pass could not order, and at most
+    ``max_cycles`` are enumerated.
+    """
+    down = _adjacency(parents, children, n)
+    up = _adjacency(children, parents, n)
+
+    roots = np.flatnonzero(np.diff(up.indptr) == 0)
+    leaves = np.flatnonzero(np.diff(down.indptr) == 0)
+    depth = longest_path_levels(down)
+    report_progress(0.3, "depths")
+    height = longest_path_levels(up)
+    report_progress(0.6, "heights")
+    level = shortest_path_levels(down, roots)
+    report_progress(0.8, "levels")
+
+    unordered = np.flatnonzero(depth < 0)
+    cyclic = np.zeros(0, dtype=np.int64)
+    cycles: List[List[int]] = []
+    if len(unordered):
+        sub = down[unordered][:, unordered]
+        _, labels = connected_components(sub, directed=True, connection="strong")
+        sizes = np.bincount(labels)
+        self_loops = sub.diagonal() > 0
+        in_cycle = (sizes[labels] > 1) | self_loops
+        cyclic = unordered[in_cycle]
+        if max_cycles > 0 and len(cyclic):
+            graph = nx.DiGraph()
+            graph.add_edges_from(zip(*up[cyclic][:, cyclic].nonzero()))
+            for cycle in islice(nx.simple_cycles(graph), max_cycles):
+                cycles.append([int(cyclic[node]) for node in cycle])
+                report_progress(0.8 + 0.2 * len(cycles) / max_cycles, "cycles")
+
+    ordered = depth >= 0
+    return {
+        "roots": roots,
+        "leaves": leaves,
+        "depth": depth,
+        "height": height,
+        "level": level,
+        "max_depth": int(depth.max()) if ordered.any() else 0,
+        "depth_histogram": np.bincount(depth[ordered]).tolist() if ordered.any() else [],
+        "level_histogram": np.bincount(level[level >= 0]).tolist() if (level >= 0).any() else [],
+        "cyclic_nodes": cyclic,
+        "cycles": cycles
+    }
@@ -0,0 +1,214 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Hashable, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from .analysis_cache import dataset_hash
+from .progress import report_progress
+from .sparse_graph import SparseGraph, sparse_graphs
+
+PREDICTION_METHODS = ("voting", "rwr")
+
+# Node types and relationship types that mark functional annotations
+FUNCTION_TYPES = ("Function", "MolecularFunction", "BiologicalProcess", "CellularComponent")
+FUNCTION_RELATIONSHIPS = ("hasFunction", "participatesIn", "involved_in", "enables",
+                          "function", "process", "component")
+
+# Probability of jumping back to the query node at each random-walk step
+DEFAULT_RESTART = 0.3
+
+# Random walks (or propagated annotation columns) iterated together as one
+# dense block
+RWR_BLOCK_SIZE = 256
+
+DEFAULT_TOP_K = 10
+
+# Function indexes kept in memory, least recently used dropped first
+MAX_FUNCTION_INDEXES = 8
+
+
+def _is_function_type(value: str) -> bool:
+    return any(ftype in value for ftype in FUNCTION_TYPES)
+
+
+class FunctionIndex:
+    """Annotation matrix and weighted adjacency of a dataset
+
+    Annotations are edges to function nodes (by node type or the edge's
+    ``target_type``) or edges of a functional relationship type. They
+    form a sparse ``nodes x functions`` matrix over the node numbering of
+    the dataset's SparseGraph; the adjacency is the undirected graph
+    weighted by each edge's ``weight`` (default 1).
+    """
+
+    def __init__(self, data: Dict[str, Any], graph: Optional[SparseGraph] = None):
+        self.graph = graph if graph is not None else SparseGraph.from_data(data)
+        n = self.graph.n_nodes
+        node_map = {node["id"]: node for node in data["nodes"]}
+        self.function_nodes = np.zeros(n, dtype=bool)
+        for node_id, node in node_map.items():
+            if _is_function_type(node.get("type", "")):
+                self.function_nodes[self.graph.node_index[node_id]] = True
+
+        edges = data["edges"]
+        weights = np.fromiter((float(edge.get("weight", 1.0)) for edge in edges), dtype=np.float64, count=len(edges))
+        sources, targets = self.graph.sources, self.graph.targets
+        weighted = sp.csr_matrix((weights, (sources, targets)), shape=(n, n))
+        self.adjacency = (weighted + weighted.T).tocsr()
+
+        annotation_edge = self.function_nodes[targets] | np.fromiter(
+            (_is_function_type(edge.get("target_type", "")) or edge.get("type") in FUNCTION_RELATIONSHIPS
+             for edge in edges), dtype=bool, count=len(edges))
+        self.function_ids, columns = np.unique(targets[annotation_edge], return_inverse=True)
+        self.annotations = sp.csr_matrix(
+            (np.ones(len(columns)), (sources[annotation_edge], columns)), shape=(n, len(self.function_ids))
+        )
+        self.annotations.data[:] = 1.0
+        self.function_labels = [node_map.get(self.graph.node_ids[i], {}).get("label", "Unknown Function")
+                                for i in self.function_ids]
+        self.annotated = np.diff(self.annotations.indptr) > 0
+
+    def unannotated_entities(self) -> np.ndarray:
+        """Nodes that are neither functions nor annotated with one"""
+        return np.flatnonzero(~self.annotated & ~self.function_nodes)
+
+    def voting_scores(self, targets: np.ndarray) -> sp.csr_matrix:
+        """Weighted neighbour votes: the share of each target's edge weight
+        going to neighbours annotated with each function"""
+        rows = self.adjacency[targets]
+        strength = np.asarray(rows.sum(axis=1)).ravel()
+        scale = sp.diags(np.where(strength > 0, 1.0 / np.where(strength > 0, strength, 1.0), 0.0))
+        return (scale @ rows @ self.annotations).tocsr()
+
+    def _transition(self) -> sp.csr_matrix:
+        """Column-stochastic random-walk matrix of the weighted adjacency"""
+        strength = np.asarray(self.adjacency.sum(axis=0)).ravel()
+        inverse = np.where(strength > 0, 1.0 / np.where(strength > 0, strength, 1.0), 0.0)
+        return (self.adjacency @ sp.diags(inverse)).tocsr()
+
+    def rwr_scores(self, targets: np.ndarray, restart: float = DEFAULT_RESTART,
+                   tol: float = 1e-6, max_iter: int = 100) -> sp.csr_matrix:
+        """Random walk with restart from each target, summed per function
+        over the annotated nodes it visits (the target itself excluded)
+        and normalised by the visits of all annotated nodes
+
+        With walk matrix ``R = r (I - (1 - r) P)^-1`` the scores are
+        ``R[:, t]^T A``. For few targets the walks themselves are iterated,
+        a block of targets at a time as one dense matrix. When there are
+        more targets than functions, and none of them is annotated, the
+        annotation columns are propagated instead, ``Z = r A + (1 - r) P^T
+        Z``, so the work scales with the number of functions.
+        """
+        n = self.graph.n_nodes
+        transition = self._transition()
+        n_functions = len(self.function_ids)
+        # The annotated-node indicator is propagated as an extra column
+        columns = sp.hstack((self.annotations, sp.csr_matrix(self.annotated.astype(np.float64)[:, None]))).tocsr()
+
+        if len(targets) > n_functions + 1 and not self.annotated[targets].any():
+            backward = transition.T.tocsr()
+            propagated = np.zeros((len(targets), n_functions + 1))
+            for start in range(0, n_functions + 1, RWR_BLOCK_SIZE):
+                seeds = restart * columns[:, start:start + RWR_BLOCK_SIZE].toarray()
+                scores = seeds.copy()
+                for _ in range(max_iter):
+                    previous = scores
+                    scores = (1 - restart) * (backward @ scores) + seeds
+                    if np.abs(scores - previous).max() < tol:
+                        break
+                propagated[:, start:start + seeds.shape[1]] = scores[targets]
+                report_progress((start + seeds.shape[1]) / (n_functions + 1), "random walks")
+            totals = propagated[:, -1]
+            return sp.csr_matrix(propagated[:, :-1] / np.where(totals > 0, totals, 1.0)[:, None])
+
+        columns_t = columns.T.tocsr()
+        blocks = []
+        for start in range(0, len(targets), RWR_BLOCK_SIZE):
+            block = targets[start:start + RWR_BLOCK_SIZE]
+            block_columns = np.arange(len(block))
+            seeds = np.zeros((n, len(block)))
+            seeds[block, block_columns] = restart
+            visits = seeds.copy()
+            for _ in range(max_iter):
+                previous = visits
+                visits = (1 - restart) * (transition @ visits) + seeds
+                if np.abs(visits - previous).max() < tol:
+                    break
+            visits[block, block_columns] = 0.0
+            scores = (columns_t @ visits).T
+            totals = scores[:, -1]
+            blocks.append(sp.csr_matrix(scores[:, :-1] / np.where(totals > 0, totals, 1.0)[:, None]))
+            report_progress((start + len(block)) / len(targets), "random walks")
+        if not blocks:
+            return sp.csr_matrix((0, n_functions))
+        return sp.vstack(blocks).tocsr()
+
+    def predict(self, targets: np.ndarray, method: str = "voting", top_k: int = DEFAULT_TOP_K,
+                restart: float = DEFAULT_RESTART) -> List[List[Dict[str, Any]]]:
+        """Top ``top_k`` functions of each target node with their confidence
+        (the normalised score, between 0 and 1)"""
+        if method not in PREDICTION_METHODS:
+            raise ValueError(f"Unsupported prediction method: {method}. Use one of: {', '.join(PREDICTION_METHODS)}")
+        if not 0 < restart < 1:
+            raise ValueError("restart must be between 0 and 1")
+        targets = np.asarray(targets, dtype=np.int64)
+        scores = self.voting_scores(targets) if method == "voting" else self.rwr_scores(targets, restart)
+
+        predictions = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            values, functions = scores.data[start:end], scores.indices[start:end]
+            keep = values > 0
+            values, functions = values[keep], functions[keep]
+            # Highest scores first, ties broken by function order
+            order = np.lexsort((functions, -values))[:top_k]
+            predictions.append([{
+                "function_id": self.graph.node_ids[self.function_ids[function]],
+                "function_label": self.function_labels[function],
+                "confidence": float(value)
+            } for function, value in zip(functions[order].tolist(), values[order].tolist())])
+        return predictions
+
+    def predict_node(self, node_id: Hashable, method: str = "voting", top_k: int = DEFAULT_TOP_K,
+                     restart: float = DEFAULT_RESTART) -> List[Dict[str, Any]]:
+        """Predictions for one node, raising KeyError if it is unknown"""
+        return self.predict(np.array([self.graph.node_index[node_id]]), method, top_k, restart)[0]
+
+    def predict_unannotated(self, method: str = "voting", top_k: int = DEFAULT_TOP_K,
+                            restart: float = DEFAULT_RESTART) -> Dict[Hashable, List[Dict[str, Any]]]:
+        """Predictions for every unannotated entity in one batch, keyed by
+        node ID (nodes without any scored function are left out)"""
+        targets = self.unannotated_entities()
+        predictions = self.predict(targets, method, top_k, restart)
+        return {self.graph.node_ids[target]: prediction
+                for target, prediction in zip(targets.tolist(), predictions) if prediction}
+
+
+class FunctionIndexCache:
+    """Function indexes of recently analysed datasets"""
+
+    def __init__(self, max_indexes: int = MAX_FUNCTION_INDEXES):
+        self.max_indexes = max_indexes
+        self._indexes: "OrderedDict[Hashable, FunctionIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, data: Dict[str, Any]) -> FunctionIndex:
+        """Return the index of a dataset, building it once per dataset
+        (recognised like in SparseGraphCache by content hash)"""
+        key = dataset_hash(data)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        index = FunctionIndex(data, sparse_graphs.get(data))
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        return index
+
+
+function_indexes = FunctionIndexCache()
@@ -0,0 +1,131 @@
+import logging
+import os
+import re
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from .tree_cache import CachedTree, TreeCache, tree_cache
+
+logger = logging.getLogger(__name__)
+
+# OrthoFinder names gene tree files "<orthogroup>_tree.txt"
+_TREE_FILE_PATTERN = re.compile(r"^(?P<orthogroup>[^.]+?)(?:_tree)?\.(?:txt|nwk|newick|tre|tree)$")
+_INDEX_SUFFIX = ".idx"
+
+
+class GeneTreeStore:
+    """Lazy access to one gene tree per orthogroup
+
+    ``path`` is either an OrthoFinder ``Gene_Trees`` directory (one Newick
+    file per orthogroup) or a concatenated archive with one
+    ``<orthogroup><TAB><newick>`` line per tree. Only an index is built up
+    front: file names for a directory, byte offsets for an archive (saved
+    next to it as ``<archive>.idx`` and reused while the archive is
+    unchanged). A tree is read and parsed when first requested and then
+    lives in the shared tree cache.
+    """
+
+    def __init__(self, path: str, cache: TreeCache = tree_cache):
+        self.path = path
+        self.cache = cache
+        self._index: Optional[Dict[str, Tuple[str, int, int]]] = None
+        self._tree_ids: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return os.path.exists(self.path)
+
+    @property
+    def index(self) -> Dict[str, Tuple[str, int, int]]:
+        """Orthogroup -> (file, offset, length); length -1 reads the whole file"""
+        with self._lock:
+            if self._index is None:
+                if os.path.isdir(self.path):
+                    self._index = self._index_directory()
+                elif os.path.isfile(self.path):
+                    self._index = self._load_archive_index() or self._index_archive()
+                else:
+                    raise FileNotFoundError(f"Gene trees not found at {self.path}")
+                logger.info(f"Indexed {len(self._index)} gene trees in {self.path}")
+            return self._index
+
+    def _index_directory(self) -> Dict[str, Tuple[str, int, int]]:
+        index = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                match = _TREE_FILE_PATTERN.match(entry.name)
+                if match and entry.is_file():
+                    index[match.group("orthogroup")] = (entry.path, 0, -1)
+        return index
+
+    def _archive_signature(self) -> str:
+        stat = os.stat(self.path)
+        return f"#size={stat.st_size}\tmtime={int(stat.st_mtime)}"
+
+    def _index_archive(self) -> Dict[str, Tuple[str, int, int]]:
+        """Scan the archive once, recording where each tree's Newick starts"""
+        index = {}
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                separator = line.find(b"\t")
+                if separator > 0:
+                    orthogroup = line[:separator].decode("utf-8").strip()
+                    start = offset + separator + 1
+                    index[orthogroup] = (self.path, start, len(line.rstrip(b"\r\n")) - separator - 1)
+                offset += len(line)
+
+        try:
+            with open(self.path + _INDEX_SUFFIX, "w") as f:
+                f.write(self._archive_signature() + "\n")
+                for orthogroup, (_, start, length) in index.items():
+                    f.write(f"{orthogroup}\t{start}\t{length}\n")
+        except OSError as e:
+            logger.warning(f"Could not save gene tree index: {str(e)}")
+        return index
+
+    def _load_archive_index(self) -> Optional[Dict[str, Tuple[str, int, int]]]:
+        """Reuse a saved offset index if the archive has not changed"""
+        try:
+            with open(self.path + _INDEX_SUFFIX) as f:
+                if f.readline().rstrip("\n") != self._archive_signature():
+                    return None
+                index = {}
+                for line in f:
+                    orthogroup, start, length = line.rstrip("\n").split("\t")
+                    index[orthogroup] = (self.path, int(start), int(length))
+                return index
+        except (OSError, ValueError):
+            return None
+
+    def read_newick(self, orthogroup_id: str) -> str:
+        """Read the Newick string of one orthogroup, raising KeyError if absent"""
+        path, offset, length = self.index[orthogroup_id]
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read() if length < 0 else f.read(length)
+        return data.decode("utf-8").strip()
+
+    def get(self, orthogroup_id: str) -> CachedTree:
+        """Return the cached gene tree of an orthogroup, loading it on demand"""
+        tree_id = self._tree_ids.get(orthogroup_id)
+        if tree_id is not None:
+            try:
+                return self.cache.get(tree_id)
+            except KeyError:
+                pass
+        entry = self.cache.put(self.read_newick(orthogroup_id))
+        self._tree_ids[orthogroup_id] = entry.tree_id
+        return entry
+
+    def summary(self) -> Dict[str, Any]:
+        """Location and size of the store"""
+        if not self.available:
+            return {"path": self.path, "available": False, "kind": None, "orthogroup_count": 0}
+        return {
+            "path": self.path,
+            "available": True,
+            "kind": "directory" if os.path.isdir(self.path) else "archive",
+            "orthogroup_count": len(self.index)
+        }
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.special import gammaln
+
+from .analysis_cache import dataset_hash
+from .function_prediction import FunctionIndex
+from .go_similarity import GODag, ancestor_closure
+
+# Default false discovery rate of reported terms
+DEFAULT_FDR = 0.05
+
+# Study genes a term needs to be reported
+DEFAULT_MIN_COUNT = 2
+
+# Propagated annotation matrices kept in memory, least recently used dropped first
+MAX_ENRICHMENT_INDEXES = 16
+
+# Relative size of a probability term at which a decreasing tail sum stops
+TAIL_TOLERANCE = 1e-16
+
+
+def _log_hypergeom_pmf(k: np.ndarray, population: float, successes: np.ndarray, draws: float) -> np.ndarray:
+    return (gammaln(successes + 1) - gammaln(k + 1) - gammaln(successes - k + 1)
+            + gammaln(population - successes + 1) - gammaln(draws - k + 1)
+            - gammaln(population - successes - draws + k + 1)
+            - gammaln(population + 1) + gammaln(draws + 1) + gammaln(population - draws + 1))
+
+
+def hypergeometric_sf(k: np.ndarray, population: int, successes: np.ndarray, draws: int) -> np.ndarray:
+    """``P(X >= k)`` for hypergeometric ``X`` (``draws`` out of
+    ``population`` with ``successes`` successes), for arrays of ``k`` and
+    ``successes``
+
+    Above the mode the tail is summed upwards from ``P(X = k)``, otherwise
+    ``1 - P(X <= k - 1)`` is summed downwards, so each sum starts at its
+    largest term and walks the pmf ratio until the terms are negligible.
+    All terms advance together, one vectorised step per count; scipy's
+    ``hypergeom.sf`` evaluates them one by one.
+    """
+    k = np.asarray(k, dtype=np.float64)
+    successes = np.asarray(successes, dtype=np.float64)
+    population, draws = float(population), float(draws)
+    lowest = np.maximum(0.0, draws - (population - successes))
+    highest = np.minimum(successes, draws)
+    upper = k > np.floor((draws + 1) * (successes + 1) / (population + 2))
+    current = np.where(upper, k, k - 1)
+    valid = upper | (current >= lowest)
+    term = np.zeros(len(k))
+    term[valid] = np.exp(_log_hypergeom_pmf(current[valid], population, successes[valid], draws))
+    total = term.copy()
+    active = valid & np.where(upper, current < highest, current > lowest)
+    while active.any():
+        rows = np.flatnonzero(active)
+        j, good, up = current[rows], successes[rows], upper[rows]
+        bad = population - good
+        ratio = np.where(up, (good - j) * (draws - j) / ((j + 1) * (bad - draws + j + 1)),
+                         j * (bad - draws + j) / ((good - j + 1) * (draws - j + 1)))
+        term[rows] *= ratio
+        total[rows] += term[rows]
+        current[rows] = j + np.where(up, 1, -1)
+        active[rows] = (np.where(up, current[rows] < highest[rows], current[rows] > lowest[rows])
+                        & (term[rows] > total[rows] * TAIL_TOLERANCE))
+    return np.clip(np.where(upper, total, 1 - total), 0.0, 1.0)
+
+
+def benjamini_hochberg(p_values: np.ndarray, n_tests: Optional[int] = None) -> np.ndarray:
+    """Benjamini-Hochberg adjusted p-values
+
+    ``n_tests`` counts tests left out of ``p_values`` because their
+    p-value is 1 (they rank last, so they only change the scaling).
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    n_tests = len(p_values) if n_tests is None else n_tests
+    order = np.argsort(p_values, kind="stable")
+    ranked = p_values[order] * n_tests / np.arange(1, len(p_values) + 1)
+    ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    adjusted = np.empty_like(ranked)
+    adjusted[order] = np.minimum(ranked, 1.0)
+    return adjusted
+
+
+class EnrichmentIndex:
+    """True-path propagated annotations of a gene population
+
+    ``matrix`` is a sparse ``genes x terms`` 0/1 matrix in which a gene
+    annotated with a term is also annotated with all its ancestors. Only
+    genes with an annotation and terms annotated to at least one gene are
+    kept, so the population counts of every column are positive.
+    """
+
+    def __init__(self, gene_ids: List[Hashable], matrix: sp.csr_matrix, term_ids: List[str],
+                 term_names: List[str], term_namespaces: List[str]):
+        self.gene_ids = gene_ids
+        self.gene_index = {gene_id: i for i, gene_id in enumerate(gene_ids)}
+        self.matrix = matrix
+        self.term_ids = term_ids
+        self.term_names = term_names
+        self.term_namespaces = np.array(term_namespaces, dtype=object)
+        self.population_counts = np.asarray(matrix.sum(axis=0)).ravel()
+
+    @classmethod
+    def _from_propagated(cls, gene_ids: List[Hashable], propagated: sp.csr_matrix, term_ids: List[str],
+                         term_names: List[str], term_namespaces: List[str]) -> "EnrichmentIndex":
+        """Drop unannotated genes and unused terms of a propagated matrix"""
+        propagated = propagated.tocsr()
+        propagated.data[:] = 1
+        propagated.eliminate_zeros()
+        genes = np.flatnonzero(np.diff(propagated.indptr))
+        terms = np.flatnonzero(np.asarray(propagated.sum(axis=0)).ravel())
+        matrix = propagated[genes][:, terms].astype(np.int32).tocsr()
+        return cls([gene_ids[i] for i in genes], matrix, [term_ids[i] for i in terms],
+                   [term_names[i] for i in terms], [term_namespaces[i] for i in terms])
+
+    @classmethod
+    def from_go(cls, dag: GODag, annotations: Dict[str, List[str]]) -> "EnrichmentIndex":
+        """Index of a gene -> GO terms table, propagated over the GO closure"""
+        gene_ids = list(annotations)
+        rows = [dag.term_indices(terms) for terms in annotations.values()]
+        indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        indptr = np.concatenate(([0], np.cumsum([len(row) for row in rows])))
+        direct = sp.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr),
+                               shape=(len(gene_ids), dag.n_terms))
+        return cls._from_propagated(gene_ids, direct @ dag.closure, dag.term_ids, dag.names, dag.namespaces)
+
+    @classmethod
+    def from_dataset(cls, data: Dict[str, Any], index: FunctionIndex) -> "EnrichmentIndex":
+        """Index of a dataset's functional annotations (as found by the
+        function index), propagated over its subClassOf hierarchy"""
+        graph = index.graph
+        n = graph.n_nodes
+        is_subclass = (graph.edge_types == "subClassOf") & (graph.sources != graph.targets)
+        up = sp.csr_matrix((np.ones(int(is_subclass.sum()), dtype=np.int32),
+                            (graph.sources[is_subclass], graph.targets[is_subclass])), shape=(n, n))
+        closure, _ = ancestor_closure(up)
+        columns = sp.csr_matrix((np.ones(len(index.function_ids), dtype=np.int32),
+                                 (np.arange(len(index.function_ids)), index.function_ids)),
+                                shape=(len(index.function_ids), n))
+        # Function nodes (linked to their parents) are not part of the population
+        genes = sp.diags((~index.function_nodes).astype(np.int32), dtype=np.int32)
+        direct = genes @ index.annotations.astype(np.int32) @ columns
+
+        node_map = {node["id"]: node for node in data["nodes"]}
+        names, namespaces = [], []
+        for node_id in graph.node_ids:
+            node = node_map.get(node_id, {})
+            properties = node.get("properties", {})
+            names.append(node.get("label", str(node_id)))
+            namespaces.append(properties.get("hasOBONamespace") or properties.get("has_obo_namespace")
+                              or node.get("type", "Unknown"))
+        return cls._from_propagated(graph.node_ids, direct @ closure, [str(node_id) for node_id in graph.node_ids],
+                                    names, namespaces)
+
+    @property
+    def population_size(self) -> int:
+        return len(self.gene_ids)
+
+    def enrich(self, study_genes: Iterable[Hashable], alpha: Optional[float] = DEFAULT_FDR,
+               min_count: int = DEFAULT_MIN_COUNT, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """Over-representation of every term in a study gene set
+
+        The study counts of all terms come from one sparse row sum, and
+        their one-sided hypergeometric p-values (Fisher's exact test for
+        over-representation) from one vectorised ``hypergeometric_sf`` call.
+        Every population term (of ``namespace``) is a test in the
+        Benjamini-Hochberg correction; terms below ``min_count`` study
+        genes or above ``alpha`` FDR (unless None) are not reported.
+        Study genes outside the annotated population are listed apart.
+        """
+        if alpha is not None and not 0 < alpha <= 1:
+            raise ValueError("The FDR threshold must be between 0 and 1")
+        study_genes = list(dict.fromkeys(study_genes))
+        rows = np.array([self.gene_index[gene] for gene in study_genes if gene in self.gene_index], dtype=np.int64)
+        unknown = [gene for gene in study_genes if gene not in self.gene_index]
+        study = self.matrix[rows]
+        study_size, population_size = len(rows), self.population_size
+
+        tested = np.ones(len(self.term_ids), dtype=bool)
+        if namespace is not None:
+            tested = self.term_namespaces == namespace
+        counts = np.asarray(study.sum(axis=0)).ravel()
+        # Terms without study genes have p = 1 and only count as tests
+        candidates = np.flatnonzero(tested & (counts > 0))
+        population_counts = self.population_counts[candidates]
+        p_values = hypergeometric_sf(counts[candidates], population_size, population_counts, study_size)
+        fdr = benjamini_hochberg(p_values, int(tested.sum()))
+
+        keep = counts[candidates] >= min_count
+        if alpha is not None:
+            keep &= fdr <= alpha
+        order = np.lexsort((candidates[keep], p_values[keep]))
+        reported = candidates[keep][order]
+        members = study[:, reported].tocsc()
+        results = []
+        for position, (term, p_value, q_value) in enumerate(zip(
+                reported.tolist(), p_values[keep][order].tolist(), fdr[keep][order].tolist())):
+            study_count, population_count = int(counts[term]), int(self.population_counts[term])
+            genes = rows[members.indices[members.indptr[position]:members.indptr[position + 1]]]
+            results.append({
+                "term_id": self.term_ids[term],
+                "name": self.term_names[term],
+                "namespace": self.term_namespaces[term],
+                "study_count": study_count,
+                "population_count": population_count,
+                "fold_enrichment": (study_count / study_size) / (population_count / population_size),
+                "p_value": p_value,
+                "fdr": q_value,
+                "genes": [self.gene_ids[gene] for gene in np.sort(genes).tolist()]
+            })
+        return {
+            "study_size": study_size,
+            "population_size": population_size,
+            "unknown_genes": unknown,
+            "tested_terms": int(tested.sum()),
+            "alpha": alpha,
+            "results": results
+        }
+
+
+class EnrichmentIndexCache:
+    """Enrichment indexes of recently used species annotation tables and
+    datasets
+
+    Species indexes are keyed by ontology and species and remember the
+    digest of their annotation table: a request repeating the table (or
+    omitting it) reuses the propagated matrix, a changed table rebuilds it.
+    """
+
+    def __init__(self, max_indexes: int = MAX_ENRICHMENT_INDEXES):
+        self.max_indexes = max_indexes
+        self._indexes: "OrderedDict[Tuple[Hashable, ...], Tuple[Optional[str], EnrichmentIndex]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: Tuple[Hashable, ...], digest: Optional[str],
+             build: Callable[[], EnrichmentIndex]) -> EnrichmentIndex:
+        with self._lock:
+            entry = self._indexes.get(key)
+            if entry is not None and entry[0] == digest:
+                self._indexes.move_to_end(key)
+                return entry[1]
+        index = build()
+        with self._lock:
+            self._indexes[key] = (digest, index)
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        return index
+
+    def species_index(self, dag: GODag, species: Optional[str],
+                      annotations: Optional[Dict[str, List[str]]] = None) -> EnrichmentIndex:
+        """Index of a species' gene annotations, raising KeyError when no
+        table is given and none is cached for the species"""
+        key = ("go", dag.ontology_id, species)
+        if annotations is None:
+            with self._lock:
+                entry = self._indexes[key]
+                self._indexes.move_to_end(key)
+                return entry[1]
+        digest = hashlib.sha1(json.dumps(annotations, sort_keys=True).encode("utf-8")).hexdigest()
+        return self._get(key, digest, lambda: EnrichmentIndex.from_go(dag, annotations))
+
+    def dataset_index(self, data: Dict[str, Any], index: FunctionIndex) -> EnrichmentIndex:
+        """Index of a dataset (recognised like in SparseGraphCache by
+        content hash)"""
+        key = ("dataset", dataset_hash(data))
+        return self._get(key, None, lambda: EnrichmentIndex.from_dataset(data, index))
+
+
+enrichment_indexes = EnrichmentIndexCache()
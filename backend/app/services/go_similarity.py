@@ -0,0 +1,508 @@
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from .dag_metrics import longest_path_levels
+from .progress import report_progress
+
+SIMILARITY_MEASURES = ("resnik", "lin", "jc")
+IC_SOURCES = ("annotation", "intrinsic")
+
+# Relationships followed to ancestors (is_a plus part_of, as in most GO tools)
+DEFAULT_RELATIONSHIPS = ("is_a", "part_of")
+
+# Bytes of ANDed ancestor bitsets held at once when finding common ancestors
+BITSET_CHUNK_BYTES = 64 * 1024 * 1024
+
+# Entities compared per block of the all-pairs similarity
+PAIR_BLOCK_SIZE = 512
+
+# Largest entity set whose full similarity matrix is returned by the API
+MAX_SIMILARITY_MATRIX = 2000
+
+# Ontologies and annotation corpora kept in memory
+MAX_GO_ONTOLOGIES = 4
+MAX_GO_CORPORA = 8
+
+_GO_ID = re.compile(r"GO[:_](\d{7})")
+
+
+def normalize_go_id(value: str) -> Optional[str]:
+    """``GO:0008150`` for any GO ID or OBO PURL form, None for other IDs"""
+    match = _GO_ID.search(value)
+    return f"GO:{match.group(1)}" if match else None
+
+
+def ancestor_closure(up: sp.csr_matrix) -> Tuple[sp.csr_matrix, np.ndarray]:
+    """Ancestor closure and depth of the DAG with ``up[child, parent]`` edges
+
+    The closure is a sparse 0/1 matrix whose row ``t`` marks ``t`` and all
+    its ancestors. It is built one depth level at a time: the rows of a
+    level are its parents' finished rows plus itself, so each level is one
+    sparse product. Raises ValueError when the graph has cycles.
+    """
+    n = up.shape[0]
+    depth = longest_path_levels(up.T.tocsr())
+    if (depth < 0).any():
+        raise ValueError("The class hierarchy has cycles")
+    up = up.astype(np.int32)
+    closure = sp.identity(n, dtype=np.int32, format="csr")
+    for level in range(1, int(depth.max()) + 1 if n else 0):
+        nodes = np.flatnonzero(depth == level)
+        inherited = up[nodes] @ closure
+        selector = sp.csr_matrix((np.ones(len(nodes), dtype=np.int32), (nodes, np.arange(len(nodes)))),
+                                 shape=(n, len(nodes)))
+        closure = (closure + selector @ inherited).tocsr()
+        closure.data[:] = 1
+    return closure, depth
+
+
+def parse_obo(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    """Term stanzas of an OBO file: id, name, namespace, alt_ids,
+    obsolete flag and (relationship, parent) pairs"""
+    terms = []
+    term = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith("["):
+            term = {"id": None, "name": "", "namespace": "", "alt_ids": [], "parents": [],
+                    "obsolete": False} if line == "[Term]" else None
+            if term is not None:
+                terms.append(term)
+            continue
+        if term is None or ":" not in line:
+            continue
+        tag, value = line.split(":", 1)
+        value = value.split(" ! ", 1)[0].strip()
+        if tag == "id":
+            term["id"] = value
+        elif tag == "name":
+            term["name"] = value
+        elif tag == "namespace":
+            term["namespace"] = value
+        elif tag == "alt_id":
+            term["alt_ids"].append(value)
+        elif tag == "is_a":
+            term["parents"].append(("is_a", value.split()[0]))
+        elif tag == "relationship":
+            relationship, parent = value.split()[:2]
+            term["parents"].append((relationship, parent))
+        elif tag == "is_obsolete":
+            term["obsolete"] = value == "true"
+    return [term for term in terms if term["id"]]
+
+
+class GODag:
+    """GO terms with their ancestor closure (see ``ancestor_closure``)"""
+
+    def __init__(self, term_ids: List[str], names: List[str], namespaces: List[str],
+                 children: np.ndarray, parents: np.ndarray, alt_ids: Optional[Dict[str, str]] = None):
+        self.term_ids = term_ids
+        self.names = names
+        self.namespaces = namespaces
+        self.index = {term_id: i for i, term_id in enumerate(term_ids)}
+        for alt_id, term_id in (alt_ids or {}).items():
+            self.index.setdefault(alt_id, self.index[term_id])
+        n = len(term_ids)
+        self.n_edges = len(children)
+
+        up = sp.csr_matrix((np.ones(len(children), dtype=np.int32), (children, parents)), shape=(n, n))
+        self.closure, self.depth = ancestor_closure(up)
+        self.roots = np.flatnonzero(np.diff(up.indptr) == 0)
+        self.descendant_counts = np.asarray(self.closure.sum(axis=0)).ravel()
+
+    @classmethod
+    def from_obo(cls, lines: Iterable[str], relationships: Tuple[str, ...] = DEFAULT_RELATIONSHIPS) -> "GODag":
+        """Build the DAG of an OBO file, skipping obsolete terms"""
+        terms = [term for term in parse_obo(lines) if not term["obsolete"]]
+        index = {term["id"]: i for i, term in enumerate(terms)}
+        edges = [(i, index[parent]) for i, term in enumerate(terms)
+                 for relationship, parent in term["parents"]
+                 if relationship in relationships and parent in index]
+        children, parents = (np.array(column, dtype=np.int64) for column in zip(*edges)) if edges else (
+            np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        alt_ids = {alt_id: term["id"] for term in terms for alt_id in term["alt_ids"]}
+        return cls([term["id"] for term in terms], [term["name"] for term in terms],
+                   [term["namespace"] for term in terms], children, parents, alt_ids)
+
+    @classmethod
+    def from_dataset(cls, data: Dict[str, Any]) -> "GODag":
+        """Build the DAG of a GO OWL/RDF dataset from DataIngestionService:
+        GO class nodes and their subClassOf edges"""
+        terms = {}
+        for node in data["nodes"]:
+            term_id = normalize_go_id(str(node["id"]))
+            properties = node.get("properties", {})
+            if term_id is None or str(properties.get("deprecated", "")).lower() == "true":
+                continue
+            namespace = properties.get("hasOBONamespace") or properties.get("has_obo_namespace") or ""
+            terms.setdefault(term_id, (node.get("label") or term_id, namespace))
+        index = {term_id: i for i, term_id in enumerate(terms)}
+        edges = set()
+        for edge in data["edges"]:
+            if edge.get("type") != "subClassOf":
+                continue
+            child, parent = normalize_go_id(str(edge["source"])), normalize_go_id(str(edge["target"]))
+            if child in index and parent in index and child != parent:
+                edges.add((index[child], index[parent]))
+        edges = sorted(edges)
+        children = np.array([edge[0] for edge in edges], dtype=np.int64)
+        parents = np.array([edge[1] for edge in edges], dtype=np.int64)
+        return cls(list(terms), [value[0] for value in terms.values()], [value[1] for value in terms.values()],
+                   children, parents)
+
+    @property
+    def n_terms(self) -> int:
+        return len(self.term_ids)
+
+    @property
+    def ontology_id(self) -> str:
+        """Content address of the term set and closure"""
+        digest = hashlib.sha1("\n".join(self.term_ids).encode("utf-8"))
+        digest.update(self.closure.indptr.tobytes())
+        digest.update(self.closure.indices.tobytes())
+        return digest.hexdigest()
+
+    def term_indices(self, term_ids: Iterable[str]) -> np.ndarray:
+        """Known terms of a list (alt IDs resolved, unknown ones dropped)"""
+        found = [self.index.get(term_id, self.index.get(normalize_go_id(term_id) or "")) for term_id in term_ids]
+        return np.unique(np.array([i for i in found if i is not None], dtype=np.int64))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "ontology_id": self.ontology_id,
+            "num_terms": self.n_terms,
+            "num_edges": self.n_edges,
+            "num_roots": len(self.roots),
+            "max_depth": int(self.depth.max()) if self.n_terms else 0,
+            "closure_size": int(self.closure.nnz)
+        }
+
+
+def _information_content(counts: np.ndarray, dag: GODag) -> np.ndarray:
+    """``-log(p)`` with ``p`` the count of a term over that of its root
+    (NaN for terms with a zero count)"""
+    root_counts = dag.closure[:, dag.roots] @ sp.diags(counts[dag.roots].astype(np.float64))
+    denominator = np.asarray(root_counts.max(axis=1).todense()).ravel()
+    ic = np.full(len(counts), np.nan)
+    known = counts > 0
+    ic[known] = -np.log(counts[known] / denominator[known])
+    return np.maximum(ic, 0.0)
+
+
+def _first_common_bits(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Position of the lowest set bit of ``left[i] & right[j]`` for every
+    pair of bitset rows (-1 where nothing is shared)"""
+    common = left[:, None, :] & right[None, :, :]
+    nonzero = common != 0
+    word = nonzero.argmax(axis=2)
+    values = np.take_along_axis(common, word[..., None], axis=2)[..., 0]
+    # Isolate the lowest set bit (two's complement) and take its position
+    lowest = values & (~values + np.uint64(1))
+    bit = np.zeros(values.shape, dtype=np.int64)
+    shared = values != 0
+    bit[shared] = np.log2(lowest[shared].astype(np.float64)).astype(np.int64)
+    return np.where(shared, word * 64 + bit, -1)
+
+
+def _apply_measure(resnik: np.ndarray, ic_first: np.ndarray, ic_second: np.ndarray,
+                   same: np.ndarray, measure: str) -> np.ndarray:
+    """Lin or Jiang-Conrath similarity from Resnik similarity and the IC of
+    both terms: ``2 IC(MICA) / (IC(a) + IC(b))`` and
+    ``1 / (1 + IC(a) + IC(b) - 2 IC(MICA))``"""
+    if measure == "resnik":
+        return resnik
+    total = ic_first[:, None] + ic_second[None, :]
+    if measure == "lin":
+        return np.where(total > 0, 2 * resnik / np.where(total > 0, total, 1), same).astype(resnik.dtype)
+    return (1 / (1 + np.maximum(total - 2 * resnik, 0))).astype(resnik.dtype)
+
+
+class GOSimilarity:
+    """Semantic similarity between GO-annotated entities (genes, orthogroups)
+
+    Term information content comes from ``corpus`` annotations (the
+    entities themselves by default; a term counts every entity annotated
+    with it or a descendant) or, for "intrinsic", from descendant counts.
+    With a ``namespace`` only the entities' terms of that namespace are
+    compared. The ancestor sets of the annotated terms are packed into
+    uint64 bitsets whose columns are sorted by decreasing IC, so the most
+    informative common ancestor (MICA) of two terms is the first set bit
+    of their AND. Entity similarity is the best-match average (BMA) of
+    their terms' similarities.
+    """
+
+    def __init__(self, dag: GODag, annotations: Dict[str, List[str]], ic_source: str = "annotation",
+                 corpus: Optional[Dict[str, List[str]]] = None, namespace: Optional[str] = None):
+        if ic_source not in IC_SOURCES:
+            raise ValueError(f"Unsupported IC source: {ic_source}. Use one of: {', '.join(IC_SOURCES)}")
+        self.dag = dag
+        self.ic_source = ic_source
+        self.namespace = namespace
+
+        entity_terms = {entity: dag.term_indices(terms) for entity, terms in annotations.items()}
+        if ic_source == "intrinsic":
+            counts = dag.descendant_counts
+        else:
+            corpus_terms = entity_terms if corpus is None else {
+                entity: dag.term_indices(terms) for entity, terms in corpus.items()}
+            corpus_matrix = self._indicator(list(corpus_terms.values()), dag.n_terms)
+            propagated = (corpus_matrix @ dag.closure).tocsr()
+            propagated.data[:] = 1
+            counts = np.asarray(propagated.sum(axis=0)).ravel()
+        self.ic = _information_content(counts, dag)
+
+        if namespace is not None:
+            in_namespace = np.array([term_namespace == namespace for term_namespace in dag.namespaces], dtype=bool)
+            entity_terms = {entity: terms[in_namespace[terms]] for entity, terms in entity_terms.items()}
+        self.entity_ids = [entity for entity, terms in entity_terms.items() if len(terms)]
+        self.unannotated = [entity for entity, terms in entity_terms.items() if not len(terms)]
+        self.entity_index = {entity: i for i, entity in enumerate(self.entity_ids)}
+
+        # Terms annotated to the entities, numbered 0..m-1
+        used = [entity_terms[entity] for entity in self.entity_ids]
+        self.terms = np.unique(np.concatenate(used)) if used else np.zeros(0, dtype=np.int64)
+        self.term_ic = np.nan_to_num(self.ic[self.terms], nan=0.0)
+        position = np.full(dag.n_terms, -1, dtype=np.int64)
+        position[self.terms] = np.arange(len(self.terms))
+        self.entity_terms = self._indicator([position[terms] for terms in used], len(self.terms))
+
+        # Ancestor bitsets over the ancestors of the used terms, by decreasing IC
+        ancestors = dag.closure[self.terms].tocsc()
+        columns = np.flatnonzero(np.diff(ancestors.indptr))
+        column_ic = np.nan_to_num(self.ic[columns], nan=0.0)
+        order = np.lexsort((columns, -column_ic))
+        self.bit_ic = column_ic[order]
+        self.bit_members = ancestors[:, columns[order]].tocsc()
+        dense = self.bit_members.toarray().astype(bool)
+        padded = np.zeros((len(self.terms), -(-dense.shape[1] // 64) * 64), dtype=bool)
+        padded[:, :dense.shape[1]] = dense
+        self.bits = np.packbits(padded, axis=1, bitorder="little").view("<u8")
+        self._resnik: Optional[np.ndarray] = None
+
+    @staticmethod
+    def _indicator(rows: List[np.ndarray], n_columns: int) -> sp.csr_matrix:
+        lengths = np.array([len(row) for row in rows], dtype=np.int64)
+        indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        return sp.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(rows), n_columns))
+
+    def _bitset_words(self) -> int:
+        """Number of trailing (least informative) bitset words resolved by
+        ANDing bitsets for all pairs, the other columns being swept
+
+        Sweeping a column writes every pair of its member terms, which is
+        cheap for specific terms but approaches all ``m^2`` pairs for the
+        general ones near the roots, while each bitset word costs ``m^2``
+        word operations for 64 columns. The split minimises the sum.
+        """
+        m, words = self.bits.shape
+        sizes = np.diff(self.bit_members.indptr).astype(np.float64)
+        padded = np.zeros(words * 64)
+        padded[:len(sizes)] = sizes ** 2
+        # Sweep cost of the leading columns when the last w words are ANDed
+        sweep = np.concatenate(([0.0], np.cumsum(padded.reshape(words, 64).sum(axis=1))))[::-1]
+        return int(np.argmin(sweep + float(m) * m * np.arange(words + 1)))
+
+    def resnik_matrix(self) -> np.ndarray:
+        """IC of the most informative common ancestor of every pair of
+        used terms (0 for terms without a common ancestor)
+
+        Specific ancestor columns are swept in increasing IC order, each
+        writing its IC to the pairs of its member terms, so the last write
+        is the most informative. Pairs left without a common ancestor there
+        are resolved by the first common bit of the remaining words.
+        """
+        if self._resnik is None:
+            m, words = self.bits.shape
+            tail = self._bitset_words()
+            swept = min((words - tail) * 64, len(self.bit_ic))
+            resnik = np.full((m, m), -1.0, dtype=np.float32)
+            members = self.bit_members
+            for column in range(swept - 1, -1, -1):
+                rows = members.indices[members.indptr[column]:members.indptr[column + 1]]
+                resnik[np.ix_(rows, rows)] = self.bit_ic[column]
+                if column % 1024 == 0:
+                    report_progress((swept - column) / max(1, swept) / 2, "common ancestors")
+
+            if tail:
+                tail_bits = np.ascontiguousarray(self.bits[:, words - tail:])
+                tail_ic = np.zeros(tail * 64)
+                tail_ic[:len(self.bit_ic) - swept] = self.bit_ic[swept:]
+                chunk = max(1, BITSET_CHUNK_BYTES // max(1, m * tail * 8))
+                for start in range(0, m, chunk):
+                    block = resnik[start:start + chunk]
+                    first = _first_common_bits(tail_bits[start:start + chunk], tail_bits)
+                    unresolved = (block < 0) & (first >= 0)
+                    block[unresolved] = tail_ic[first[unresolved]]
+                    report_progress(0.5 + (start + len(block)) / m / 2, "common ancestors")
+            np.maximum(resnik, 0, out=resnik)
+            self._resnik = resnik
+        return self._resnik
+
+    def _check_measure(self, measure: str) -> None:
+        if measure not in SIMILARITY_MEASURES:
+            raise ValueError(f"Unsupported similarity measure: {measure}. Use one of: {', '.join(SIMILARITY_MEASURES)}")
+
+    def term_similarity(self, measure: str = "resnik") -> np.ndarray:
+        """Similarity of every pair of used terms by ``measure``"""
+        self._check_measure(measure)
+        same = np.eye(len(self.terms), dtype=np.float32)
+        return _apply_measure(self.resnik_matrix(), self.term_ic, self.term_ic, same, measure)
+
+    def _term_pair_similarity(self, first: np.ndarray, second: np.ndarray, measure: str) -> np.ndarray:
+        """Similarity of two small sets of used terms, from their bitsets"""
+        common = _first_common_bits(self.bits[first], self.bits[second])
+        resnik = np.where(common >= 0, self.bit_ic[np.maximum(common, 0)], 0.0)
+        same = (first[:, None] == second[None, :]).astype(np.float64)
+        return _apply_measure(resnik, self.term_ic[first], self.term_ic[second], same, measure)
+
+    def _average_best_matches(self, similarity: np.ndarray) -> np.ndarray:
+        """``X[g, h]``: mean over the terms of entity ``g`` of their best
+        similarity to a term of entity ``h``, so BMA is ``(X + X^T) / 2``
+
+        The best matches of all used terms against a block of entities are
+        column maxima over the gathered term columns of each entity, and
+        averaging them per entity is a product with the entity-term matrix
+        normalised by entity size.
+        """
+        n = len(self.entity_ids)
+        sizes = np.diff(self.entity_terms.indptr)
+        normalized = (sp.diags(1.0 / sizes) @ self.entity_terms).astype(np.float32).tocsr()
+        averages = np.zeros((n, n), dtype=np.float32)
+        for start in range(0, n, PAIR_BLOCK_SIZE):
+            block = self.entity_terms[start:start + PAIR_BLOCK_SIZE]
+            best = np.maximum.reduceat(similarity[:, block.indices], block.indptr[:-1], axis=1)
+            averages[:, start:start + block.shape[0]] = normalized @ best
+            report_progress((start + block.shape[0]) / n, "entity similarity")
+        return averages
+
+    def iter_similarity_blocks(self, measure: str = "resnik",
+                               block_size: int = PAIR_BLOCK_SIZE) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """BMA similarity of every entity pair, as ``(rows, block)`` with
+        ``block[i, j]`` the similarity of entities ``rows[i]`` and ``j``"""
+        self._check_measure(measure)
+        averages = self._average_best_matches(self.term_similarity(measure))
+        n = len(self.entity_ids)
+        for start in range(0, n, block_size):
+            rows = np.arange(start, min(n, start + block_size))
+            yield rows, (averages[rows] + averages[:, rows].T) / 2
+
+    def similarity_matrix(self, measure: str = "resnik") -> np.ndarray:
+        """Full entity x entity BMA similarity matrix"""
+        self._check_measure(measure)
+        averages = self._average_best_matches(self.term_similarity(measure))
+        return (averages + averages.T) / 2
+
+    def top_matches(self, measure: str = "resnik", top_k: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+        """The ``top_k`` most similar other entities of every entity"""
+        n = len(self.entity_ids)
+        k = min(top_k, n - 1)
+        if k <= 0:
+            return {entity: [] for entity in self.entity_ids}
+        matches = {}
+        for rows, block in self.iter_similarity_blocks(measure):
+            block[np.arange(len(rows)), rows] = -np.inf
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-scores, axis=1, kind="stable")
+            for row, columns, values in zip(rows.tolist(), np.take_along_axis(top, order, axis=1).tolist(),
+                                            np.take_along_axis(scores, order, axis=1).tolist()):
+                matches[self.entity_ids[row]] = [{"id": self.entity_ids[column], "score": value}
+                                                 for column, value in zip(columns, values)]
+        return matches
+
+    def pair_similarity(self, pairs: List[Tuple[str, str]], measure: str = "resnik") -> List[Optional[float]]:
+        """BMA similarity of given entity pairs (None when an entity has no
+        known annotation), computed from the bitsets of their terms only"""
+        self._check_measure(measure)
+        scores = []
+        for first, second in pairs:
+            if first not in self.entity_index or second not in self.entity_index:
+                scores.append(None)
+                continue
+            block = self._term_pair_similarity(self.entity_terms[self.entity_index[first]].indices,
+                                               self.entity_terms[self.entity_index[second]].indices, measure)
+            scores.append(float((block.max(axis=1).mean() + block.max(axis=0).mean()) / 2))
+        return scores
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "ontology_id": self.dag.ontology_id,
+            "ic_source": self.ic_source,
+            "namespace": self.namespace,
+            "num_entities": len(self.entity_ids),
+            "unannotated_entities": self.unannotated,
+            "num_terms": len(self.terms),
+            "num_ancestor_bits": len(self.bit_ic)
+        }
+
+
+def group_annotations(annotations: Dict[str, List[str]], groups: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Annotations of groups of genes (e.g. orthogroups): the union of
+    their members' terms"""
+    return {group: sorted({term for member in members for term in annotations.get(member, [])})
+            for group, members in groups.items()}
+
+
+class GOntologyStore:
+    """Loaded GO DAGs by ontology ID, plus recently used annotation corpora"""
+
+    def __init__(self, max_ontologies: int = MAX_GO_ONTOLOGIES, max_corpora: int = MAX_GO_CORPORA):
+        self.max_ontologies = max_ontologies
+        self.max_corpora = max_corpora
+        self._dags: "OrderedDict[str, GODag]" = OrderedDict()
+        self._corpora: "OrderedDict[Tuple[Optional[str], ...], GOSimilarity]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, dag: GODag) -> GODag:
+        """Register an ontology, returning the existing one for identical content"""
+        ontology_id = dag.ontology_id
+        with self._lock:
+            existing = self._dags.get(ontology_id)
+            if existing is not None:
+                self._dags.move_to_end(ontology_id)
+                return existing
+            self._dags[ontology_id] = dag
+            while len(self._dags) > self.max_ontologies:
+                self._dags.popitem(last=False)
+            return dag
+
+    def get(self, ontology_id: str) -> GODag:
+        """Look up an ontology, raising KeyError when unknown or evicted"""
+        with self._lock:
+            dag = self._dags[ontology_id]
+            self._dags.move_to_end(ontology_id)
+            return dag
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            dags = list(self._dags.values())
+        return [dag.summary() for dag in dags]
+
+    def similarity(self, ontology_id: str, annotations: Dict[str, List[str]], ic_source: str = "annotation",
+                   corpus: Optional[Dict[str, List[str]]] = None, namespace: Optional[str] = None) -> GOSimilarity:
+        """Similarity engine of an annotation set, built once per content"""
+        dag = self.get(ontology_id)
+        digest = hashlib.sha1(json.dumps([annotations, corpus], sort_keys=True).encode("utf-8")).hexdigest()
+        key = (ontology_id, ic_source, namespace, digest)
+        with self._lock:
+            engine = self._corpora.get(key)
+            if engine is not None:
+                self._corpora.move_to_end(key)
+                return engine
+        engine = GOSimilarity(dag, annotations, ic_source, corpus, namespace)
+        with self._lock:
+            self._corpora[key] = engine
+            while len(self._corpora) > self.max_corpora:
+                self._corpora.popitem(last=False)
+        return engine
+
+
+go_ontologies = GOntologyStore()
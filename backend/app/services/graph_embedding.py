@@ -0,0 +1,112 @@
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE
+from sklearn.utils.extmath import randomized_svd
+
+from .graph_centrality import sparse_centrality, DEFAULT_DELTA
+
+EMBEDDING_METHODS = ("pca", "spectral", "tsne")
+CLUSTERING_METHODS = ("auto", "kmeans", "minibatch")
+
+# Clustering features only need rough centralities, so the sampled
+# approximation uses a looser error bound than the basic analysis
+FEATURE_EPSILON = 0.1
+
+# Datasets up to this size are clustered by full KMeans in "auto" mode
+EXACT_KMEANS_MAX_NODES = 10000
+
+# Samples per MiniBatchKMeans step
+MINIBATCH_SIZE = 4096
+
+# Power iterations of the randomized spectral embedding
+SPECTRAL_POWER_ITERATIONS = 7
+
+
+def node_features(adjacency: sp.csr_matrix, mode: str = "auto", epsilon: float = FEATURE_EPSILON,
+                  delta: float = DEFAULT_DELTA, processes: Optional[int] = None,
+                  seed: int = 0) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Degree, betweenness and closeness centrality of every node as an
+    ``n x 3`` matrix, plus the centrality stats (see ``sparse_centrality``)"""
+    n = adjacency.shape[0]
+    degree = np.diff(adjacency.indptr) + (adjacency.diagonal() > 0)
+    degree = degree / (n - 1) if n > 1 else np.ones(n)
+    scores = sparse_centrality(adjacency, mode, epsilon, delta, processes, seed)
+    return np.column_stack((degree, scores["betweenness"], scores["closeness"])), scores["stats"]
+
+
+def pca_embedding(features: np.ndarray, seed: int = 0) -> np.ndarray:
+    """First two principal components of the standardised features"""
+    n, n_features = features.shape
+    embedding = np.zeros((n, 2))
+    if n < 2:
+        return embedding
+    spread = features.std(axis=0)
+    scaled = (features - features.mean(axis=0)) / np.where(spread > 0, spread, 1.0)
+    n_components = min(2, n_features, n)
+    embedding[:, :n_components] = PCA(n_components=n_components, random_state=seed).fit_transform(scaled)
+    return embedding
+
+
+def spectral_embedding(adjacency: sp.csr_matrix, seed: int = 0,
+                       n_iter: int = SPECTRAL_POWER_ITERATIONS) -> np.ndarray:
+    """Two-dimensional spectral layout of an undirected graph
+
+    The leading eigenvectors of the lazy normalised adjacency
+    ``(I + D^-1/2 A D^-1/2) / 2`` are found by randomized SVD (the matrix
+    is positive semi-definite, so its singular vectors are its
+    eigenvectors). The first one only reflects the degrees and is dropped;
+    the next two, rescaled by ``D^-1/2``, are the random-walk (Laplacian
+    eigenmap) coordinates. Only sparse products are used.
+    """
+    n = adjacency.shape[0]
+    embedding = np.zeros((n, 2))
+    if n < 4:
+        return embedding
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    inverse_sqrt = np.where(degree > 0, 1.0 / np.sqrt(np.maximum(degree, 1.0)), 0.0)
+    scaling = sp.diags(inverse_sqrt)
+    lazy = (sp.identity(n, format="csr") + scaling @ adjacency @ scaling) * 0.5
+    vectors, _, _ = randomized_svd(lazy, n_components=3, n_iter=n_iter, random_state=seed)
+    return vectors[:, 1:] * inverse_sqrt[:, None]
+
+
+def tsne_embedding(features: np.ndarray, seed: int = 0) -> np.ndarray:
+    """Barnes-Hut t-SNE of the features (O(n log n) per iteration)"""
+    tsne = TSNE(n_components=2, perplexity=min(30, max(3, len(features) // 5)),
+                method="barnes_hut", init="pca", random_state=seed)
+    return tsne.fit_transform(features)
+
+
+def embed_nodes(features: np.ndarray, adjacency: sp.csr_matrix, method: str = "pca",
+                seed: int = 0) -> np.ndarray:
+    """Two-dimensional layout of the nodes by ``method``"""
+    if method == "pca":
+        return pca_embedding(features, seed)
+    if method == "spectral":
+        return spectral_embedding(adjacency, seed)
+    if method == "tsne":
+        return tsne_embedding(features, seed)
+    raise ValueError(f"Unsupported embedding method: {method}. Use one of: {', '.join(EMBEDDING_METHODS)}")
+
+
+def cluster_features(features: np.ndarray, k: int, method: str = "auto",
+                     seed: int = 0) -> Tuple[np.ndarray, str]:
+    """k-means labels of the features and the variant used
+
+    "auto" runs full KMeans up to EXACT_KMEANS_MAX_NODES rows and
+    MiniBatchKMeans above, whose steps only touch MINIBATCH_SIZE rows.
+    """
+    if method not in CLUSTERING_METHODS:
+        raise ValueError(f"Unsupported clustering method: {method}. Use one of: {', '.join(CLUSTERING_METHODS)}")
+    if method == "auto":
+        method = "kmeans" if len(features) <= EXACT_KMEANS_MAX_NODES else "minibatch"
+    if method == "kmeans":
+        model = KMeans(n_clusters=k, n_init=4, random_state=seed)
+    else:
+        model = MiniBatchKMeans(n_clusters=k, batch_size=MINIBATCH_SIZE, n_init=3, random_state=seed)
+    return model.fit_predict(features), method
+
@@ -0,0 +1,130 @@
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .compact_tree import CompactTree
+
+# Significant digits of branch lengths, as written by ETE3
+DEFAULT_PRECISION = 6
+
+# Output pieces joined per chunk when streaming
+DEFAULT_STREAM_PIECES = 65536
+
+# Characters with a meaning in Newick or NHX comments
+_NHX_RESERVED = re.compile(r"[\s:;,=()\[\]]")
+
+
+def nhx_text(value: Any) -> str:
+    """Text of an NHX key or value with every Newick/NHX delimiter
+    (``:;,=()[]`` and whitespace) replaced by ``_``, e.g. ``GO_0008150``"""
+    return _NHX_RESERVED.sub("_", str(value))
+
+
+def _node_labels(tree: CompactTree, nodes: np.ndarray, precision: int, support: bool,
+                 nhx: Optional[Dict[str, np.ndarray]]) -> List[str]:
+    """Labels of ``nodes``: name (or support), branch length and NHX tags"""
+    labels = [tree.names[node] for node in nodes.tolist()]
+    is_root = nodes == 0
+    if support:
+        # The root's support is meaningless, as ETE3 also leaves it out
+        for position in np.flatnonzero(is_root):
+            labels[position] = ""
+        supported = ~tree.is_leaf[nodes] & ~np.isnan(tree.support[nodes]) & ~is_root
+        for position in np.flatnonzero(supported):
+            labels[position] = f"{tree.support[nodes[position]]:.{precision}g}"
+
+    lengths = tree.branch_lengths[nodes]
+    has_length = ~np.isnan(lengths) & ~is_root
+    if has_length.any():
+        formatted = np.char.mod(f":%.{precision}g", lengths[has_length]).tolist()
+        for position, length in zip(np.flatnonzero(has_length).tolist(), formatted):
+            labels[position] += length
+
+    if nhx:
+        tags = [[] for _ in range(len(nodes))]
+        for key, values in nhx.items():
+            key = nhx_text(key)
+            for position, node in enumerate(nodes.tolist()):
+                value = values[node]
+                if value is not None and value == value:
+                    tags[position].append(f"{key}={nhx_text(value)}")
+        for position, node_tags in enumerate(tags):
+            if node_tags:
+                labels[position] += "[&&NHX:" + ":".join(node_tags) + "]"
+    return labels
+
+
+def _piece_order(tree: CompactTree) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Output order of the Newick pieces, the internal nodes and the nodes
+    written after a comma
+
+    Nodes are in preorder, so the text is one piece per node visit: its
+    separator plus ``(`` (internal) or its label (leaf), followed by one
+    ``)label`` piece for each internal node whose subtree ends there,
+    deepest first. Piece ``i < n`` is the visit of node ``i`` and piece
+    ``n + j`` the closing of ``internal[j]``; the visits and closings are
+    merged by one sort of integer keys instead of a recursive traversal.
+    """
+    n = tree.n_nodes
+    first_child = np.zeros(n, dtype=bool)
+    first_child[tree.child_index[tree.child_offsets[:-1][~tree.is_leaf]]] = True
+    separated = ~first_child
+    separated[0] = False
+
+    # Visit i sorts at (i, 0); the closing of node j at (last node of j, 1, -depth)
+    internal = np.flatnonzero(~tree.is_leaf)
+    ends = internal + tree.subtree_size[internal] - 1
+    positions = np.concatenate((np.arange(n), ends))
+    kinds = np.concatenate((np.zeros(n, dtype=np.int64), np.ones(len(internal), dtype=np.int64)))
+    depths = np.concatenate((np.zeros(n, dtype=np.int64), -tree.depth[internal]))
+    return np.lexsort((depths, kinds, positions)), internal, separated
+
+
+def _pieces(tree: CompactTree, order: np.ndarray, internal: np.ndarray, separated: np.ndarray,
+            precision: int, support: bool, nhx: Optional[Dict[str, np.ndarray]]) -> List[str]:
+    """Text of a run of pieces in output order, labelling only its nodes"""
+    n = tree.n_nodes
+    closing = order >= n
+    nodes = np.where(closing, internal[np.maximum(order - n, 0)], order)
+    pieces = ["("] * len(order)
+    labelled = np.flatnonzero(closing | tree.is_leaf[nodes])
+    for position, label in zip(labelled.tolist(), _node_labels(tree, nodes[labelled], precision, support, nhx)):
+        pieces[position] = label
+    for position in np.flatnonzero(closing).tolist():
+        pieces[position] = ")" + pieces[position]
+    for position in np.flatnonzero(~closing & separated[nodes]).tolist():
+        pieces[position] = "," + pieces[position]
+    return pieces
+
+
+def write_newick(tree: CompactTree, precision: int = DEFAULT_PRECISION, support: bool = False,
+                 nhx: Optional[Dict[str, np.ndarray]] = None) -> str:
+    """Serialise a compact tree to Newick
+
+    ``precision`` sets the significant digits of branch lengths; with
+    ``support`` internal nodes are labelled by their support value instead
+    of their name (ETE3 format 0), and ``nhx`` adds ``[&&NHX:key=value]``
+    tags from per-node value arrays (missing values are skipped, reserved
+    characters replaced as in ``nhx_text``).
+    """
+    order, internal, separated = _piece_order(tree)
+    # One join sizes and fills the output buffer once
+    return "".join(_pieces(tree, order, internal, separated, precision, support, nhx)) + ";"
+
+
+def iter_newick(tree: CompactTree, precision: int = DEFAULT_PRECISION, support: bool = False,
+                nhx: Optional[Dict[str, np.ndarray]] = None,
+                chunk_pieces: int = DEFAULT_STREAM_PIECES) -> Iterator[bytes]:
+    """Serialise a compact tree to Newick as a stream of UTF-8 chunks
+
+    Only the integer piece order is computed for the whole tree; labels
+    and text are built one chunk of ``chunk_pieces`` pieces at a time, so
+    the strings held in memory are bounded by the chunk size.
+    """
+    order, internal, separated = _piece_order(tree)
+    for start in range(0, len(order), chunk_pieces):
+        pieces = _pieces(tree, order[start:start + chunk_pieces], internal, separated, precision, support, nhx)
+        if start + chunk_pieces >= len(order):
+            pieces.append(";")
+        yield "".join(pieces).encode("utf-8")
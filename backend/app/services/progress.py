@@ -0,0 +1,52 @@
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Tuple
+
+
+class ComputationStopped(Exception):
+    """Raised by a reporter to stop the computation reporting to it;
+    code catching broad exceptions around reporting loops re-raises it"""
+
+
+# Callback receiving (overall fraction, stage) in this process, if any.
+# Analyses run by the job queue install one in each worker process; in
+# every other context reporting is a no-op.
+_reporter: Optional[Callable[[float, Optional[str]], None]] = None
+
+# Part of the overall progress covered by the current computation
+_span: Tuple[float, float] = (0.0, 1.0)
+
+
+def set_reporter(reporter: Optional[Callable[[float, Optional[str]], None]]) -> None:
+    """Install (or with None remove) the progress callback of this process"""
+    global _reporter, _span
+    _reporter = reporter
+    _span = (0.0, 1.0)
+
+
+def report_progress(fraction: float, stage: Optional[str] = None) -> None:
+    """Report that ``fraction`` of the current computation is done
+
+    The fraction is mapped into the enclosing ``progress_span``. Reporters
+    may raise ComputationStopped (e.g. when the job was cancelled), so
+    long loops should call this between iterations.
+    """
+    if _reporter is None:
+        return
+    start, end = _span
+    _reporter(start + (end - start) * min(max(fraction, 0.0), 1.0), stage)
+
+
+@contextmanager
+def progress_span(start: float, end: float, stage: Optional[str] = None) -> Iterator[None]:
+    """Map the progress reported inside the block to ``[start, end]`` of
+    the enclosing span, so nested computations report 0..1 each"""
+    global _span
+    outer = _span
+    width = outer[1] - outer[0]
+    _span = (outer[0] + width * start, outer[0] + width * end)
+    try:
+        report_progress(0.0, stage)
+        yield
+        report_progress(1.0, stage)
+    finally:
+        _span = outer
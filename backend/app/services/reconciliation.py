@@ -0,0 +1,68 @@
+from typing import Dict, Any
+
+import numpy as np
+
+from .compact_tree import CompactTree, LCAIndex
+
+GENE_EVENTS = ("leaf", "speciation", "duplication", "none", "unmapped")
+
+
+def reconcile(gene_tree: CompactTree, species_index: LCAIndex, leaf_species: np.ndarray) -> Dict[str, Any]:
+    """LCA reconciliation of a gene tree with a species tree
+
+    ``leaf_species`` gives the species-tree node of every gene-tree node
+    (only leaf entries are read; -1 marks genes without a species). Each
+    gene node maps to the LCA of the species below it. Because species
+    nodes are numbered in preorder, that is the LCA of the smallest and
+    largest species index in the gene subtree, so the whole mapping is two
+    postorder reductions plus one vectorised LCA query.
+
+    An internal gene node with two or more mapped children is a
+    duplication when a child maps to the same species node, and a
+    speciation otherwise. Losses on the branch above a
+    gene node count the species-tree branches skipped between its mapping
+    and its parent's (one fewer below a speciation).
+    """
+    species_depth = species_index.tree.depth
+    n = gene_tree.n_nodes
+    leaf_species = np.where(gene_tree.is_leaf, np.asarray(leaf_species, dtype=np.int64), -1)
+    mapped_leaf = leaf_species >= 0
+
+    lowest = gene_tree.postorder_reduce(np.where(mapped_leaf, leaf_species, np.iinfo(np.int64).max), np.minimum)
+    highest = gene_tree.postorder_reduce(leaf_species, np.maximum)
+    has_species = highest >= 0
+
+    mapping = np.full(n, -1, dtype=np.int64)
+    mapping[has_species] = species_index.lca_many(lowest[has_species], highest[has_species])
+
+    # A node is a duplication when any mapped child shares its species node
+    child = np.arange(1, n)
+    parent = gene_tree.parent[1:]
+    same = has_species[child] & (mapping[child] == mapping[parent])
+    duplication = np.zeros(n, dtype=bool)
+    duplication[parent[same]] = True
+
+    mapped_children = np.bincount(parent[has_species[child]], minlength=n)
+    events = np.full(n, "unmapped", dtype=object)
+    events[gene_tree.is_leaf & has_species] = "leaf"
+    internal = ~gene_tree.is_leaf & has_species
+    # An internal node with a single mapped child only passes its mapping on
+    events[internal] = "none"
+    resolved = internal & (mapped_children > 1)
+    events[resolved & duplication] = "duplication"
+    events[resolved & ~duplication] = "speciation"
+
+    losses = np.zeros(n, dtype=np.int64)
+    edge = has_species[child] & has_species[parent]
+    gap = species_depth[mapping[child[edge]]] - species_depth[mapping[parent[edge]]]
+    gap -= (events[parent[edge]] == "speciation").astype(np.int64)
+    losses[child[edge]] = np.maximum(gap, 0)
+
+    return {
+        "mapping": mapping,
+        "events": events,
+        "losses": losses,
+        "duplications": int((events == "duplication").sum()),
+        "speciations": int((events == "speciation").sum()),
+        "total_losses": int(losses.sum())
+    }
@@ -1,9 +1,21 @@
+import heapq
+import time
 import networkx as nx
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from rdflib import Graph, URIRef, Literal
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.manifold import TSNE
+import scipy.sparse as sp
+
+from .graph_centrality import compute_centrality, sparse_centrality, DEFAULT_EPSILON, DEFAULT_DELTA
+from .sparse_graph import SparseGraph, sparse_graphs, SPARSE_GRAPH_MIN_NODES
+from .dag_metrics import hierarchy_metrics, DEFAULT_MAX_CYCLES
+from .function_prediction import FunctionIndex, function_indexes, DEFAULT_RESTART, DEFAULT_TOP_K
+from .go_enrichment import enrichment_indexes, DEFAULT_FDR, DEFAULT_MIN_COUNT
+from .subsumption_index import subsumption_indexes
+from .progress import report_progress, progress_span, ComputationStopped
+from .graph_embedding import (
+    node_features, embed_nodes, cluster_features, EMBEDDING_METHODS, CLUSTERING_METHODS, FEATURE_EPSILON
+)
 
 class SemanticReasoningService:
     """Service for analyzing and reasoning over biological data"""
@@ -13,9 +25,9 @@ class SemanticReasoningService:
         analysis_type = parameters.get("analysis_type", "basic")
         
         if analysis_type == "basic":
-            return self._perform_basic_analysis(data)
+            return self._perform_basic_analysis(data, parameters)
         elif analysis_type == "hierarchical":
-            return self._perform_hierarchical_analysis(data)
+            return self._perform_hierarchical_analysis(data, parameters)
         elif analysis_type == "evolutionary":
             return self._perform_evolutionary_analysis(data, parameters)
         elif analysis_type == "functional":
@@ -25,35 +37,77 @@ class SemanticReasoningService:
         else:
             raise ValueError(f"Unsupported analysis type: {analysis_type}")
     
-    def _perform_basic_analysis(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Perform basic analysis of the ontology structure"""
-        # Create a networkx graph from the data
-        G = self._create_networkx_graph(data)
+    def _perform_basic_analysis(self, data: Dict[str, Any], parameters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Perform basic analysis of the ontology structure
+
+        Centrality parameters: ``centrality`` ("auto", "exact" or
+        "approximate"; auto samples sources above a few thousand nodes),
+        ``epsilon`` and ``delta`` (error bound and failure probability of
+        the approximation), ``processes`` (capped at the CPU count),
+        ``seed`` and ``top_k``. The top-k lists are picked once every score
+        is known; on large graphs the approximation is what bounds the cost.
+        """
+        parameters = parameters or {}
+        top_k = int(parameters.get("top_k", 10))
+        
+        # Create a graph from the data (sparse for large datasets)
+        with progress_span(0.0, 0.1, "graph"):
+            G = self._create_graph(data, parameters)
         
         # Calculate basic graph metrics
-        metrics = {
-            "node_count": G.number_of_nodes(),
-            "edge_count": G.number_of_edges(),
-            "density": nx.density(G),
-            "connected_components": nx.number_connected_components(G),
-        }
+        if isinstance(G, SparseGraph):
+            metrics = {
+                "node_count": G.n_nodes,
+                "edge_count": G.number_of_edges(),
+                "density": G.density(),
+                "connected_components": G.connected_components()[0],
+                "backend": "sparse"
+            }
+        else:
+            metrics = {
+                "node_count": G.number_of_nodes(),
+                "edge_count": G.number_of_edges(),
+                "density": nx.density(G),
+                "connected_components": nx.number_connected_components(G),
+                "backend": "networkx"
+            }
         
         # Find central nodes using different centrality measures
+        centrality_options = {
+            "mode": parameters.get("centrality", "auto"),
+            "epsilon": float(parameters.get("epsilon", DEFAULT_EPSILON)),
+            "delta": float(parameters.get("delta", DEFAULT_DELTA)),
+            "processes": parameters.get("processes"),
+            "seed": int(parameters.get("seed", 0))
+        }
         try:
-            degree_centrality = nx.degree_centrality(G)
-            betweenness_centrality = nx.betweenness_centrality(G)
-            closeness_centrality = nx.closeness_centrality(G)
+            if isinstance(G, SparseGraph):
+                # Only the top candidates are turned back into node IDs
+                with progress_span(0.1, 0.95, "centrality"):
+                    sparse_scores = sparse_centrality(G.undirected, **centrality_options)
+                scores = {
+                    "degree": G.top_nodes(G.degree_centrality(), top_k),
+                    "betweenness": G.top_nodes(sparse_scores["betweenness"], top_k),
+                    "closeness": G.top_nodes(sparse_scores["closeness"], top_k),
+                    "stats": sparse_scores["stats"]
+                }
+            else:
+                with progress_span(0.1, 0.95, "centrality"):
+                    scores = compute_centrality(G, **centrality_options)
             
-            # Get top 10 nodes for each centrality measure
-            top_degree = self._get_top_nodes(degree_centrality, data["nodes"], 10)
-            top_betweenness = self._get_top_nodes(betweenness_centrality, data["nodes"], 10)
-            top_closeness = self._get_top_nodes(closeness_centrality, data["nodes"], 10)
+            # Get top nodes for each centrality measure
+            top_degree = self._get_top_nodes(scores["degree"], data["nodes"], top_k)
+            top_betweenness = self._get_top_nodes(scores["betweenness"], data["nodes"], top_k)
+            top_closeness = self._get_top_nodes(scores["closeness"], data["nodes"], top_k)
             
             centrality = {
                 "degree": top_degree,
                 "betweenness": top_betweenness,
-                "closeness": top_closeness
+                "closeness": top_closeness,
+                "stats": scores["stats"]
             }
+        except (ValueError, ComputationStopped):
+            raise
         except:
             centrality = {"error": "Unable to calculate centrality measures"}
         
@@ -66,34 +120,39 @@ class SemanticReasoningService:
             "edge_types": edge_types
         }
     
-    def _perform_hierarchical_analysis(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Analyze hierarchical relationships in the ontology"""
-        # Create a directed graph for hierarchy analysis
-        G = self._create_networkx_graph(data, directed=True)
+    def _perform_hierarchical_analysis(self, data: Dict[str, Any], parameters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Analyze hierarchical relationships in the ontology
+
+        ``top_descendant_counts`` lists the ``top_k`` classes with the most
+        subclasses; the counts of every class are only returned, as
+        ``descendant_counts``, when the ``descendant_counts`` parameter is
+        set.
+        """
+        parameters = parameters or {}
+        top_k = int(parameters.get("top_k", 10))
         
         # Find all "subClassOf" relationships to build class hierarchy
         hierarchy_edges = [e for e in data["edges"] if e["type"] == "subClassOf"]
         
-        # Build a hierarchy-specific graph
-        H = nx.DiGraph()
-        for edge in hierarchy_edges:
-            H.add_edge(edge["source"], edge["target"])
-        
-        # Find root nodes (nodes with no parents in the hierarchy)
-        root_nodes = [n for n in H.nodes() if H.out_degree(n) == 0]
-        
-        # Find leaf nodes (nodes with no children in the hierarchy)
-        leaf_nodes = [n for n in H.nodes() if H.in_degree(n) == 0]
-        
-        # Calculate the depth of each node from the nearest root
-        depths = {}
-        for root in root_nodes:
-            for node in nx.descendants(H, root):
-                # Calculate the longest path from this root to the node
-                paths = list(nx.all_simple_paths(H, root, node))
-                if paths:
-                    max_path_length = max(len(path) - 1 for path in paths)
-                    depths[node] = min(depths.get(node, float('inf')), max_path_length)
+        # Number the hierarchy nodes so depths are computed on index arrays
+        node_ids = list(dict.fromkeys(
+            node_id for edge in hierarchy_edges for node_id in (edge["source"], edge["target"])
+        ))
+        node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+        children = np.array([node_index[edge["source"]] for edge in hierarchy_edges], dtype=np.int64)
+        parents = np.array([node_index[edge["target"]] for edge in hierarchy_edges], dtype=np.int64)
+        report_progress(0.1, "hierarchy")
+        
+        # Roots have no parents, leaves no children; depth is the longest
+        # path from a root, level the shortest and height the longest path
+        # down to a leaf
+        with progress_span(0.1, 0.6, "hierarchy metrics"):
+            metrics = hierarchy_metrics(children, parents, len(node_ids),
+                                        int(parameters.get("max_cycles", DEFAULT_MAX_CYCLES)))
+        root_nodes = [node_ids[i] for i in metrics["roots"]]
+        leaf_nodes = [node_ids[i] for i in metrics["leaves"]]
+        ordered = np.flatnonzero(metrics["depth"] >= 0)
+        depths = {node_ids[i]: int(metrics["depth"][i]) for i in ordered}
         
         # Convert node IDs to node details
         node_map = {node["id"]: node for node in data["nodes"]}
@@ -101,17 +160,33 @@ class SemanticReasoningService:
         root_node_details = [node_map.get(node_id, {"id": node_id}) for node_id in root_nodes]
         leaf_node_details = [node_map.get(node_id, {"id": node_id}) for node_id in leaf_nodes[:100]]  # Limit to 100
         
-        # Detect cycles in the hierarchy (should not exist in a proper ontology)
-        cycles = list(nx.simple_cycles(H))
+        # Cycles (which should not exist in a proper ontology) are bounded
+        cycles = [[node_ids[i] for i in cycle] for cycle in metrics["cycles"]]
         
-        return {
+        # Subclass counts read off the interval labels of the closure
+        # (the index is built once per dataset content)
+        with progress_span(0.7, 0.9, "subsumption index"):
+            subsumption = subsumption_indexes.for_dataset(data, ("subClassOf",))
+        descendant_counts = {node_id: subsumption.descendant_count(node_id)
+                             for node_id in node_ids if node_id in subsumption.node_index}
+        
+        result = {
             "root_nodes": root_node_details,
             "leaf_nodes": leaf_node_details,
-            "hierarchy_depth": max(depths.values()) if depths else 0,
+            "hierarchy_depth": metrics["max_depth"],
             "node_depths": depths,
-            "has_cycles": len(cycles) > 0,
-            "cycles": cycles[:10] if cycles else []  # Return only first 10 cycles if any
+            "node_heights": {node_ids[i]: int(metrics["height"][i]) for i in np.flatnonzero(metrics["height"] >= 0)},
+            "min_root_distances": {node_ids[i]: int(metrics["level"][i]) for i in np.flatnonzero(metrics["level"] >= 0)},
+            "depth_histogram": metrics["depth_histogram"],
+            "level_histogram": metrics["level_histogram"],
+            "has_cycles": len(metrics["cyclic_nodes"]) > 0,
+            "cyclic_node_count": len(metrics["cyclic_nodes"]),
+            "cycles": cycles,
+            "top_descendant_counts": self._get_top_nodes(descendant_counts, data["nodes"], top_k)
         }
+        if parameters.get("descendant_counts"):
+            result["descendant_counts"] = descendant_counts
+        return result
     
     def _perform_evolutionary_analysis(self, data: Dict[str, Any], parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze evolutionary relationships in the biological data"""
@@ -126,9 +201,13 @@ class SemanticReasoningService:
         # Create a species relationship graph based on common ancestors
         species_graph = self._create_species_relationship_graph(data, species_nodes)
         
+        report_progress(0.4, "species relationships")
+        
         # Get ancestral relationships
         ancestor_relationships = self._extract_ancestral_relationships(data)
         
+        report_progress(0.6, "ancestral relationships")
+        
         # Get orthologous relationships (genes with common ancestry)
         orthology_groups = self._identify_orthology_groups(data, parameters)
         
@@ -140,9 +219,15 @@ class SemanticReasoningService:
         }
     
     def _perform_functional_analysis(self, data: Dict[str, Any], parameters: Dict[str, Any]) -> Dict[str, Any]:
-        """Analyze functional annotations and relationships"""
-        # Create a graph representation
-        G = self._create_networkx_graph(data)
+        """Analyze functional annotations and relationships
+
+        With ``predict_all`` the predictions of every unannotated entity
+        are computed in one batch and returned as ``batch_predictions``.
+        With ``study_genes`` the functions over-represented among them are
+        returned as ``enrichment``.
+        """
+        # Adjacency and annotation indexes, built once per dataset
+        index = function_indexes.get(data)
         
         # Extract function-related nodes
         function_types = ["Function", "MolecularFunction", "BiologicalProcess", "CellularComponent"]
@@ -152,48 +237,116 @@ class SemanticReasoningService:
         # Find functional annotations based on relationships
         functional_annotations = self._extract_functional_annotations(data)
         
+        report_progress(0.3, "annotations")
+        
+        # Test the study gene set for over-represented functions
+        enrichment = self._enrich_functions(data, index, parameters)
+        
         # Group functions by similarity
         functional_clusters = self._cluster_functions(function_nodes, data["edges"])
         
+        report_progress(0.6, "function clusters")
+        
         # Generate functional predictions based on network structure
-        predictions = self._predict_functions(data, G, parameters)
+        predictions = self._predict_functions(index, parameters)
         
-        return {
+        result = {
             "functional_annotations": functional_annotations,
             "function_clusters": functional_clusters,
             "functional_predictions": predictions
         }
+        if enrichment is not None:
+            result["enrichment"] = enrichment
+        if parameters.get("predict_all"):
+            with progress_span(0.7, 1.0, "batch predictions"):
+                result["batch_predictions"] = index.predict_unannotated(**self._prediction_options(parameters))
+        return result
     
     def _perform_clustering_analysis(self, data: Dict[str, Any], parameters: Dict[str, Any]) -> Dict[str, Any]:
-        """Perform clustering analysis on the data"""
+        """Perform clustering analysis on the data
+
+        Nodes are described by their degree, betweenness and closeness
+        centrality (``centrality``, ``epsilon``, ``delta`` and ``processes``
+        as in the basic analysis; sampled above a few thousand nodes).
+        ``embedding`` lays them out by "pca" (default), "spectral" or
+        "tsne", ``clustering`` selects "kmeans", "minibatch" or "auto", and
+        ``seed`` fixes every random step. Stage timings are reported.
+        """
+        embedding_method = parameters.get("embedding", "pca")
+        clustering_method = parameters.get("clustering", "auto")
+        if embedding_method not in EMBEDDING_METHODS:
+            raise ValueError(f"Unsupported embedding method: {embedding_method}")
+        if clustering_method not in CLUSTERING_METHODS:
+            raise ValueError(f"Unsupported clustering method: {clustering_method}")
+        seed = int(parameters.get("seed", 0))
+        timings = {}
+        
         # Create adjacency matrix from the graph
-        G = self._create_networkx_graph(data)
+        start = time.perf_counter()
+        with progress_span(0.0, 0.05, "graph"):
+            G = self._create_graph(data, parameters)
+            node_ids, adjacency = self._graph_adjacency(G)
+        timings["graph"] = time.perf_counter() - start
         
         # Calculate network features for nodes
-        node_features = self._calculate_node_features(G)
+        start = time.perf_counter()
+        with progress_span(0.05, 0.8, "features"):
+            features, centrality_stats = self._calculate_node_features(adjacency, parameters)
+        timings["features"] = time.perf_counter() - start
         
         # Determine optimal cluster count or use provided value
         k = parameters.get("cluster_count", 5)
         
         # Perform dimensionality reduction for visualization
-        tsne_result = self._perform_dimensionality_reduction(node_features)
+        start = time.perf_counter()
+        with progress_span(0.8, 0.95, "embedding"):
+            embedding = self._perform_dimensionality_reduction(features, adjacency, embedding_method, seed)
+        timings["embedding"] = time.perf_counter() - start
         
         # Perform clustering
-        clusters = self._cluster_nodes(node_features, k)
+        start = time.perf_counter()
+        with progress_span(0.95, 1.0, "clustering"):
+            labels, clustering_method = self._cluster_nodes(features, k, clustering_method, seed)
+        timings["clustering"] = time.perf_counter() - start
+        positions = dict(zip(node_ids, embedding.tolist()))
+        clusters = dict(zip(node_ids, labels.tolist()))
         
         # Create cluster visualization data
-        visualization_data = self._create_cluster_visualization(data["nodes"], tsne_result, clusters)
+        start = time.perf_counter()
+        visualization_data = self._create_cluster_visualization(data["nodes"], positions, clusters)
         
         # Analyze cluster properties
         cluster_properties = self._analyze_clusters(G, clusters)
+        timings["summary"] = time.perf_counter() - start
         
         return {
             "cluster_count": k,
             "node_clusters": clusters,
             "cluster_properties": cluster_properties,
-            "visualization": visualization_data
+            "visualization": visualization_data,
+            "stats": {
+                "embedding": embedding_method,
+                "clustering": clustering_method,
+                "seed": seed,
+                "centrality": centrality_stats,
+                "seconds": {stage: round(value, 4) for stage, value in timings.items()}
+            }
         }
     
+    def _create_graph(self, data: Dict[str, Any], parameters: Dict[str, Any]):
+        """Create the graph used by an analysis
+
+        ``graph_backend`` selects "networkx", "sparse" or "auto" (the
+        default), which uses the CSR backend from SPARSE_GRAPH_MIN_NODES
+        nodes up. The sparse graph is built once per dataset.
+        """
+        backend = parameters.get("graph_backend", "auto")
+        if backend not in ("auto", "networkx", "sparse"):
+            raise ValueError(f"Unsupported graph backend: {backend}")
+        if backend == "sparse" or (backend == "auto" and len(data["nodes"]) >= SPARSE_GRAPH_MIN_NODES):
+            return sparse_graphs.get(data)
+        return self._create_networkx_graph(data)
+    
     def _create_networkx_graph(self, data: Dict[str, Any], directed: bool = False) -> nx.Graph:
         """Create a NetworkX graph from the data"""
         if directed:
@@ -219,8 +372,8 @@ class SemanticReasoningService:
         # Create a map of node IDs to node details
         node_map = {node["id"]: node for node in nodes}
         
-        # Get top nodes by centrality score
-        top_nodes = sorted(centrality_scores.items(), key=lambda x: x[1], reverse=True)[:limit]
+        # Get top nodes by centrality score (partial selection, no full sort)
+        top_nodes = heapq.nlargest(limit, centrality_scores.items(), key=lambda x: x[1])
         
         # Return node details with centrality score
         return [{
@@ -331,6 +484,28 @@ class SemanticReasoningService:
         # Limit the number of entities to return
         return {k: v for i, (k, v) in enumerate(entity_functions.items()) if i < 100}
     
+    def _enrich_functions(self, data: Dict[str, Any], index: FunctionIndex,
+                          parameters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Enrichment of the functions of ``study_genes`` against every
+        annotated entity of the dataset
+
+        Annotations are propagated up the dataset's subClassOf hierarchy
+        (true-path rule) once per dataset. Terms need ``min_count`` study
+        genes and a Benjamini-Hochberg FDR of at most ``fdr``, optionally
+        within one ``namespace``.
+        """
+        study_genes = parameters.get("study_genes")
+        if not study_genes:
+            return None
+        enrichment_index = enrichment_indexes.dataset_index(data, index)
+        fdr = parameters.get("fdr")
+        return enrichment_index.enrich(
+            study_genes,
+            alpha=DEFAULT_FDR if fdr is None else float(fdr),
+            min_count=int(parameters.get("min_count", DEFAULT_MIN_COUNT)),
+            namespace=parameters.get("namespace")
+        )
+    
     def _cluster_functions(self, function_nodes: List[Dict[str, Any]], 
                          edges: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Cluster functions based on similarity"""
@@ -365,119 +540,74 @@ class SemanticReasoningService:
         
         return clusters
     
-    def _predict_functions(self, data: Dict[str, Any], G: nx.Graph, 
-                         parameters: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Predict functions based on network structure"""
-        # This is a simplified implementation
-        # A real system would use more sophisticated prediction algorithms
-        
+    def _predict_functions(self, index: FunctionIndex, parameters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Predict functions of ``target_entity`` from its network neighbourhood
+
+        ``prediction_method`` is "voting" (share of the node's edge weight
+        going to neighbours annotated with each function) or "rwr" (random
+        walk with restart, with ``restart`` probability); the ``top_k``
+        best functions are returned.
+        """
         # Get entities that need function prediction
         target_id = parameters.get("target_entity")
         if not target_id:
             return []
         
-        # Find neighbors of the target entity
         try:
-            neighbors = list(G.neighbors(target_id))
-        except nx.NetworkXError:
+            return index.predict_node(target_id, **self._prediction_options(parameters))
+        except KeyError:
             return []
-        
-        # Find functions associated with neighbors
-        function_types = ["Function", "MolecularFunction", "BiologicalProcess", "CellularComponent"]
-        neighbor_functions = []
-        
-        for neighbor_id in neighbors:
-            # Look for function relationships from this neighbor
-            for edge in data["edges"]:
-                if edge["source"] == neighbor_id and any(
-                    ftype in edge.get("target_type", "") for ftype in function_types
-                ):
-                    target_node = next((n for n in data["nodes"] if n["id"] == edge["target"]), None)
-                    if target_node:
-                        neighbor_functions.append({
-                            "function_id": target_node["id"],
-                            "function_label": target_node.get("label", "Unknown Function"),
-                            "confidence": 0.5  # Placeholder confidence score
-                        })
-        
-        # Sort by confidence and limit results
-        neighbor_functions.sort(key=lambda x: x["confidence"], reverse=True)
-        return neighbor_functions[:10]  # Return top 10 predictions
     
-    def _calculate_node_features(self, G: nx.Graph) -> Dict[str, List[float]]:
+    def _prediction_options(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "method": parameters.get("prediction_method", "voting"),
+            "top_k": int(parameters.get("top_k", DEFAULT_TOP_K)),
+            "restart": float(parameters.get("restart", DEFAULT_RESTART))
+        }
+    
+    def _graph_adjacency(self, G) -> Tuple[List[str], sp.csr_matrix]:
+        """Node IDs and undirected CSR adjacency of either graph backend"""
+        if isinstance(G, SparseGraph):
+            return G.node_ids, G.undirected
+        node_ids = list(G)
+        adjacency = nx.to_scipy_sparse_array(G, nodelist=node_ids, weight=None, format="csr")
+        return node_ids, sp.csr_matrix(adjacency)
+    
+    def _calculate_node_features(self, adjacency: sp.csr_matrix,
+                                 parameters: Dict[str, Any]) -> Tuple[np.ndarray, Dict[str, Any]]:
         """Calculate features for nodes to be used in clustering"""
-        features = {}
-        
-        # Calculate degree centrality
-        degree_centrality = nx.degree_centrality(G)
-        
-        # Try to calculate other centrality measures
-        try:
-            betweenness_centrality = nx.betweenness_centrality(G, k=min(100, len(G)))
-        except:
-            betweenness_centrality = {node: 0.0 for node in G.nodes()}
-        
-        try:
-            closeness_centrality = nx.closeness_centrality(G)
-        except:
-            closeness_centrality = {node: 0.0 for node in G.nodes()}
-        
-        # Combine features
-        for node in G.nodes():
-            features[node] = [
-                degree_centrality.get(node, 0.0),
-                betweenness_centrality.get(node, 0.0),
-                closeness_centrality.get(node, 0.0),
-            ]
-        
-        return features
+        return node_features(
+            adjacency,
+            mode=parameters.get("centrality", "auto"),
+            epsilon=float(parameters.get("epsilon", FEATURE_EPSILON)),
+            delta=float(parameters.get("delta", DEFAULT_DELTA)),
+            processes=parameters.get("processes"),
+            seed=int(parameters.get("seed", 0))
+        )
     
-    def _perform_dimensionality_reduction(self, features: Dict[str, List[float]]) -> Dict[str, List[float]]:
+    def _perform_dimensionality_reduction(self, features: np.ndarray, adjacency: sp.csr_matrix,
+                                          method: str = "pca", seed: int = 0) -> np.ndarray:
         """Perform dimensionality reduction for visualization"""
-        if not features:
-            return {}
-        
-        # Convert features to numpy array
-        nodes = list(features.keys())
-        feature_matrix = np.array([features[node] for node in nodes])
-        
-        # Perform t-SNE
         try:
-            tsne = TSNE(n_components=2, perplexity=min(30, max(3, len(features) // 5)))
-            embedding = tsne.fit_transform(feature_matrix)
-            
-            # Convert back to dictionary
-            result = {node: [float(embedding[i][0]), float(embedding[i][1])] for i, node in enumerate(nodes)}
-            return result
-        except:
-            # Fallback if t-SNE fails
-            return {node: [0.0, 0.0] for node in nodes}
+            return embed_nodes(features, adjacency, method, seed)
+        except Exception:
+            # Fallback if the embedding fails (e.g. too few nodes for t-SNE)
+            return np.zeros((len(features), 2))
     
-    def _cluster_nodes(self, features: Dict[str, List[float]], k: int) -> Dict[str, int]:
+    def _cluster_nodes(self, features: np.ndarray, k: int, method: str = "auto",
+                       seed: int = 0) -> Tuple[np.ndarray, str]:
         """Cluster nodes based on their features"""
-        if not features or k <= 0:
-            return {}
-        
-        # Convert features to numpy array
-        nodes = list(features.keys())
-        feature_matrix = np.array([features[node] for node in nodes])
-        
         # Ensure we have enough samples for clustering
-        actual_k = min(k, len(feature_matrix))
+        actual_k = min(k, len(features))
         if actual_k <= 0:
-            return {}
+            return np.zeros(0, dtype=np.int64), method
         
         # Perform k-means clustering
         try:
-            kmeans = KMeans(n_clusters=actual_k)
-            clusters = kmeans.fit_predict(feature_matrix)
-            
-            # Convert to dictionary mapping node ID to cluster
-            result = {node: int(cluster) for node, cluster in zip(nodes, clusters)}
-            return result
-        except:
+            return cluster_features(features, actual_k, method, seed)
+        except Exception:
             # Fallback if clustering fails
-            return {node: 0 for node in nodes}
+            return np.zeros(len(features), dtype=np.int64), method
     
     def _create_cluster_visualization(self, nodes: List[Dict[str, Any]], 
                                    positions: Dict[str, List[float]], 
@@ -521,6 +651,27 @@ class SemanticReasoningService:
         intra_edges = {}
         inter_edges = {}
         
+        if isinstance(G, SparseGraph):
+            # Count cluster pairs over the unique undirected edges in one pass
+            labels = np.full(G.n_nodes, -1, dtype=np.int64)
+            labels[G.indices(list(clusters))] = list(clusters.values())
+            edges = sp.triu(G.undirected).tocoo()
+            u_cluster, v_cluster = labels[edges.row], labels[edges.col]
+            keep = (u_cluster >= 0) & (v_cluster >= 0)
+            pairs = np.stack((np.minimum(u_cluster, v_cluster), np.maximum(u_cluster, v_cluster)), axis=1)[keep]
+            if len(pairs):
+                unique_pairs, counts = np.unique(pairs, axis=0, return_counts=True)
+                for (first, second), count in zip(unique_pairs.tolist(), counts.tolist()):
+                    if first == second:
+                        intra_edges[f"cluster_{first}"] = count
+                    else:
+                        inter_edges[f"cluster_{first}_cluster_{second}"] = count
+            return {
+                "cluster_sizes": cluster_counts,
+                "intra_cluster_edges": intra_edges,
+                "inter_cluster_edges": inter_edges
+            }
+        
         for u, v in G.edges():
             if u in clusters and v in clusters:
                 u_cluster = clusters[u]
@@ -0,0 +1,169 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Hashable, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+from .analysis_cache import dataset_hash
+from .dag_metrics import shortest_path_levels
+
+# Datasets with at least this many nodes are analysed on the sparse backend
+SPARSE_GRAPH_MIN_NODES = 5000
+
+# Sparse graphs kept in memory, least recently used dropped first
+MAX_SPARSE_GRAPHS = 8
+
+
+class SparseGraph:
+    """CSR adjacency of a dataset's graph with integer node IDs
+
+    Node ``i`` is ``node_ids[i]``; edge endpoints that are not listed as
+    nodes are added after them. Only the topology and the edge types are
+    kept, so building it is one pass over the edges without copying node
+    or edge attributes. ``adjacency`` keeps edge direction; ``undirected``
+    is its symmetric 0/1 version, the equivalent of a NetworkX ``Graph``.
+    """
+
+    def __init__(self, node_ids: List[Hashable], sources: np.ndarray, targets: np.ndarray,
+                 edge_types: Optional[np.ndarray] = None):
+        self.node_ids = node_ids
+        self.node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+        self.sources = np.asarray(sources, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.edge_types = edge_types
+        n = len(node_ids)
+        self.adjacency = sp.csr_matrix(
+            (np.ones(len(self.sources), dtype=np.float64), (self.sources, self.targets)), shape=(n, n)
+        )
+        self.adjacency.data[:] = 1.0
+        self._undirected: Optional[sp.csr_matrix] = None
+
+    @classmethod
+    def from_data(cls, data: Dict[str, Any]) -> "SparseGraph":
+        """Build the graph of a ``{"nodes": [...], "edges": [...]}`` dataset"""
+        node_index = {}
+        for node in data["nodes"]:
+            node_index.setdefault(node["id"], len(node_index))
+        edges = data["edges"]
+        sources = np.fromiter((node_index.setdefault(edge["source"], len(node_index)) for edge in edges),
+                              dtype=np.int64, count=len(edges))
+        targets = np.fromiter((node_index.setdefault(edge["target"], len(node_index)) for edge in edges),
+                              dtype=np.int64, count=len(edges))
+        edge_types = np.array([edge.get("type", "Unknown") for edge in edges], dtype=object)
+        return cls(list(node_index), sources, targets, edge_types)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def undirected(self) -> sp.csr_matrix:
+        """Symmetric 0/1 adjacency (duplicate and reverse edges merged)"""
+        if self._undirected is None:
+            undirected = (self.adjacency + self.adjacency.T).tocsr()
+            undirected.data[:] = 1.0
+            self._undirected = undirected
+        return self._undirected
+
+    def indices(self, node_ids: List[Hashable]) -> np.ndarray:
+        """Integer IDs of node IDs, raising KeyError for unknown ones"""
+        return np.array([self.node_index[node_id] for node_id in node_ids], dtype=np.int64)
+
+    def number_of_edges(self) -> int:
+        """Undirected simple edges, self-loops included (as in NetworkX)"""
+        undirected = self.undirected
+        return int((undirected.nnz + undirected.diagonal().sum()) // 2)
+
+    def density(self) -> float:
+        n = self.n_nodes
+        return 2 * self.number_of_edges() / (n * (n - 1)) if n > 1 else 0.0
+
+    def degree(self) -> np.ndarray:
+        """Undirected degree (a self-loop counts twice, as in NetworkX)"""
+        undirected = self.undirected
+        return np.diff(undirected.indptr) + (undirected.diagonal() > 0)
+
+    def degree_centrality(self) -> np.ndarray:
+        n = self.n_nodes
+        return self.degree() / (n - 1) if n > 1 else np.ones(n)
+
+    def connected_components(self) -> Tuple[int, np.ndarray]:
+        """Number of weakly connected components and each node's component"""
+        return connected_components(self.undirected, directed=False)
+
+    def pagerank(self, alpha: float = 0.85, tol: float = 1e-6, max_iter: int = 100,
+                 personalization: Optional[np.ndarray] = None) -> np.ndarray:
+        """PageRank by power iteration on the directed adjacency
+
+        Dangling nodes spread their rank like the teleport vector. With a
+        ``personalization`` vector this is random walk with restart.
+        """
+        n = self.n_nodes
+        if n == 0:
+            return np.zeros(0)
+        teleport = np.full(n, 1.0 / n) if personalization is None else personalization / personalization.sum()
+        out_degree = np.asarray(self.adjacency.sum(axis=1)).ravel()
+        dangling = out_degree == 0
+        transition = sp.diags(np.where(dangling, 0.0, 1.0 / np.maximum(out_degree, 1))) @ self.adjacency
+        transition = transition.T.tocsr()
+
+        rank = teleport.copy()
+        for _ in range(max_iter):
+            previous = rank
+            rank = alpha * (transition @ rank + rank[dangling].sum() * teleport) + (1 - alpha) * teleport
+            if np.abs(rank - previous).sum() < n * tol:
+                break
+        return rank
+
+    def bfs_levels(self, start_ids: List[Hashable], directed: bool = False) -> np.ndarray:
+        """Hop distance of every node from the start nodes (-1 if unreachable)"""
+        adjacency = self.adjacency if directed else self.undirected
+        return shortest_path_levels(adjacency, self.indices(start_ids))
+
+    def neighbors(self, node_id: Hashable) -> List[Hashable]:
+        """Undirected neighbours of a node, raising KeyError if unknown"""
+        undirected = self.undirected
+        index = self.node_index[node_id]
+        row = undirected.indices[undirected.indptr[index]:undirected.indptr[index + 1]]
+        return [self.node_ids[i] for i in row]
+
+    def top_nodes(self, scores: np.ndarray, limit: int) -> Dict[Hashable, float]:
+        """The ``limit`` highest scores by partial selection, keyed by node ID"""
+        if limit < len(scores):
+            top = np.sort(np.argpartition(-scores, limit)[:limit])
+        else:
+            top = np.arange(len(scores))
+        return {self.node_ids[i]: float(scores[i]) for i in top}
+
+
+class SparseGraphCache:
+    """Sparse graphs of recently analysed datasets"""
+
+    def __init__(self, max_graphs: int = MAX_SPARSE_GRAPHS):
+        self.max_graphs = max_graphs
+        self._graphs: "OrderedDict[Hashable, SparseGraph]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, data: Dict[str, Any]) -> SparseGraph:
+        """Return the graph of a dataset, building it once per dataset
+
+        Datasets are recognised by their content hash, so an edited
+        dataset gets a new graph even if its ``id`` and size are unchanged.
+        """
+        key = dataset_hash(data)
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is not None:
+                self._graphs.move_to_end(key)
+                return graph
+        graph = SparseGraph.from_data(data)
+        with self._lock:
+            self._graphs[key] = graph
+            while len(self._graphs) > self.max_graphs:
+                self._graphs.popitem(last=False)
+        return graph
+
+
+sparse_graphs = SparseGraphCache()
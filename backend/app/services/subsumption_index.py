@@ -0,0 +1,370 @@
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from .analysis_cache import dataset_hash
+from .dag_metrics import longest_path_levels
+
+# Relationship types whose transitive closure is materialised by default
+HIERARCHY_RELATIONS = ("subClassOf", "partOf", "part_of")
+
+# Incremental updates may grow the interval count this much before the
+# labels are rebuilt from scratch
+COMPACTION_FACTOR = 2.0
+
+# Indexes kept in memory, least recently used dropped first
+MAX_SUBSUMPTION_INDEXES = 16
+
+
+def _merge_intervals(intervals: np.ndarray) -> np.ndarray:
+    """Union of ``(low, high)`` rows as sorted, disjoint and non-adjacent
+    intervals"""
+    if len(intervals) <= 1:
+        return intervals
+    intervals = intervals[np.argsort(intervals[:, 0], kind="stable")]
+    reach = np.maximum.accumulate(intervals[:, 1])
+    starts = np.flatnonzero(np.concatenate(([True], intervals[1:, 0] > reach[:-1] + 1)))
+    return np.column_stack((intervals[starts, 0], np.maximum.reduceat(intervals[:, 1], starts)))
+
+
+class SubsumptionIndex:
+    """Materialised transitive closure of a class hierarchy
+
+    Edges go from a class to its parent (``source subClassOf target``).
+    Every node gets a label number and keeps the sorted, disjoint
+    intervals of labels of its descendants (itself included). Labels are
+    numbered in postorder over a spanning forest, so a tree-shaped part of
+    the hierarchy costs one interval per node and each extra parent adds
+    the intervals of the class below it (the compressed closure of
+    Agrawal, Borgida and Jagadish).
+
+    "Is A an ancestor of B" is a binary search of B's label among A's few
+    intervals, and the descendants of A are read off its intervals in
+    O(output). Adding an edge merges the child's intervals into the
+    parent and its ancestors; removing one recomputes the intervals of
+    the parent and its ancestors only, children first. Edges that would
+    close a cycle are rejected. Once updates have fragmented the labels
+    past COMPACTION_FACTOR, the labels are rebuilt.
+    """
+
+    def __init__(self, relations: Iterable[str] = HIERARCHY_RELATIONS):
+        self.relations = tuple(relations)
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.node_ids: List[Hashable] = []
+        self.node_index: Dict[Hashable, int] = {}
+        self.rejected: List[Tuple[Hashable, Hashable, str]] = []
+        self._parents: List[Set[int]] = []
+        self._children: List[Set[int]] = []
+        self._edge_relations: Dict[Tuple[int, int], Set[str]] = {}
+        self._label: List[int] = []
+        self._order: List[int] = []
+        self._intervals: List[np.ndarray] = []
+        self._interval_count = 0
+        self._compact_count = 0
+
+    @classmethod
+    def from_data(cls, data: Dict[str, Any], relations: Iterable[str] = HIERARCHY_RELATIONS) -> "SubsumptionIndex":
+        """Index of the hierarchy edges of a ``{"nodes", "edges"}`` dataset"""
+        index = cls(relations)
+        index._build([(edge["source"], edge["target"], edge["type"]) for edge in data["edges"]
+                      if edge.get("type") in index.relations])
+        return index
+
+    def _node(self, node_id: Hashable) -> int:
+        """Index of a node, registering it with a fresh label if new"""
+        node = self.node_index.get(node_id)
+        if node is None:
+            node = len(self.node_ids)
+            self.node_index[node_id] = node
+            self.node_ids.append(node_id)
+            self._parents.append(set())
+            self._children.append(set())
+            self._label.append(len(self._order))
+            self._order.append(node)
+            self._intervals.append(np.array([[self._label[node]] * 2], dtype=np.int64))
+            self._interval_count += 1
+        return node
+
+    def _build(self, triples: List[Tuple[Hashable, Hashable, str]]) -> None:
+        """Label the hierarchy from scratch
+
+        The acyclic part is labelled in bulk: subtree sizes bottom-up and
+        subtree starts top-down, one depth level at a time, then intervals
+        children first. Edges at or below a cycle are added one by one, so
+        the ones closing a cycle are rejected.
+        """
+        node_ids = list(dict.fromkeys(node_id for triple in triples for node_id in triple[:2]))
+        self._reset()
+        n = len(node_ids)
+        self.node_ids = node_ids
+        self.node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+        self._parents = [set() for _ in range(n)]
+        self._children = [set() for _ in range(n)]
+        relations: Dict[Tuple[int, int], Set[str]] = {}
+        for source, target, relation in triples:
+            child, parent = self.node_index[source], self.node_index[target]
+            if child != parent:
+                relations.setdefault((child, parent), set()).add(relation)
+
+        pairs = np.array(list(relations), dtype=np.int64).reshape(-1, 2)
+        down = sp.csr_matrix((np.ones(len(pairs), dtype=np.int8), (pairs[:, 1], pairs[:, 0])), shape=(n, n))
+        depth = longest_path_levels(down)
+        acyclic = depth >= 0
+        # Parents of acyclic nodes are acyclic, so these edges form a DAG
+        tree_edges = pairs[acyclic[pairs[:, 0]]]
+        for child, parent in tree_edges.tolist():
+            self._edge_relations[(child, parent)] = relations[(child, parent)]
+            self._parents[child].add(parent)
+            self._children[parent].add(child)
+
+        # Spanning forest: each node hangs below its first parent
+        tree_parent = np.full(n, -1, dtype=np.int64)
+        first = np.unique(tree_edges[:, 0], return_index=True)[1] if len(tree_edges) else np.zeros(0, dtype=np.int64)
+        tree_parent[tree_edges[first, 0]] = tree_edges[first, 1]
+        levels = [np.flatnonzero(depth == level) for level in range(int(depth.max()) + 1 if n else 0)]
+
+        size = acyclic.astype(np.int64)
+        for nodes in reversed(levels):
+            attached = nodes[tree_parent[nodes] >= 0]
+            np.add.at(size, tree_parent[attached], size[attached])
+        # Siblings (and roots) take consecutive ranges, children inside their
+        # parent's range before the parent itself
+        siblings = np.flatnonzero(acyclic)
+        siblings = siblings[np.lexsort((siblings, tree_parent[siblings]))]
+        offsets = np.cumsum(size[siblings]) - size[siblings]
+        group_start = np.concatenate(([True], tree_parent[siblings][1:] != tree_parent[siblings][:-1]))
+        offset = np.zeros(n, dtype=np.int64)
+        offset[siblings] = offsets - np.maximum.accumulate(np.where(group_start, offsets, 0))
+        start = np.zeros(n, dtype=np.int64)
+        for nodes in levels:
+            parents = tree_parent[nodes]
+            start[nodes] = np.where(parents >= 0, start[np.maximum(parents, 0)], 0) + offset[nodes]
+        post = start + size - 1
+
+        labelled = int(acyclic.sum())
+        label = np.where(acyclic, post, 0)
+        label[~acyclic] = labelled + np.arange(n - labelled)
+        self._label = label.tolist()
+        order = np.empty(n, dtype=np.int64)
+        order[label] = np.arange(n)
+        self._order = order.tolist()
+
+        self._intervals = [np.array([[label[i]] * 2], dtype=np.int64) for i in range(n)]
+        tree_interval = np.column_stack((start, post))
+        for nodes in reversed(levels):
+            for node in nodes.tolist():
+                # A tree child's own range lies inside this node's range;
+                # only its extra intervals (or a non-tree child's) are added
+                extra = [self._intervals[child] for child in self._children[node]
+                         if tree_parent[child] != node or len(self._intervals[child]) > 1
+                         or (self._intervals[child][0] != tree_interval[child]).any()]
+                own = tree_interval[node:node + 1]
+                self._intervals[node] = _merge_intervals(np.concatenate([own] + extra)) if extra else own
+        self._interval_count = sum(len(intervals) for intervals in self._intervals)
+
+        for (child, parent), edge_relations in relations.items():
+            if not acyclic[child]:
+                for relation in sorted(edge_relations):
+                    self._add_edge(child, parent, relation)
+        self._compact_count = self._interval_count
+
+    def _contains(self, ancestor: int, node: int) -> bool:
+        """Whether ``node`` is ``ancestor`` or one of its descendants"""
+        intervals = self._intervals[ancestor]
+        label = self._label[node]
+        i = int(np.searchsorted(intervals[:, 1], label))
+        return i < len(intervals) and bool(intervals[i, 0] <= label)
+
+    def _ancestor_nodes(self, node: int) -> List[int]:
+        """``node`` and its ancestors, by a walk up the parent sets"""
+        seen = {node}
+        stack = [node]
+        while stack:
+            for parent in self._parents[stack.pop()]:
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        return list(seen)
+
+    def _set_intervals(self, node: int, intervals: np.ndarray) -> None:
+        self._interval_count += len(intervals) - len(self._intervals[node])
+        self._intervals[node] = intervals
+
+    def _add_edge(self, child: int, parent: int, relation: str) -> bool:
+        """Add ``child -> parent``, returning False if it closes a cycle"""
+        if child == parent:
+            return True
+        relations = self._edge_relations.get((child, parent))
+        if relations is not None:
+            relations.add(relation)
+            return True
+        if self._contains(child, parent):
+            self.rejected.append((self.node_ids[child], self.node_ids[parent], relation))
+            return False
+        self._edge_relations[(child, parent)] = {relation}
+        self._parents[child].add(parent)
+        self._children[parent].add(child)
+        if not self._contains(parent, child):
+            added = self._intervals[child]
+            for node in self._ancestor_nodes(parent):
+                self._set_intervals(node, _merge_intervals(np.concatenate((self._intervals[node], added))))
+        return True
+
+    def _remove_edge(self, child: int, parent: int, relation: str) -> bool:
+        """Remove ``child -> parent`` for ``relation``, returning False if
+        it is not there"""
+        relations = self._edge_relations.get((child, parent))
+        if relations is None or relation not in relations:
+            return False
+        relations.discard(relation)
+        if relations:
+            return True
+        del self._edge_relations[(child, parent)]
+        self._parents[child].discard(parent)
+        self._children[parent].discard(child)
+
+        # Only the parent and its ancestors lose descendants; recompute
+        # them children first (Kahn's order within the affected set)
+        affected = set(self._ancestor_nodes(parent))
+        pending = {node: sum(1 for below in self._children[node] if below in affected) for node in affected}
+        ready = [node for node, count in pending.items() if count == 0]
+        while ready:
+            node = ready.pop()
+            own = np.array([[self._label[node]] * 2], dtype=np.int64)
+            self._set_intervals(node, _merge_intervals(np.concatenate(
+                [own] + [self._intervals[below] for below in self._children[node]])))
+            for above in self._parents[node]:
+                pending[above] -= 1
+                if pending[above] == 0:
+                    ready.append(above)
+        return True
+
+    def _maybe_compact(self) -> None:
+        if self._interval_count > COMPACTION_FACTOR * max(self._compact_count, len(self.node_ids)):
+            self._build([(self.node_ids[child], self.node_ids[parent], relation)
+                         for (child, parent), relations in self._edge_relations.items()
+                         for relation in sorted(relations)] +
+                        [(node_id, node_id, "") for node_id in self.node_ids])
+
+    def update(self, add: Iterable[Dict[str, Any]] = (), remove: Iterable[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        """Apply added and removed triples (edges with ``source``,
+        ``target`` and ``type``); other relationship types are ignored"""
+        added, removed, rejected, ignored = 0, 0, [], 0
+        with self._lock:
+            for edge in remove:
+                child, parent = self.node_index.get(edge["source"]), self.node_index.get(edge["target"])
+                if edge.get("type") in self.relations and child is not None and parent is not None \
+                        and self._remove_edge(child, parent, edge["type"]):
+                    removed += 1
+                else:
+                    ignored += 1
+            for edge in add:
+                if edge.get("type") not in self.relations:
+                    ignored += 1
+                elif self._add_edge(self._node(edge["source"]), self._node(edge["target"]), edge["type"]):
+                    added += 1
+                else:
+                    rejected.append(self.rejected[-1])
+            self._maybe_compact()
+        return {"added": added, "removed": removed, "ignored": ignored,
+                "rejected": [{"source": source, "target": target, "type": relation}
+                             for source, target, relation in rejected]}
+
+    def is_ancestor(self, ancestor: Hashable, node: Hashable) -> bool:
+        """Whether ``ancestor`` is a proper ancestor of ``node`` (False for
+        nodes outside the hierarchy)"""
+        with self._lock:
+            a, b = self.node_index.get(ancestor), self.node_index.get(node)
+            return a is not None and b is not None and a != b and self._contains(a, b)
+
+    def descendants(self, node_id: Hashable, limit: Optional[int] = None) -> List[Hashable]:
+        """Proper descendants of a node, raising KeyError if it is unknown"""
+        with self._lock:
+            node = self.node_index[node_id]
+            found = []
+            for low, high in self._intervals[node].tolist():
+                found.extend(self._order[low:high + 1])
+                if limit is not None and len(found) > limit:
+                    break
+            found = [self.node_ids[other] for other in found if other != node]
+            return found if limit is None else found[:limit]
+
+    def descendant_count(self, node_id: Hashable) -> int:
+        """Number of proper descendants, from the interval lengths alone"""
+        with self._lock:
+            intervals = self._intervals[self.node_index[node_id]]
+            return int((intervals[:, 1] - intervals[:, 0] + 1).sum()) - 1
+
+    def ancestors(self, node_id: Hashable) -> List[Hashable]:
+        """Proper ancestors of a node, raising KeyError if it is unknown"""
+        with self._lock:
+            node = self.node_index[node_id]
+            return [self.node_ids[other] for other in self._ancestor_nodes(node) if other != node]
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "relations": list(self.relations),
+                "num_nodes": len(self.node_ids),
+                "num_edges": len(self._edge_relations),
+                "num_intervals": self._interval_count,
+                "rejected_edges": len(self.rejected)
+            }
+
+
+class SubsumptionIndexStore:
+    """Subsumption indexes built for datasets or registered by ID"""
+
+    def __init__(self, max_indexes: int = MAX_SUBSUMPTION_INDEXES):
+        self.max_indexes = max_indexes
+        self._indexes: "OrderedDict[Hashable, SubsumptionIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key: Hashable, index: SubsumptionIndex) -> None:
+        with self._lock:
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+
+    def for_dataset(self, data: Dict[str, Any], relations: Iterable[str] = HIERARCHY_RELATIONS) -> SubsumptionIndex:
+        """Read-only index of a dataset, built once per dataset (recognised
+        like in SparseGraphCache by content hash)"""
+        relations = tuple(relations)
+        key = ("dataset", dataset_hash(data), relations)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        index = SubsumptionIndex.from_data(data, relations)
+        self._remember(key, index)
+        return index
+
+    def add(self, index: SubsumptionIndex) -> str:
+        """Register an index for updates and queries, returning its ID"""
+        index_id = uuid.uuid4().hex
+        self._remember(index_id, index)
+        return index_id
+
+    def get(self, index_id: str) -> SubsumptionIndex:
+        """Look up a registered index, raising KeyError when unknown or evicted"""
+        with self._lock:
+            index = self._indexes[index_id]
+            self._indexes.move_to_end(index_id)
+            return index
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = [(key, index) for key, index in self._indexes.items() if isinstance(key, str)]
+        return [{"index_id": key, **index.summary()} for key, index in entries]
+
+
+subsumption_indexes = SubsumptionIndexStore()
@@ -0,0 +1,223 @@
+import json
+import struct
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .compact_tree import CompactTree
+
+TAXONIUM_ENCODINGS = ("rows", "columnar", "binary")
+
+# Binary payload: magic, header length, JSON header, then 8-byte aligned buffers
+BINARY_MAGIC = b"TXC1"
+BINARY_MEDIA_TYPE = "application/octet-stream"
+_ALIGNMENT = 8
+
+# Support reported for nodes without one, as ETE3 did for every node
+DEFAULT_SUPPORT = 1.0
+
+Columns = Dict[str, Union[np.ndarray, List[Any]]]
+
+
+def validate_encoding(encoding: Optional[str], allowed: Tuple[str, ...] = TAXONIUM_ENCODINGS) -> str:
+    """Normalise a requested Taxonium encoding, raising on unknown encodings"""
+    encoding = encoding or "rows"
+    if encoding not in allowed:
+        raise ValueError(f"Unsupported encoding: {encoding}. Use one of: {', '.join(allowed)}")
+    return encoding
+
+
+def tree_columns(tree: CompactTree) -> Tuple[Columns, Columns]:
+    """Node and metadata columns of a compact tree, in preorder
+
+    Leaves and unlabelled internal nodes have no support (NaN) in the
+    compact tree; payloads report DEFAULT_SUPPORT for them, so every node
+    keeps a ``support`` value as in the original ETE3-built rows.
+    """
+    parent = tree.parent.astype(np.int32)
+    columns = {
+        "id": np.arange(tree.n_nodes, dtype=np.int32),
+        "parentId": parent,
+        "name": list(tree.names),
+        "branch_length": tree.branch_lengths,
+    }
+    return columns, {"support": np.where(np.isnan(tree.support), DEFAULT_SUPPORT, tree.support)}
+
+
+def nodes_to_columns(nodes: List[Dict[str, Any]]) -> Tuple[Columns, Columns]:
+    """Transpose per-node dicts into node and metadata columns
+
+    A key missing from some nodes becomes ``None`` in their rows.
+    """
+    keys: Dict[str, None] = {}
+    metadata_keys: Dict[str, None] = {}
+    for node in nodes:
+        keys.update(dict.fromkeys(key for key in node if key != "metadata"))
+        metadata_keys.update(dict.fromkeys(node.get("metadata", {})))
+
+    columns = {key: [node.get(key) for node in nodes] for key in keys}
+    if "parentId" in columns:
+        columns["parentId"] = [-1 if value is None else value for value in columns["parentId"]]
+    metadata_columns = {
+        key: [node.get("metadata", {}).get(key) for node in nodes] for key in metadata_keys
+    }
+    return columns, metadata_columns
+
+
+def columns_to_nodes(columns: Columns, metadata_columns: Columns) -> List[Dict[str, Any]]:
+    """Expand columns back into per-node dicts (the default ``rows`` encoding)"""
+    plain = {key: column_to_list(values) for key, values in columns.items()}
+    metadata = {key: column_to_list(values) for key, values in metadata_columns.items()}
+    count = len(next(iter(plain.values()))) if plain else 0
+
+    if "parentId" in plain:
+        plain["parentId"] = [None if value == -1 else value for value in plain["parentId"]]
+
+    nodes = []
+    for index in range(count):
+        node = {key: values[index] for key, values in plain.items()}
+        node["metadata"] = {
+            key: values[index] for key, values in metadata.items() if values[index] is not None
+        }
+        nodes.append(node)
+    return nodes
+
+
+def encode_taxonium(columns: Columns, metadata_columns: Columns, metadata: Dict[str, Any],
+                    encoding: str = "rows") -> Union[Dict[str, Any], bytes]:
+    """Encode a Taxonium tree as rows, parallel JSON arrays or binary buffers
+
+    ``columnar`` keeps the JSON response but sends one array per field
+    instead of one object per node. ``binary`` returns the bytes of a
+    typed-array payload (see ``encode_binary``).
+    """
+    if encoding == "rows":
+        return {"nodes": columns_to_nodes(columns, metadata_columns), "metadata": metadata}
+    if encoding == "binary":
+        return encode_binary(columns, metadata_columns, metadata)
+
+    return {
+        "encoding": "columnar",
+        "count": _column_length(columns),
+        "columns": {key: column_to_list(values) for key, values in columns.items()},
+        "metadata_columns": {key: column_to_list(values) for key, values in metadata_columns.items()},
+        "metadata": metadata
+    }
+
+
+def encode_binary(columns: Columns, metadata_columns: Columns, metadata: Dict[str, Any]) -> bytes:
+    """Pack columns into little-endian typed-array buffers
+
+    Layout: ``TXC1``, a uint32 header length, the UTF-8 JSON header padded
+    to 8 bytes, then the buffers. The header lists every column with its
+    group (``node`` or ``metadata``), dtype (``int32``, ``float64``,
+    ``uint8`` or ``utf8``) and ``[offset, byteLength]`` buffers relative to
+    the end of the header; every offset is 8-byte aligned so clients can
+    view the buffers directly as typed arrays. Missing numbers are NaN;
+    ``utf8`` columns have an int32 offsets buffer followed by the bytes.
+    """
+    buffers: List[bytes] = []
+    descriptions = []
+    position = 0
+
+    def add_buffer(data: bytes) -> List[int]:
+        nonlocal position
+        padding = -len(data) % _ALIGNMENT
+        buffers.append(data + b"\0" * padding)
+        span = [position, len(data)]
+        position += len(data) + padding
+        return span
+
+    for group, group_columns in (("node", columns), ("metadata", metadata_columns)):
+        for name, values in group_columns.items():
+            dtype, array = _typed_column(values)
+            if dtype == "utf8":
+                encoded = [value.encode("utf-8") for value in array]
+                offsets = np.zeros(len(encoded) + 1, dtype="<i4")
+                np.cumsum([len(value) for value in encoded], out=offsets[1:])
+                spans = [add_buffer(offsets.tobytes()), add_buffer(b"".join(encoded))]
+            else:
+                spans = [add_buffer(array.astype(np.dtype(dtype).newbyteorder("<")).tobytes())]
+            descriptions.append({"name": name, "group": group, "dtype": dtype, "buffers": spans})
+
+    header = json.dumps({
+        "encoding": "binary",
+        "count": _column_length(columns),
+        "columns": descriptions,
+        "metadata": metadata
+    }, default=_json_default).encode("utf-8")
+    header += b" " * (-len(header) % _ALIGNMENT)
+    return BINARY_MAGIC + struct.pack("<I", len(header)) + header + b"".join(buffers)
+
+
+def decode_binary(payload: bytes) -> Tuple[Columns, Columns, Dict[str, Any]]:
+    """Read the node columns, metadata columns and metadata of a binary
+    payload (the inverse of ``encode_binary``; missing numbers come back
+    as NaN and missing strings as empty strings)"""
+    if payload[:4] != BINARY_MAGIC:
+        raise ValueError("Not a binary Taxonium payload")
+    header_length = struct.unpack("<I", payload[4:8])[0]
+    header = json.loads(payload[8:8 + header_length])
+    body = memoryview(payload)[8 + header_length:]
+
+    groups: Dict[str, Columns] = {"node": {}, "metadata": {}}
+    for description in header["columns"]:
+        spans = [body[offset:offset + length] for offset, length in description["buffers"]]
+        if description["dtype"] == "utf8":
+            offsets = np.frombuffer(spans[0], dtype="<i4")
+            data = bytes(spans[1])
+            values = [data[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+        else:
+            values = np.frombuffer(spans[0], dtype=np.dtype(description["dtype"]).newbyteorder("<"))
+            if description["dtype"] == "uint8":
+                values = values.astype(bool)
+        groups[description["group"]][description["name"]] = values
+    return groups["node"], groups["metadata"], header["metadata"]
+
+
+def _column_length(columns: Columns) -> int:
+    return len(next(iter(columns.values()))) if columns else 0
+
+
+def column_to_list(values: Union[np.ndarray, List[Any]]) -> List[Any]:
+    """JSON-ready list of a column, with NaN as ``None``"""
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind == "f":
+            return [None if value != value else value for value in values.tolist()]
+        return values.tolist()
+    return [None if isinstance(value, float) and value != value else value for value in values]
+
+
+def _typed_column(values: Union[np.ndarray, List[Any]]) -> Tuple[str, Any]:
+    """Pick the binary dtype of a column"""
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind == "b":
+            return "uint8", values.astype(np.uint8)
+        if values.dtype.kind in "iu" and values.size and \
+                np.iinfo(np.int32).min <= values.min() and values.max() <= np.iinfo(np.int32).max:
+            return "int32", values.astype(np.int32)
+        if values.dtype.kind in "iuf":
+            return "float64", values.astype(np.float64)
+        values = values.tolist()
+
+    present = [value for value in values if value is not None]
+    if all(isinstance(value, bool) for value in present) and len(present) == len(values):
+        return "uint8", np.array(values, dtype=np.uint8)
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in present) \
+            and len(present) == len(values) \
+            and all(-2 ** 31 <= value < 2 ** 31 for value in present):
+        return "int32", np.array(values, dtype=np.int32)
+    if all(isinstance(value, (int, float)) for value in present):
+        return "float64", np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    return "utf8", [
+        "" if value is None else value if isinstance(value, str) else json.dumps(value, default=_json_default)
+        for value in values
+    ]
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,157 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, BinaryIO
+
+import numpy as np
+import pandas as pd
+
+from .compact_tree import CompactTree
+from .tree_cache import CachedTree
+
+# Annotation tables kept in memory, least recently used dropped first
+MAX_ANNOTATION_TABLES = 32
+
+
+class AnnotationTable:
+    """Node annotations keyed by node name, stored column by column
+
+    The key column becomes a unique pandas index, so joining a tree is one
+    ``get_indexer`` lookup for all nodes followed by one take per column.
+    """
+
+    def __init__(self, frame: pd.DataFrame, key_column: Optional[str] = None, table_id: Optional[str] = None):
+        if frame.empty or len(frame.columns) < 2:
+            raise ValueError("Annotation table needs a name column and at least one value column")
+        key_column = key_column or frame.columns[0]
+        if key_column not in frame.columns:
+            raise ValueError(f"Key column '{key_column}' not found in annotation table")
+
+        keys = frame[key_column].astype(str).str.strip()
+        frame = frame.drop(columns=[key_column])
+        frame.index = pd.Index(keys)
+        # Later duplicates of a name are ignored, as with dict-based annotations
+        frame = frame[~frame.index.duplicated(keep="first")]
+
+        self.key_column = key_column
+        self.frame = frame
+        if table_id is None:
+            digest = hashlib.sha1("\t".join(map(str, frame.columns)).encode("utf-8"))
+            digest.update(pd.util.hash_pandas_object(frame, index=True).values.tobytes())
+            table_id = digest.hexdigest()
+        self.table_id = table_id
+
+    @classmethod
+    def from_csv(cls, source: BinaryIO, filename: Optional[str] = None,
+                 key_column: Optional[str] = None) -> "AnnotationTable":
+        """Read a CSV or TSV file (tab-separated when named .tsv/.tab/.txt)"""
+        separator = "\t" if filename and filename.lower().endswith((".tsv", ".tab", ".txt")) else ","
+        try:
+            frame = pd.read_csv(source, sep=separator)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+            raise ValueError(f"Could not read annotation table: {e}")
+        return cls(frame, key_column)
+
+    @classmethod
+    def from_dict(cls, annotations: Dict[str, Dict[str, Any]]) -> "AnnotationTable":
+        """Build a table from ``{node name: {column: value}}`` annotations"""
+        frame = pd.DataFrame.from_dict(annotations, orient="index")
+        frame.insert(0, "name", frame.index.astype(str))
+        return cls(frame.reset_index(drop=True), "name")
+
+    @property
+    def columns(self) -> List[str]:
+        return [str(column) for column in self.frame.columns]
+
+    def summary(self) -> Dict[str, Any]:
+        """Short description of the table"""
+        return {
+            "table_id": self.table_id,
+            "key_column": self.key_column,
+            "columns": self.columns,
+            "num_rows": len(self.frame)
+        }
+
+    def join(self, tree: CompactTree, columns: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Join the table onto tree nodes by name
+
+        Returns the matched row of every node (-1 when unmatched) and one
+        array per column in node order: float64 with NaN for numeric
+        columns, object arrays with ``None`` otherwise. Quoted node names
+        also match their unquoted form.
+        """
+        columns = columns or self.columns
+        missing = [column for column in columns if column not in self.frame.columns]
+        if missing:
+            raise KeyError(f"Columns not found in annotation table: {', '.join(missing)}")
+
+        names = pd.Index(tree.names)
+        rows = self.frame.index.get_indexer(names)
+        unmatched = rows < 0
+        if unmatched.any():
+            stripped = pd.Index([name.strip("'\"") for name in np.asarray(tree.names, dtype=object)[unmatched]])
+            rows[unmatched] = self.frame.index.get_indexer(stripped)
+        matched = rows >= 0
+
+        values = {}
+        for column in columns:
+            series = self.frame[column]
+            if pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+                source = series.to_numpy(dtype=object)
+                joined = np.full(tree.n_nodes, None, dtype=object)
+                joined[matched] = source[rows[matched]]
+                joined[pd.isna(joined)] = None
+            else:
+                source = series.to_numpy(dtype=np.float64, na_value=np.nan)
+                joined = np.full(tree.n_nodes, np.nan)
+                joined[matched] = source[rows[matched]]
+            values[column] = joined
+        return {"rows": rows, "columns": values}
+
+
+def annotated_nodes(tree: CompactTree, columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Boolean mask of the nodes with a value in at least one joined column"""
+    mask = np.zeros(tree.n_nodes, dtype=bool)
+    for values in columns.values():
+        mask |= pd.notna(values)
+    return mask
+
+
+class AnnotationTableStore:
+    """Registered annotation tables, looked up by table ID"""
+
+    def __init__(self, max_tables: int = MAX_ANNOTATION_TABLES):
+        self.max_tables = max_tables
+        self._tables: "OrderedDict[str, AnnotationTable]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, table: AnnotationTable) -> AnnotationTable:
+        """Register a table, returning the existing one for identical content"""
+        with self._lock:
+            existing = self._tables.get(table.table_id)
+            if existing is not None:
+                self._tables.move_to_end(table.table_id)
+                return existing
+            self._tables[table.table_id] = table
+            while len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)
+            return table
+
+    def get(self, table_id: str) -> AnnotationTable:
+        """Look up a table, raising KeyError when unknown or evicted"""
+        with self._lock:
+            table = self._tables[table_id]
+            self._tables.move_to_end(table_id)
+            return table
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [table.summary() for table in self._tables.values()]
+
+
+annotation_tables = AnnotationTableStore()
+
+
+def get_tree_annotations(entry: CachedTree, table: AnnotationTable) -> Dict[str, Any]:
+    """Return the cached join of an annotation table onto a tree"""
+    return entry.get_derived(("annotations", table.table_id), lambda: table.join(entry.tree))
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Hashable, Optional
+
+import numpy as np
+
+from .compact_tree import CompactTree, LCAIndex
+from .newick_writer import write_newick
+
+# Default memory budget of the parsed-tree cache (256 MB)
+DEFAULT_TREE_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def normalize_newick(newick_str: str) -> str:
+    """Normalise a Newick string so equivalent uploads share a cache entry"""
+    return newick_str.strip().replace("\r", "").replace("\n", "").replace("\t", "")
+
+
+def tree_hash(newick_str: str) -> str:
+    """Content address of a Newick string, used as its tree ID"""
+    return hashlib.sha1(normalize_newick(newick_str).encode("utf-8")).hexdigest()
+
+
+def estimate_size(obj: Any, seen: Optional[set] = None) -> int:
+    """Rough memory footprint of an object graph in bytes"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), seen)
+    return size
+
+
+class CachedTree:
+    """A parsed tree plus lazily built derived indexes"""
+
+    def __init__(self, cache: "TreeCache", tree_id: str, newick: Optional[str], tree: CompactTree):
+        self.cache = cache
+        self.tree_id = tree_id
+        self._newick = newick
+        self.tree = tree
+        self.derived: Dict[Hashable, Any] = {}
+        self.nbytes = estimate_size(tree) + (sys.getsizeof(newick) if newick is not None else 0)
+
+    @property
+    def newick(self) -> str:
+        """Newick string of the tree, serialised on demand for uploaded files"""
+        if self._newick is None:
+            self._newick = write_newick(self.tree)
+            self.cache._account(self, sys.getsizeof(self._newick))
+        return self._newick
+
+    def get_derived(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return a derived index, building and caching it on first use"""
+        if key not in self.derived:
+            value = factory()
+            # Do not count the tree or other derived indexes twice
+            seen = {id(self.tree)} | {id(other) for other in self.derived.values()}
+            self.derived[key] = value
+            self.cache._account(self, estimate_size(value, seen))
+        return self.derived[key]
+
+    @property
+    def lca(self) -> LCAIndex:
+        """LCA index of the tree"""
+        return self.get_derived("lca", lambda: LCAIndex(self.tree))
+
+    def summary(self) -> Dict[str, Any]:
+        """Short description of the cached tree"""
+        return {
+            "tree_id": self.tree_id,
+            "num_nodes": self.tree.n_nodes,
+            "num_leaves": int(self.tree.is_leaf.sum()),
+            "derived": sorted(str(key) for key in self.derived),
+            "bytes": self.nbytes
+        }
+
+
+class TreeCache:
+    """Content-addressed LRU cache of parsed trees under a byte budget"""
+
+    def __init__(self, max_bytes: int = DEFAULT_TREE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CachedTree]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, tree_id: str) -> CachedTree:
+        """Look up a cached tree by ID, raising KeyError when it was evicted"""
+        with self._lock:
+            entry = self._entries.get(tree_id)
+            if entry is None:
+                self.misses += 1
+                raise KeyError(tree_id)
+            self._entries.move_to_end(tree_id)
+            self.hits += 1
+            return entry
+
+    def put(self, newick_str: str, tree: Optional[CompactTree] = None) -> CachedTree:
+        """Return the entry for a Newick string, parsing it only on a miss"""
+        newick = normalize_newick(newick_str)
+        tree_id = tree_hash(newick)
+        with self._lock:
+            entry = self._entries.get(tree_id)
+            if entry is not None:
+                self._entries.move_to_end(tree_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        if tree is None:
+            tree = CompactTree.from_newick(newick)
+        return self.add(tree_id, tree, newick)
+
+    def add(self, tree_id: str, tree: CompactTree, newick: Optional[str] = None) -> CachedTree:
+        """Cache an already parsed tree under a known ID (e.g. a streamed upload)"""
+        entry = CachedTree(self, tree_id, newick, tree)
+        with self._lock:
+            if tree_id in self._entries:
+                return self._entries[tree_id]
+            self._entries[tree_id] = entry
+            self.total_bytes += entry.nbytes
+            self._evict(keep=tree_id)
+        return entry
+
+    def _account(self, entry: CachedTree, nbytes: int) -> None:
+        """Record memory used by a new derived index"""
+        with self._lock:
+            entry.nbytes += nbytes
+            if self._entries.get(entry.tree_id) is entry:
+                self.total_bytes += nbytes
+                self._evict(keep=entry.tree_id)
+
+    def _evict(self, keep: str) -> None:
+        """Drop least recently used entries until the budget is met"""
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            tree_id = next(iter(self._entries))
+            if tree_id == keep:
+                self._entries.move_to_end(tree_id)
+                tree_id = next(iter(self._entries))
+            evicted = self._entries.pop(tree_id)
+            self.total_bytes -= evicted.nbytes
+
+    def clear(self) -> None:
+        """Remove every cached tree"""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache occupancy and hit statistics"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+tree_cache = TreeCache(int(os.environ.get("TREE_CACHE_MAX_BYTES", DEFAULT_TREE_CACHE_BYTES)))
@@ -0,0 +1,44 @@
+from typing import Optional
+
+import numpy as np
+
+from .compact_tree import LCAIndex
+from .tree_cache import CachedTree
+
+# Rows of the distance matrix computed per vectorised LCA batch
+DEFAULT_BLOCK_ROWS = 512
+
+# Largest number of leaves whose full distance matrix is materialised
+# (5000 leaves are a 100 MB float32 matrix)
+MAX_PATRISTIC_LEAVES = 5000
+
+
+def patristic_distances(index: LCAIndex, nodes: Optional[np.ndarray] = None,
+                        block_rows: int = DEFAULT_BLOCK_ROWS) -> np.ndarray:
+    """All-pairs patristic distances between nodes (leaves by default)
+
+    d(a, b) = root_distance[a] + root_distance[b] - 2 * root_distance[lca(a, b)],
+    evaluated for blocks of rows with one vectorised LCA query per block.
+    """
+    tree = index.tree
+    if nodes is None:
+        nodes = np.flatnonzero(tree.is_leaf)
+    nodes = np.asarray(nodes, dtype=np.int64)
+    root_distance = tree.root_distance[nodes]
+
+    matrix = np.empty((len(nodes), len(nodes)), dtype=np.float32)
+    for start in range(0, len(nodes), block_rows):
+        rows = nodes[start:start + block_rows]
+        u = np.repeat(rows, len(nodes))
+        v = np.tile(nodes, len(rows))
+        ancestors = index.lca_many(u, v).reshape(len(rows), len(nodes))
+        matrix[start:start + len(rows)] = (
+            root_distance[start:start + len(rows), np.newaxis] + root_distance[np.newaxis, :]
+            - 2 * tree.root_distance[ancestors]
+        )
+    return matrix
+
+
+def get_patristic_matrix(entry: CachedTree) -> np.ndarray:
+    """Return the cached leaf x leaf patristic distance matrix of a tree"""
+    return entry.get_derived("patristic", lambda: patristic_distances(entry.lca))
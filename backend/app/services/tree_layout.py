@@ -0,0 +1,76 @@
+from typing import Dict, Any, List
+
+import numpy as np
+
+from .compact_tree import CompactTree
+from .tree_cache import CachedTree
+
+LAYOUT_TYPES = ("rectangular", "radial")
+
+
+def compute_layout(tree: CompactTree, use_branch_lengths: bool = True) -> Dict[str, np.ndarray]:
+    """Compute rectangular and radial node coordinates for a compact tree
+
+    Leaves are spaced one unit apart in preorder and each internal node sits
+    at the mean height of its children (one level-synchronous postorder
+    pass). The x axis is the root distance, or the depth for cladograms.
+    """
+    x = tree.root_distance if use_branch_lengths else tree.depth.astype(np.float64)
+
+    y = np.zeros(tree.n_nodes)
+    y[tree.is_leaf] = np.arange(int(tree.is_leaf.sum()))
+    for level in reversed(tree.levels[1:]):
+        internal = ~tree.is_leaf[level]
+        nodes = level[internal]
+        y[nodes] /= tree.child_count[nodes]
+        np.add.at(y, tree.parent[level], y[level])
+    if not tree.is_leaf[0]:
+        y[0] /= tree.child_count[0]
+
+    # Radial layout: leaf order maps to angle, x to radius
+    leaf_total = max(int(tree.is_leaf.sum()), 1)
+    angle = 2 * np.pi * y / leaf_total
+    return {
+        "x": x,
+        "y": y,
+        "x_radial": x * np.cos(angle),
+        "y_radial": x * np.sin(angle),
+    }
+
+
+def get_tree_layout(entry: CachedTree, use_branch_lengths: bool = True) -> Dict[str, np.ndarray]:
+    """Return the cached layout of a tree, computing it if needed"""
+    return entry.get_derived(("layout", use_branch_lengths),
+                             lambda: compute_layout(entry.tree, use_branch_lengths))
+
+
+def validate_layout_types(layouts: Any) -> List[str]:
+    """Normalise a requested layout list, raising on unknown layouts"""
+    if not layouts:
+        return []
+    if isinstance(layouts, str):
+        layouts = [layouts]
+    unknown = [layout for layout in layouts if layout not in LAYOUT_TYPES]
+    if unknown:
+        raise ValueError(f"Unsupported layout: {', '.join(unknown)}. Use one of: {', '.join(LAYOUT_TYPES)}")
+    return list(layouts)
+
+
+def layout_columns(layout: Dict[str, np.ndarray], layouts: List[str]) -> Dict[str, np.ndarray]:
+    """Coordinate columns of the requested layouts, keyed by Taxonium field"""
+    columns = {}
+    if "rectangular" in layouts:
+        columns["x_dist"] = layout["x"]
+        columns["y"] = layout["y"]
+    if "radial" in layouts:
+        columns["x_radial"] = layout["x_radial"]
+        columns["y_radial"] = layout["y_radial"]
+    return columns
+
+
+def add_layout_to_nodes(nodes: List[Dict[str, Any]], layout: Dict[str, np.ndarray],
+                        layouts: List[str]) -> None:
+    """Attach coordinates to Taxonium nodes listed in preorder"""
+    for key, values in layout_columns(layout, layouts).items():
+        for node, value in zip(nodes, values.tolist()):
+            node[key] = value
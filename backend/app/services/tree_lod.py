@@ -0,0 +1,172 @@
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from .compact_tree import CompactTree
+from .taxonium_format import DEFAULT_SUPPORT
+from .tree_cache import CachedTree
+from .tree_layout import get_tree_layout
+
+# Node budget of the coarsest zoom level; each zoom level quadruples it
+LOD_BASE_NODES = 256
+LOD_ZOOM_FACTOR = 4
+
+
+class TreeLODService:
+    """Level-of-detail summaries of a tree for zoomable viewing
+
+    Clades are expanded largest first, so a zoom level is a node budget and
+    every clade that does not fit is returned as one collapsed summary node.
+    Since a parent never has fewer leaves than its children, the expansion
+    order always opens ancestors before descendants.
+    """
+
+    def __init__(self, tree: CompactTree, layout: Dict[str, np.ndarray]):
+        self.tree = tree
+        self.layout = layout
+
+        # Leaves of a subtree are contiguous in preorder, so each clade
+        # covers a contiguous range of leaf positions (the layout's y axis)
+        leaf_flags = tree.is_leaf.astype(np.int64)
+        self.leaf_first = np.cumsum(leaf_flags) - leaf_flags
+        self.leaf_last = self.leaf_first + tree.leaf_count - 1
+
+        # Root-distance range of the leaves below each node
+        leaf_distance = tree.root_distance
+        self.min_leaf_distance = tree.postorder_reduce(
+            np.where(tree.is_leaf, leaf_distance, np.inf), np.minimum)
+        self.max_leaf_distance = tree.postorder_reduce(
+            np.where(tree.is_leaf, leaf_distance, -np.inf), np.maximum)
+
+        # Internal nodes ordered for expansion: most leaves first, then preorder
+        internal = np.flatnonzero(~tree.is_leaf)
+        self.expansion_order = internal[np.lexsort((internal, -tree.leaf_count[internal]))]
+
+        # Precomputed node budgets of the full view at each zoom level
+        visible_after = 1 + np.cumsum(tree.child_count[self.expansion_order])
+        self.zoom_expansions = []
+        budget = LOD_BASE_NODES
+        while True:
+            self.zoom_expansions.append(int(np.searchsorted(visible_after, budget, side="right")))
+            if self.zoom_expansions[-1] >= len(self.expansion_order):
+                break
+            budget *= LOD_ZOOM_FACTOR
+
+    @property
+    def max_zoom(self) -> int:
+        """Zoom level at which every node is visible"""
+        return len(self.zoom_expansions) - 1
+
+    def clamp_zoom(self, zoom: int) -> int:
+        """Nearest available zoom level"""
+        return min(max(zoom, 0), self.max_zoom)
+
+    def aggregate_metadata(self, node_metadata: Dict[str, Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """Sum numeric leaf metadata over every clade"""
+        columns = {}
+        for name, values in node_metadata.items():
+            index = self.tree.name_to_index.get(name)
+            if index is None:
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    if key not in columns:
+                        columns[key] = np.zeros(self.tree.n_nodes)
+                    columns[key][index] = value
+        return {key: self.tree.postorder_sum(column) for key, column in columns.items()}
+
+    def visible_nodes(self, zoom: int = 0, y_min: Optional[float] = None,
+                      y_max: Optional[float] = None, max_nodes: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Select the nodes shown at a zoom level, optionally within a viewport
+
+        Returns the visible node indices (in preorder) and which of them are
+        collapsed clade summaries.
+        """
+        tree = self.tree
+        zoom = self.clamp_zoom(zoom)
+        if y_min is None and y_max is None and max_nodes is None:
+            # Full view at a precomputed granularity
+            order = self.expansion_order
+            expansions = self.zoom_expansions[zoom]
+            in_view = np.ones(tree.n_nodes, dtype=bool)
+        else:
+            if max_nodes is None:
+                max_nodes = LOD_BASE_NODES * LOD_ZOOM_FACTOR ** zoom
+            low = -np.inf if y_min is None else y_min
+            high = np.inf if y_max is None else y_max
+            in_view = (self.leaf_last >= low) & (self.leaf_first <= high)
+            in_view[0] = True
+
+            # Only children inside the viewport count against the budget
+            children_in_view = np.zeros(tree.n_nodes, dtype=np.int64)
+            shown = np.flatnonzero(in_view[1:]) + 1
+            np.add.at(children_in_view, tree.parent[shown], 1)
+            order = self.expansion_order[in_view[self.expansion_order]]
+            visible_after = 1 + np.cumsum(children_in_view[order])
+            expansions = int(np.searchsorted(visible_after, max_nodes, side="right"))
+
+        expanded = np.zeros(tree.n_nodes, dtype=bool)
+        expanded[order[:expansions]] = True
+
+        visible = np.zeros(tree.n_nodes, dtype=bool)
+        visible[0] = True
+        visible[1:] = expanded[tree.parent[1:]] & in_view[1:]
+        nodes = np.flatnonzero(visible)
+        return {
+            "nodes": nodes,
+            "collapsed": ~expanded[nodes] & ~tree.is_leaf[nodes],
+        }
+
+    def to_taxonium(self, zoom: int = 0, y_min: Optional[float] = None, y_max: Optional[float] = None,
+                    max_nodes: Optional[int] = None,
+                    node_metadata: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Build a Taxonium payload with only the nodes visible at a zoom level
+        (out-of-range levels are clamped, and the level used is reported)"""
+        tree = self.tree
+        zoom = self.clamp_zoom(zoom)
+        selection = self.visible_nodes(zoom, y_min, y_max, max_nodes)
+        aggregates = self.aggregate_metadata(node_metadata or {})
+
+        nodes: List[Dict[str, Any]] = []
+        for node, collapsed in zip(selection["nodes"].tolist(), selection["collapsed"].tolist()):
+            metadata = {
+                "support": DEFAULT_SUPPORT if np.isnan(tree.support[node]) else float(tree.support[node])
+            }
+            if tree.is_leaf[node] and node_metadata and tree.names[node] in node_metadata:
+                metadata.update(node_metadata[tree.names[node]])
+            for key, column in aggregates.items():
+                metadata[key] = float(column[node])
+
+            node_data = {
+                "id": node,
+                "parentId": int(tree.parent[node]) if node > 0 else None,
+                "name": tree.names[node],
+                "branch_length": float(tree.branch_lengths[node]),
+                "x_dist": float(self.layout["x"][node]),
+                "y": float(self.layout["y"][node]),
+                "collapsed": collapsed,
+                "metadata": metadata
+            }
+            if collapsed:
+                node_data["summary"] = {
+                    "leafCount": int(tree.leaf_count[node]),
+                    "depthRange": [float(self.min_leaf_distance[node]), float(self.max_leaf_distance[node])],
+                    "yRange": [int(self.leaf_first[node]), int(self.leaf_last[node])]
+                }
+            nodes.append(node_data)
+
+        return {
+            "nodes": nodes,
+            "metadata": {
+                "colorings": [{"name": key, "type": "continuous"} for key in aggregates],
+                "zoom": zoom,
+                "max_zoom": self.max_zoom,
+                "total_nodes": tree.n_nodes,
+                "total_leaves": int(tree.is_leaf.sum())
+            }
+        }
+
+
+def get_tree_lod(entry: CachedTree) -> TreeLODService:
+    """Return the cached LOD summaries of a tree, building them if needed"""
+    return entry.get_derived("lod", lambda: TreeLODService(entry.tree, get_tree_layout(entry)))
@@ -0,0 +1,519 @@
+import codecs
+import hashlib
+import math
+import re
+import xml.etree.ElementTree as ET
+from array import array
+from typing import Dict, List, Optional, Iterable
+
+from .compact_tree import CompactTree, label_support
+
+TREE_FORMATS = ("newick", "nexus", "phyloxml")
+
+# Bytes read from an upload per parser step
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Branch length ETE3 assigns to non-root nodes without one
+DEFAULT_BRANCH_LENGTH = 1.0
+
+_NEWICK_DELIMITERS = frozenset("(),:;[")
+_WHITESPACE = frozenset(" \t\r\n")
+_LABEL_END = re.compile(r"[(),:;\[]")
+_LENGTH_END = re.compile(r"[(),:;\[\s]")
+_FORMAT_EXTENSIONS = {
+    ".nwk": "newick", ".newick": "newick", ".tre": "newick", ".tree": "newick", ".treefile": "newick",
+    ".nex": "nexus", ".nexus": "nexus", ".nxs": "nexus",
+    ".xml": "phyloxml", ".phyloxml": "phyloxml",
+}
+_NEXUS_TREE = re.compile(r"^\s*u?tree\s+(?:\*\s*)?('[^']*'|\S+)\s*=", re.IGNORECASE)
+_NEXUS_TRANSLATE = re.compile(r"^\s*translate\s", re.IGNORECASE)
+
+
+def detect_tree_format(filename: Optional[str] = None, head: bytes = b"") -> str:
+    """Guess the format of a tree file from its first bytes or its extension"""
+    start = head.lstrip(b"\xef\xbb\xbf \t\r\n")[:16].lower()
+    if start.startswith(b"#nexus"):
+        return "nexus"
+    if start.startswith(b"<"):
+        return "phyloxml"
+    if start.startswith(b"("):
+        return "newick"
+    if filename:
+        for extension, tree_format in _FORMAT_EXTENSIONS.items():
+            if filename.lower().endswith(extension):
+                return tree_format
+    return "newick"
+
+
+class _TreeBuilder:
+    """Growable preorder arrays for one tree"""
+
+    def __init__(self):
+        self.parent = array("q")
+        self.names: List[str] = []
+        self.lengths = array("d")
+        self.support = array("d")
+
+    def add_node(self, parent: int) -> int:
+        self.parent.append(parent)
+        self.names.append("")
+        self.lengths.append(0.0 if parent < 0 else DEFAULT_BRANCH_LENGTH)
+        self.support.append(float("nan"))
+        return len(self.parent) - 1
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def build(self) -> CompactTree:
+        return CompactTree(self.parent, self.names, self.lengths, self.support)
+
+
+class NewickStreamParser:
+    """Incremental Newick parser building compact trees as text arrives
+
+    Text is fed in chunks of any size; only the node arrays of the tree
+    being read and the current label or branch length are held in memory.
+    Labels follow ETE3 ``format=1``: quoted labels keep their quotes and an
+    internal label is the node name (and its support when numeric).
+    Comments in square brackets are skipped. Each ``;`` completes a tree,
+    and the SHA-1 of its text (newlines and tabs removed, as in
+    ``tree_hash``) is recorded so it can be cached under its usual ID.
+    """
+
+    def __init__(self, name_map: Optional[Dict[str, str]] = None):
+        self.trees: List[CompactTree] = []
+        self.tree_ids: List[str] = []
+        self.name_map = name_map
+        self._reset()
+
+    def _reset(self) -> None:
+        self._builder = _TreeBuilder()
+        self._stack: List[int] = []
+        self._node = -1          # node the next label or length belongs to
+        self._expect_node = True  # after "(" or "," (or at the start)
+        self._internal = False    # whether self._node was closed by ")"
+        self._label: List[str] = []
+        self._length: Optional[List[str]] = None
+        self._quoted = False
+        self._comment_depth = 0
+        self._started = False
+        self._hasher = hashlib.sha1()
+
+    def feed(self, text: str) -> List[CompactTree]:
+        """Parse a chunk of text, returning the trees it completed"""
+        completed = len(self.trees)
+        position = 0
+        while position < len(text):
+            position = self.consume(text, position)
+        return self.trees[completed:]
+
+    def consume(self, text: str, position: int = 0) -> int:
+        """Parse text from ``position`` up to the end of the chunk or the next
+        completed tree, returning the position reached"""
+        segment = position
+        end = len(text)
+        while position < end:
+            char = text[position]
+
+            if self._comment_depth:
+                if char == "[":
+                    self._comment_depth += 1
+                elif char == "]":
+                    self._comment_depth -= 1
+                position += 1
+                continue
+
+            if self._quoted:
+                close = text.find("'", position)
+                if close < 0:
+                    close = end - 1
+                else:
+                    self._quoted = False
+                self._label.append(text[position:close + 1])
+                position = close + 1
+                continue
+
+            if not self._started:
+                if char in _WHITESPACE:
+                    position += 1
+                    segment = position
+                    continue
+                self._started = True
+
+            if char in _NEWICK_DELIMITERS:
+                self._finish_token()
+                if char == "(":
+                    node = self._open_node()
+                    self._stack.append(node)
+                    self._expect_node = True
+                elif char == ",":
+                    self._close_child()
+                    self._expect_node = True
+                elif char == ")":
+                    self._close_child()
+                    if not self._stack:
+                        raise ValueError("Unbalanced parentheses in Newick string")
+                    self._node = self._stack.pop()
+                    self._internal = True
+                    self._expect_node = False
+                elif char == ":":
+                    if self._expect_node:
+                        self._node = self._open_node()
+                        self._expect_node = False
+                    self._length = []
+                elif char == "[":
+                    self._comment_depth = 1
+                elif char == ";":
+                    position += 1
+                    self._hash(text[segment:position])
+                    self._complete()
+                    return position
+            elif self._length is not None:
+                if char not in _WHITESPACE:
+                    # Copy the rest of the number in one slice
+                    match = _LENGTH_END.search(text, position)
+                    stop = match.start() if match else end
+                    self._length.append(text[position:stop])
+                    position = stop
+                    continue
+            elif char in _WHITESPACE and not self._label:
+                pass
+            else:
+                if self._expect_node:
+                    self._node = self._open_node()
+                    self._expect_node = False
+                if char == "'" and not self._label:
+                    self._quoted = True
+                    self._label.append(char)
+                else:
+                    # Copy the rest of an unquoted label in one slice
+                    match = _LABEL_END.search(text, position)
+                    stop = match.start() if match else end
+                    self._label.append(text[position:stop])
+                    position = stop
+                    continue
+            position += 1
+
+        self._hash(text[segment:position])
+        return position
+
+    def close(self) -> List[CompactTree]:
+        """Finish parsing, accepting a final tree without a trailing ``;``"""
+        if self._comment_depth or self._quoted:
+            raise ValueError("Unterminated comment or quoted label in Newick string")
+        if self._started:
+            self._finish_token()
+            self._complete()
+        return self.trees
+
+    def _open_node(self) -> int:
+        parent = self._stack[-1] if self._stack else -1
+        if parent < 0 and len(self._builder):
+            raise ValueError("Newick string has more than one root; missing ';'?")
+        self._internal = False
+        return self._builder.add_node(parent)
+
+    def _close_child(self) -> None:
+        # "(,A)" and "(A,)" denote unnamed leaves
+        if self._expect_node:
+            self._open_node()
+        if not self._stack:
+            raise ValueError("Unbalanced parentheses in Newick string")
+
+    def _finish_token(self) -> None:
+        if self._label:
+            label = "".join(self._label).strip()
+            self._label = []
+            if label:
+                if self.name_map and not self._internal:
+                    label = self.name_map.get(label, label)
+                self._builder.names[self._node] = label
+                if self._internal:
+                    self._builder.support[self._node] = label_support(label)
+        if self._length is not None:
+            value = "".join(self._length)
+            self._length = None
+            if value:
+                try:
+                    self._builder.lengths[self._node] = float(value)
+                except ValueError:
+                    raise ValueError(f"Invalid branch length: {value[:50]}")
+
+    def _hash(self, text: str) -> None:
+        if self._started and text:
+            self._hasher.update(text.replace("\r", "").replace("\n", "").replace("\t", "").encode("utf-8"))
+
+    def _complete(self) -> None:
+        if self._stack:
+            raise ValueError("Unbalanced parentheses in Newick string")
+        if not len(self._builder):
+            raise ValueError("Empty Newick tree")
+        self.trees.append(self._builder.build())
+        self.tree_ids.append(self._hasher.hexdigest())
+        self._reset()
+
+
+class NexusStreamParser:
+    """Incremental NEXUS parser for the trees of a TREES block
+
+    Statements other than ``TRANSLATE`` and ``TREE`` are skipped without
+    being buffered; the Newick part of each ``TREE`` statement is streamed
+    straight into a ``NewickStreamParser`` with the translate table applied
+    to its leaf names.
+    """
+
+    # Characters needed to tell whether a statement is worth keeping
+    _PREFIX_LENGTH = 10
+
+    def __init__(self):
+        self.translate: Dict[str, str] = {}
+        self.tree_names: List[str] = []
+        self._newick = NewickStreamParser(self.translate)
+        self._statement: List[str] = []
+        self._skip = False
+        self._in_tree = False
+        self._quoted = False
+        self._comment_depth = 0
+
+    @property
+    def trees(self) -> List[CompactTree]:
+        return self._newick.trees
+
+    def feed(self, text: str) -> List[CompactTree]:
+        """Parse a chunk of text, returning the trees it completed"""
+        completed = len(self.trees)
+        position = 0
+        while position < len(text):
+            if self._in_tree:
+                before = len(self.trees)
+                position = self._newick.consume(text, position)
+                self._in_tree = len(self.trees) == before
+                continue
+
+            char = text[position]
+            position += 1
+            if self._comment_depth:
+                self._comment_depth += {"[": 1, "]": -1}.get(char, 0)
+                continue
+            if self._quoted:
+                self._quoted = char != "'"
+            elif char == "[":
+                self._comment_depth = 1
+                continue
+            elif char == "'":
+                self._quoted = True
+            elif char == ";":
+                self._end_statement()
+                continue
+            if not self._skip:
+                self._add_to_statement(char)
+        return self.trees[completed:]
+
+    def close(self) -> List[CompactTree]:
+        """Finish parsing, raising if a tree statement was left open"""
+        if self._in_tree:
+            self._newick.close()
+        return self.trees
+
+    def _add_to_statement(self, char: str) -> None:
+        self._statement.append(char)
+        if char == "=":
+            match = _NEXUS_TREE.match("".join(self._statement))
+            if match:
+                self.tree_names.append(match.group(1).strip("'"))
+                self._statement = []
+                self._in_tree = True
+                return
+        if len(self._statement) >= self._PREFIX_LENGTH:
+            head = "".join(self._statement).lstrip().lower()
+            if len(head) >= self._PREFIX_LENGTH and not head.startswith(("tree", "utree", "translate")):
+                self._statement = []
+                self._skip = True
+
+    def _end_statement(self) -> None:
+        statement = "".join(self._statement)
+        self._statement = []
+        self._skip = False
+        if _NEXUS_TRANSLATE.match(statement):
+            tokens = re.findall(r"'(?:[^']|'')*'|[^\s,]+", statement)[1:]
+            for index in range(0, len(tokens) - 1, 2):
+                self.translate[tokens[index]] = tokens[index + 1]
+
+
+class PhyloXMLStreamParser:
+    """Incremental PhyloXML parser built on ``XMLPullParser``
+
+    Clades become nodes as their start tags arrive, so nodes are numbered
+    in preorder, and every element is detached once read so memory stays
+    bounded by the tree arrays rather than the document.
+    """
+
+    def __init__(self):
+        self.trees: List[CompactTree] = []
+        self.tree_names: List[str] = []
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._builder: Optional[_TreeBuilder] = None
+        self._clades: List[int] = []
+        self._elements: List[ET.Element] = []
+        self._tags: List[str] = []
+        self._phylogeny_name = ""
+
+    def feed(self, data: bytes) -> List[CompactTree]:
+        """Parse a chunk of bytes, returning the trees it completed"""
+        completed = len(self.trees)
+        try:
+            self._parser.feed(data)
+            self._read_events()
+        except ET.ParseError as e:
+            raise ValueError(f"Invalid PhyloXML: {e}")
+        return self.trees[completed:]
+
+    def close(self) -> List[CompactTree]:
+        """Finish parsing the document"""
+        try:
+            self._parser.close()
+            self._read_events()
+        except ET.ParseError as e:
+            raise ValueError(f"Invalid PhyloXML: {e}")
+        return self.trees
+
+    def _read_events(self) -> None:
+        for event, element in self._parser.read_events():
+            tag = element.tag.rsplit("}", 1)[-1]
+            if event == "start":
+                self._start(tag, element)
+            else:
+                self._end(tag, element)
+
+    def _start(self, tag: str, element: ET.Element) -> None:
+        self._tags.append(tag)
+        self._elements.append(element)
+        if tag == "phylogeny":
+            self._builder = _TreeBuilder()
+            self._clades = []
+            self._phylogeny_name = ""
+        elif tag == "clade" and self._builder is not None:
+            node = self._builder.add_node(self._clades[-1] if self._clades else -1)
+            if "branch_length" in element.attrib:
+                self._builder.lengths[node] = float(element.attrib["branch_length"])
+            self._clades.append(node)
+
+    def _end(self, tag: str, element: ET.Element) -> None:
+        self._tags.pop()
+        self._elements.pop()
+        parent_tag = self._tags[-1] if self._tags else None
+        builder = self._builder
+        node = self._clades[-1] if self._clades else -1
+        text = (element.text or "").strip()
+
+        if tag == "name" and parent_tag == "phylogeny":
+            self._phylogeny_name = text
+        elif builder is not None and node >= 0 and text:
+            if tag == "name" and parent_tag == "clade":
+                builder.names[node] = text
+            elif tag == "scientific_name" and parent_tag == "taxonomy" and not builder.names[node]:
+                builder.names[node] = text
+            elif tag == "branch_length" and parent_tag == "clade":
+                builder.lengths[node] = float(text)
+            elif tag == "confidence" and parent_tag == "clade" and math.isnan(builder.support[node]):
+                builder.support[node] = float(text)
+
+        if tag == "clade" and self._clades:
+            self._clades.pop()
+        elif tag == "phylogeny" and builder is not None:
+            if len(builder):
+                self.trees.append(builder.build())
+                self.tree_names.append(self._phylogeny_name)
+            self._builder = None
+
+        # Detach the element so the document is never held in memory
+        if self._elements:
+            self._elements[-1].remove(element)
+        else:
+            element.clear()
+
+
+class TreeStreamReader:
+    """Parse an upload of any supported format from a stream of byte chunks
+
+    Every completed tree gets a tree ID: Newick trees use the same content
+    address as ``tree_hash`` so they share cache entries with trees sent as
+    strings; NEXUS and PhyloXML trees are addressed by the file content.
+    Only the first ``max_trees`` trees are kept, the rest are counted.
+    """
+
+    def __init__(self, tree_format: str, max_trees: Optional[int] = None):
+        if tree_format not in TREE_FORMATS:
+            raise ValueError(f"Unsupported tree format: {tree_format}. Use one of: {', '.join(TREE_FORMATS)}")
+        self.tree_format = tree_format
+        self.max_trees = max_trees
+        self.num_trees = 0
+        self.num_bytes = 0
+        self.trees: List[CompactTree] = []
+        self.tree_ids: List[str] = []
+        self._content_hash = hashlib.sha1(tree_format.encode("utf-8"))
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        if tree_format == "newick":
+            self._parser = NewickStreamParser()
+        elif tree_format == "nexus":
+            self._parser = NexusStreamParser()
+        else:
+            self._parser = PhyloXMLStreamParser()
+
+    def feed(self, chunk: bytes) -> None:
+        """Parse the next chunk of the upload"""
+        self.num_bytes += len(chunk)
+        if self.tree_format != "newick":
+            self._content_hash.update(chunk)
+        if self.tree_format == "phyloxml":
+            self._parser.feed(chunk)
+        else:
+            self._parser.feed(self._decoder.decode(chunk))
+        self._collect()
+
+    def close(self) -> List[CompactTree]:
+        """Finish the upload and return the kept trees"""
+        if self.tree_format != "phyloxml":
+            self._parser.feed(self._decoder.decode(b"", final=True))
+        self._parser.close()
+        self._collect()
+        if not self.num_trees:
+            raise ValueError(f"No trees found in {self.tree_format} input")
+        if self.tree_format != "newick":
+            digest = self._content_hash.hexdigest()
+            kept = self.num_trees if self.max_trees is None else min(self.num_trees, self.max_trees)
+            self.tree_ids = [
+                hashlib.sha1(f"{digest}:{index}".encode("utf-8")).hexdigest()
+                for index in range(kept)
+            ]
+        return self.trees
+
+    def drain(self) -> List[CompactTree]:
+        """Hand over the trees completed so far, so callers can process a
+        collection tree by tree without keeping it. ``tree_ids`` keeps
+        growing and covers every kept tree once the reader is closed."""
+        trees = self.trees
+        self.trees = []
+        return trees
+
+    def _collect(self) -> None:
+        """Move completed trees out of the parser, dropping any beyond the limit"""
+        for position, tree in enumerate(self._parser.trees):
+            if self.max_trees is None or self.num_trees < self.max_trees:
+                self.trees.append(tree)
+                if self.tree_format == "newick":
+                    self.tree_ids.append(self._parser.tree_ids[position])
+            self.num_trees += 1
+        self._parser.trees.clear()
+        if self.tree_format == "newick":
+            self._parser.tree_ids.clear()
+
+
+def parse_tree_chunks(chunks: Iterable[bytes], tree_format: str,
+                      max_trees: Optional[int] = None) -> TreeStreamReader:
+    """Parse an iterable of byte chunks, returning the finished reader"""
+    reader = TreeStreamReader(tree_format, max_trees)
+    for chunk in chunks:
+        reader.feed(chunk)
+    reader.close()
+    return reader
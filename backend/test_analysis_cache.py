@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests of the analysis result cache: keys, persistence and invalidation of
+results when a dataset's content changes.
+"""
+
+import copy
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.analysis_cache import AnalysisResultCache, analysis_key
+
+DATASET = {
+    "nodes": [{"id": "a", "label": "A"}, {"id": "b", "label": "B"}],
+    "edges": [{"source": "b", "target": "a", "type": "subClassOf"}],
+}
+
+
+def relabelled(data, label):
+    data = copy.deepcopy(data)
+    data["nodes"][0]["label"] = label
+    return data
+
+
+def test_analysis_key_ignores_unset_and_execution_parameters():
+    key = analysis_key(DATASET, {"analysis_type": "basic", "epsilon": 0.05})
+    assert analysis_key(copy.deepcopy(DATASET), {"epsilon": 0.05, "processes": 4, "seed": None}) == key
+    assert analysis_key(DATASET, {"analysis_type": "basic", "epsilon": 1.0}) == \
+        analysis_key(DATASET, {"analysis_type": "basic", "epsilon": 1})
+    assert analysis_key(DATASET, {"epsilon": 0.1}) != key
+    assert analysis_key(relabelled(DATASET, "changed"), {"epsilon": 0.05})[0] != key[0]
+
+
+def test_results_persist_and_are_dropped_when_a_dataset_changes(tmp_path):
+    cache = AnalysisResultCache(directory=str(tmp_path))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"value": len(calls)}
+
+    assert cache.get_or_compute(DATASET, {}, compute, dataset_id="d1") == ({"value": 1}, False)
+    assert cache.get_or_compute(DATASET, {}, compute, dataset_id="d1") == ({"value": 1}, True)
+    old_hash = analysis_key(DATASET, {})[0]
+    assert os.path.isdir(tmp_path / old_hash)
+
+    # A restarted cache reads the result from disk
+    restarted = AnalysisResultCache(directory=str(tmp_path))
+    assert restarted.get(analysis_key(DATASET, {})) == {"value": 1}
+    assert restarted.stats()["disk_hits"] == 1
+
+    # A second dataset with the same content keeps the results alive
+    restarted.track_dataset("d2", old_hash)
+    changed = relabelled(DATASET, "changed")
+    assert restarted.get_or_compute(changed, {}, compute, dataset_id="d1") == ({"value": 2}, False)
+    assert restarted.get(analysis_key(DATASET, {})) == {"value": 1}
+
+    restarted.track_dataset("d2", analysis_key(changed, {})[0])
+    assert restarted.get(analysis_key(DATASET, {})) is None
+    assert not os.path.exists(tmp_path / old_hash)
+    assert restarted.get(analysis_key(changed, {})) == {"value": 2}
+
+
+def test_memory_budget_keeps_the_newest_result():
+    cache = AnalysisResultCache(directory=None, max_bytes=40)
+    first, second = analysis_key(DATASET, {"k": 1}), analysis_key(DATASET, {"k": 2})
+    cache.put(first, {"payload": "x" * 20})
+    cache.put(second, {"payload": "y" * 20})
+    assert cache.get(first) is None
+    assert cache.get(second) == {"payload": "y" * 20}
+
+
+def test_disk_store_drops_least_recently_used_files(tmp_path):
+    # Each result is 34 bytes of JSON, so the store holds two
+    cache = AnalysisResultCache(directory=str(tmp_path), max_bytes=1, max_disk_bytes=80)
+    keys = [analysis_key(DATASET, {"k": k}) for k in range(3)]
+    cache.put(keys[0], {"payload": "z" * 20})
+    cache.put(keys[1], {"payload": "z" * 20})
+    os.utime(cache._path(keys[0]), (2, 2))
+    os.utime(cache._path(keys[1]), (1, 1))
+
+    cache.put(keys[2], {"payload": "z" * 20})
+    assert cache.stats()["disk_bytes"] == 68
+    assert not os.path.exists(cache._path(keys[1]))
+    assert cache.get(keys[0]) == {"payload": "z" * 20}
+    assert cache.get(keys[2]) == {"payload": "z" * 20}
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests of analysis job cancellation and time limits for jobs that never
+report progress.
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import analysis_jobs
+from app.services.analysis_cache import AnalysisResultCache
+from app.services.analysis_jobs import AnalysisJobQueue
+
+DATASET = {"nodes": [], "edges": []}
+
+
+def sleeping_job(job_id, data, parameters, updates, cancel_event, timeout):
+    """Stand-in for _run_job that never reports progress"""
+    updates.put((job_id, 0.0, "started", os.getpid()))
+    time.sleep(parameters["sleep"])
+    return {"slept": parameters["sleep"]}
+
+
+def wait_for(job, statuses, seconds=30.0):
+    deadline = time.time() + seconds
+    while job.status not in statuses:
+        assert time.time() < deadline, f"job is still {job.status}"
+        time.sleep(0.05)
+    return job
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    # A terminated child may linger as a zombie until it is reaped
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split()[2] != "Z"
+    except OSError:
+        return True
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(analysis_jobs, "_run_job", sleeping_job)
+    monkeypatch.setattr(analysis_jobs, "analysis_results", AnalysisResultCache(directory=None))
+    monkeypatch.setattr(analysis_jobs, "TIMEOUT_GRACE", 0.5)
+    jobs = AnalysisJobQueue(max_workers=2)
+    yield jobs
+    jobs.shutdown()
+
+
+def test_cancelled_job_without_progress_is_terminated(queue):
+    stuck = queue.submit(DATASET, {"sleep": 120})
+    other = queue.submit(DATASET, {"sleep": 3})
+    wait_for(stuck, ("running",))
+    wait_for(other, ("running",))
+    pid = stuck.pid
+
+    queue.cancel(stuck.job_id)
+    wait_for(stuck, ("cancelled",), seconds=10.0)
+    deadline = time.time() + 10.0
+    while is_alive(pid):
+        assert time.time() < deadline, "the worker was not terminated"
+        time.sleep(0.05)
+
+    # The job sharing the terminated pool runs again and completes
+    assert wait_for(other, ("completed", "failed")).status == "completed"
+    assert other.result == {"slept": 3}
+    later = queue.submit(DATASET, {"sleep": 0})
+    assert wait_for(later, ("completed", "failed")).status == "completed"
+
+
+def test_timed_out_job_without_progress_is_terminated(queue):
+    job = queue.submit(DATASET, {"sleep": 120}, timeout=1.0)
+    wait_for(job, ("running",))
+    pid = job.pid
+    assert wait_for(job, ("timeout",), seconds=10.0).error
+    deadline = time.time() + 10.0
+    while is_alive(pid):
+        assert time.time() < deadline, "the worker was not terminated"
+        time.sleep(0.05)
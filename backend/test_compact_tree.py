@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Tests of the compact tree arrays and the LCA index.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from ete3 import Tree
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.compact_tree import CompactTree, LCAIndex, induced_subtree
+from app.services.newick_writer import iter_newick, write_newick
+from app.services.tree_cache import TreeCache
+from app.services.tree_parsers import NewickStreamParser
+
+SPECIES_NEWICK = "(('Zea mays AGPv3':1,'Oryza sativa':1)Poaceae:1,Arabidopsis:2);"
+
+
+def test_quoted_leaf_names_match_without_quotes():
+    tree = CompactTree.from_newick(SPECIES_NEWICK)
+    quoted = tree.leaf_indices(["'Zea mays AGPv3'", "'Oryza sativa'"])
+    assert tree.leaf_indices(["Zea mays AGPv3", "Oryza sativa"]).tolist() == quoted.tolist()
+
+    index = LCAIndex(tree)
+    assert index.mrca(["Zea mays AGPv3", "Oryza sativa"])["name"] == "Poaceae"
+    pruned = induced_subtree(index, ["Zea mays AGPv3", "Arabidopsis"])
+    assert sorted(pruned.names[i] for i in np.flatnonzero(pruned.is_leaf)) == ["'Zea mays AGPv3'", "Arabidopsis"]
+
+    with pytest.raises(KeyError):
+        tree.leaf_indices(["Zea mays"])
+
+
+def test_streaming_and_ete_parsers_agree_on_support():
+    newick = "((A:1,B:1)95:1,(C:1,D:1)clade:1,E:2);"
+    parser = NewickStreamParser()
+    streamed = [tree for chunk in (newick[:9], newick[9:]) for tree in parser.feed(chunk)][0]
+    parsed = CompactTree.from_newick(newick)
+
+    assert streamed.names == parsed.names
+    np.testing.assert_array_equal(streamed.support, parsed.support)
+    supports = dict(zip(parsed.names, parsed.support.tolist()))
+    assert supports["95"] == 95.0
+    assert np.isnan(supports["clade"]) and np.isnan(supports["A"]) and np.isnan(parsed.support[0])
+
+
+def random_tree(n_leaves, seed):
+    """Random binary-ish tree built by splitting random leaves"""
+    rng = np.random.default_rng(seed)
+    parent, lengths = [-1], [0.0]
+    leaves = [0]
+    while len(leaves) < n_leaves:
+        leaf = leaves.pop(int(rng.integers(len(leaves))))
+        for _ in range(int(rng.choice([2, 2, 3]))):
+            parent.append(leaf)
+            lengths.append(float(rng.integers(1, 10)))
+            leaves.append(len(parent) - 1)
+    # Renumber in preorder
+    children = {}
+    for node, up in enumerate(parent[1:], 1):
+        children.setdefault(up, []).append(node)
+    order, stack = [], [0]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(reversed(children.get(node, [])))
+    position = {node: i for i, node in enumerate(order)}
+    return CompactTree(
+        [-1] + [position[parent[node]] for node in order[1:]],
+        [f"L{node}" if node not in children else "" for node in order],
+        [lengths[node] for node in order]
+    )
+
+
+def ancestors_of(tree, node):
+    path = [node]
+    while tree.parent[path[-1]] >= 0:
+        path.append(int(tree.parent[path[-1]]))
+    return path
+
+
+def test_lca_index_matches_parent_walks():
+    tree = random_tree(60, seed=1)
+    index = LCAIndex(tree)
+    rng = np.random.default_rng(2)
+    u = rng.integers(tree.n_nodes, size=500)
+    v = rng.integers(tree.n_nodes, size=500)
+    expected = [next(node for node in ancestors_of(tree, a) if node in set(ancestors_of(tree, b)))
+                for a, b in zip(u.tolist(), v.tolist())]
+    assert index.lca_many(u, v).tolist() == expected
+    assert index.lca(int(u[0]), int(v[0])) == expected[0]
+
+
+def path_length(tree, a, b):
+    up_a, up_b = ancestors_of(tree, a), ancestors_of(tree, b)
+    common = next(node for node in up_a if node in set(up_b))
+    return tree.root_distance[a] + tree.root_distance[b] - 2 * tree.root_distance[common]
+
+
+def test_induced_subtree_keeps_distances_and_drops_unary_nodes():
+    tree = random_tree(40, seed=3)
+    leaf_names = [tree.names[leaf] for leaf in np.flatnonzero(tree.is_leaf)]
+    kept = leaf_names[::3]
+    pruned = induced_subtree(LCAIndex(tree), kept)
+
+    assert sorted(pruned.names[leaf] for leaf in np.flatnonzero(pruned.is_leaf)) == sorted(kept)
+    assert not np.any(pruned.child_count == 1)
+    for a in kept:
+        for b in kept:
+            assert path_length(pruned, pruned.name_to_index[a], pruned.name_to_index[b]) == \
+                pytest.approx(path_length(tree, tree.name_to_index[a], tree.name_to_index[b]))
+
+
+def test_tree_cache_is_content_addressed_and_bounded():
+    cache = TreeCache()
+    entry = cache.put(SPECIES_NEWICK)
+    assert cache.put("\n" + SPECIES_NEWICK.replace(",", ",\n") + "\n") is entry
+    assert cache.get(entry.tree_id) is entry
+    assert entry.get_derived("answer", lambda: 42) == 42
+    assert entry.get_derived("answer", lambda: 0) == 42
+
+    small = TreeCache(max_bytes=1)
+    first = small.put("(A:1,B:1);")
+    second = small.put("(C:1,D:1);")
+    assert small.get(second.tree_id) is second
+    with pytest.raises(KeyError):
+        small.get(first.tree_id)
+
+
+def test_written_newick_parses_back_to_the_same_tree():
+    tree = random_tree(50, seed=4)
+    newick = write_newick(tree)
+    parsed = CompactTree.from_newick(newick)
+    assert parsed.names == tree.names
+    assert parsed.parent.tolist() == tree.parent.tolist()
+    np.testing.assert_allclose(parsed.branch_lengths[1:], tree.branch_lengths[1:])
+    assert b"".join(iter_newick(tree, chunk_pieces=7)).decode("utf-8") == newick
+
+    supported = CompactTree.from_newick("((A:1,B:1)95:1,(C:1,D:1)clade:1,E:2);")
+    assert write_newick(supported, support=True) == "((A:1,B:1)95:1,(C:1,D:1)clade:1,E:2);"
+    assert write_newick(supported, nhx={"x": [None, 1, None, None, None, None, None, None, None]}) == \
+        "((A:1,B:1)95:1[&&NHX:x=1],(C:1,D:1)clade:1,E:2);"
+
+
+def test_nhx_values_with_reserved_characters_round_trip():
+    tree = CompactTree.from_newick("((A:1,B:1):1,C:2);")
+    go = np.array([None, None, "GO:0008150, x]", None, "a b;(c)=d"], dtype=object)
+    newick = write_newick(tree, nhx={"go term": go})
+    assert newick == "((A:1[&&NHX:go_term=GO_0008150__x_],B:1):1,C:2[&&NHX:go_term=a_b__c__d]);"
+    parsed = Tree(newick, format=1)
+    assert (parsed & "A").go_term == "GO_0008150__x_"
+    assert (parsed & "C").go_term == "a_b__c__d"
+    assert b"".join(iter_newick(tree, nhx={"go term": go}, chunk_pieces=2)).decode("utf-8") == newick
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests of split counting, consensus trees and the clade index.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.clade_index import CladeIndex, compare_tree_splits
+from app.services.compact_tree import CompactTree
+from app.services.consensus import BipartitionCounter, build_consensus, leaf_bit_order
+
+TREES = [
+    "(((A:1,B:1):1,C:1):1,(D:1,E:1):1,F:1);",
+    "(((A:1,B:1):1,D:1):1,(C:1,E:1):1,F:1);",
+    "((A:1,B:1):1,(C:1,(D:1,E:1):1):1,F:1);",
+]
+
+
+def splits(tree, leaves):
+    """Non-trivial splits of a tree, each as the side without the first leaf"""
+    result = set()
+    for node in range(1, tree.n_nodes):
+        clade = {tree.names[leaf] for leaf in tree.subtree_leaves(node)}
+        if leaves[0] in clade:
+            clade = set(leaves) - clade
+        if 1 < len(clade) < len(leaves) - 1:
+            result.add(frozenset(clade))
+    return result
+
+
+def test_majority_and_strict_consensus_match_split_counts():
+    trees = [CompactTree.from_newick(newick) for newick in TREES]
+    leaves = [trees[0].names[leaf] for leaf in np.flatnonzero(trees[0].is_leaf)]
+    tally = {}
+    for tree in trees:
+        for split in splits(tree, leaves):
+            tally[split] = tally.get(split, 0) + 1
+
+    counter = BipartitionCounter(leaf_bit_order(trees[0]), max_workers=2)
+    counter.add_trees(trees[:2])
+    pool = counter._pool
+    counter.add_all(iter(trees[2:] * 2), batch_size=1)
+    counter.add_trees(trees[:1] * 2)
+    assert counter._pool is pool
+    counter.close()
+    assert counter._pool is None
+    counter = BipartitionCounter(leaf_bit_order(trees[0]), max_workers=2)
+    counter.add_all(iter(trees), batch_size=2)
+    counter.close()
+    assert counter.num_trees == 3
+
+    majority = build_consensus(counter, "majority")
+    assert splits(majority, leaves) == {split for split, count in tally.items() if count > 1.5}
+    supports = {frozenset(majority.names[leaf] for leaf in majority.subtree_leaves(node)): majority.support[node]
+                for node in np.flatnonzero(~majority.is_leaf)[1:]}
+    # Rooted on the side of A, so the A|B split is the clade of the rest
+    assert supports == {frozenset("CDEF"): 1.0, frozenset("DE"): 2 / 3}
+
+    strict = build_consensus(counter, "strict")
+    assert splits(strict, leaves) == {split for split, count in tally.items() if count == 3}
+    assert splits(strict, leaves) == {frozenset("CDEF")}
+    unanimous = build_consensus(counter, "majority", threshold=1.0)
+    assert splits(unanimous, leaves) == splits(strict, leaves)
+
+
+def test_clade_index_is_rebuilt_after_adding_trees():
+    trees = [CompactTree.from_newick(newick) for newick in TREES]
+    index = CladeIndex.from_trees(trees[:2], ["t1", "t2"])
+    assert index.query(["D", "E"]) == {"leaves": ["D", "E"], "count": 1, "support": 0.5, "tree_ids": ["t1"]}
+    # A clade and its complement are the same split
+    assert index.query(["A", "B", "C", "F"])["tree_ids"] == ["t1"]
+    first_id = index.collection_id
+
+    index.add_trees(trees[2:], ["t3"])
+    assert index.query(["D", "E"])["tree_ids"] == ["t1", "t3"]
+    assert index.query(["A", "B"])["count"] == 3
+    assert index.query(["A", "C"])["count"] == 0
+    assert index.collection_id != first_id
+    assert index.position("t3") == 2
+
+
+def test_robinson_foulds_distance():
+    first, second = (CompactTree.from_newick(newick) for newick in TREES[:2])
+    comparison = compare_tree_splits(first, second)
+    assert comparison["shared_splits"] == 1
+    assert comparison["robinson_foulds"] == 4
+    assert comparison["normalized_robinson_foulds"] == 4 / 6
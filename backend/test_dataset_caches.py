@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Tests that the per-dataset caches rebuild when a dataset's content
+changes but its ID and size stay the same.
+"""
+
+import copy
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.function_prediction import FunctionIndex, FunctionIndexCache
+from app.services.go_enrichment import EnrichmentIndexCache
+from app.services.semantic_reasoning import SemanticReasoningService
+from app.services.sparse_graph import SparseGraphCache
+from app.services import semantic_reasoning
+from app.services.subsumption_index import SubsumptionIndex, SubsumptionIndexStore
+
+
+def make_dataset():
+    return {
+        "id": "dataset-1",
+        "nodes": [{"id": node_id, "label": node_id, "type": "Class"} for node_id in ("a", "b", "c", "d")],
+        "edges": [
+            {"source": "b", "target": "a", "type": "subClassOf"},
+            {"source": "c", "target": "a", "type": "subClassOf"},
+            {"source": "d", "target": "b", "type": "subClassOf"},
+        ],
+    }
+
+
+def edited(data):
+    """Same ID, node and edge counts, one edge moved"""
+    data = copy.deepcopy(data)
+    data["edges"][2]["target"] = "c"
+    return data
+
+
+def test_sparse_graph_rebuilt_for_edited_dataset():
+    cache = SparseGraphCache()
+    data = make_dataset()
+    graph = cache.get(data)
+    assert cache.get(copy.deepcopy(data)) is graph
+
+    changed = cache.get(edited(data))
+    assert changed is not graph
+    d, c = changed.node_index["d"], changed.node_index["c"]
+    assert (d, c) in set(zip(changed.sources.tolist(), changed.targets.tolist()))
+
+
+def make_annotated_dataset():
+    return {
+        "id": "dataset-2",
+        "nodes": [
+            {"id": "t", "label": "target", "type": "Gene"},
+            {"id": "n", "label": "neighbour", "type": "Gene"},
+            {"id": "m", "label": "other", "type": "Gene"},
+            {"id": "f1", "label": "kinase activity", "type": "MolecularFunction"},
+        ],
+        "edges": [
+            {"source": "n", "target": "f1", "type": "hasFunction"},
+            {"source": "t", "target": "n", "type": "interactsWith"},
+            {"source": "m", "target": "n", "type": "interactsWith"},
+        ],
+    }
+
+
+def test_function_index_rebuilt_for_edited_dataset():
+    cache = FunctionIndexCache()
+    data = make_annotated_dataset()
+    assert [p["function_id"] for p in cache.get(data).predict_node("t")] == ["f1"]
+
+    # The target's only neighbour is now unannotated
+    data = copy.deepcopy(data)
+    data["edges"][1]["target"] = "m"
+    assert cache.get(data).predict_node("t") == []
+
+
+def make_enrichment_dataset():
+    genes = [{"id": f"g{i}", "label": f"gene {i}", "type": "Gene"} for i in range(1, 5)]
+    functions = [{"id": f"f{i}", "label": f"process {i}", "type": "BiologicalProcess"} for i in (1, 2)]
+    return {
+        "id": "dataset-3",
+        "nodes": genes + functions,
+        "edges": [{"source": gene, "target": function, "type": "participatesIn"}
+                  for gene, function in (("g1", "f1"), ("g2", "f1"), ("g3", "f2"), ("g4", "f2"))],
+    }
+
+
+def test_enrichment_index_rebuilt_for_edited_dataset():
+    cache = EnrichmentIndexCache()
+    data = make_enrichment_dataset()
+    result = cache.dataset_index(data, FunctionIndex(data)).enrich(["g1", "g2"], alpha=None, min_count=1)
+    assert [term["term_id"] for term in result["results"]] == ["f1"]
+
+    # g1 and g2 swap processes with g3 and g4
+    data = copy.deepcopy(data)
+    for edge in data["edges"]:
+        edge["target"] = "f2" if edge["target"] == "f1" else "f1"
+    result = cache.dataset_index(data, FunctionIndex(data)).enrich(["g1", "g2"], alpha=None, min_count=1)
+    assert [term["term_id"] for term in result["results"]] == ["f2"]
+
+
+def test_subsumption_index_rebuilt_for_edited_dataset():
+    store = SubsumptionIndexStore()
+    data = make_dataset()
+    index = store.for_dataset(data)
+    assert store.for_dataset(copy.deepcopy(data)) is index
+    assert index.is_ancestor("b", "d")
+
+    changed = store.for_dataset(edited(data))
+    assert changed.is_ancestor("c", "d") and not changed.is_ancestor("b", "d")
+
+
+def test_hierarchical_analysis_of_edited_dataset():
+    service = SemanticReasoningService()
+    parameters = {"analysis_type": "hierarchical", "descendant_counts": True}
+    result = service.analyze(make_dataset(), parameters)
+    assert result["descendant_counts"] == {"a": 3, "b": 1, "c": 0, "d": 0}
+
+    # A new hierarchy node with the same ID and size
+    data = make_dataset()
+    data["edges"][2]["source"] = "e"
+    result = service.analyze(data, parameters)
+    assert result["descendant_counts"] == {"a": 3, "b": 1, "c": 0, "e": 0}
+
+
+def test_hierarchical_analysis_reuses_the_dataset_index(monkeypatch):
+    builds = []
+    from_data = SubsumptionIndex.from_data.__func__
+
+    def counting_from_data(cls, data, relations):
+        builds.append(relations)
+        return from_data(cls, data, relations)
+
+    monkeypatch.setattr(SubsumptionIndex, "from_data", classmethod(counting_from_data))
+    monkeypatch.setattr(semantic_reasoning, "subsumption_indexes", SubsumptionIndexStore())
+    service = SemanticReasoningService()
+
+    # Only the top-k counts are returned unless every count is requested
+    result = service.analyze(make_dataset(), {"analysis_type": "hierarchical", "top_k": 2})
+    assert "descendant_counts" not in result
+    assert [(node["id"], node["score"]) for node in result["top_descendant_counts"]] == [("a", 3), ("b", 1)]
+
+    service.analyze(copy.deepcopy(make_dataset()), {"analysis_type": "hierarchical", "descendant_counts": True})
+    assert builds == [("subClassOf",)]
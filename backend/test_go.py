@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Tests of GO semantic similarity and enrichment against direct
+computations over the ancestor sets.
+"""
+
+import math
+import os
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+from scipy.stats import false_discovery_control, hypergeom
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.go_enrichment import EnrichmentIndex, hypergeometric_sf
+from app.services.go_similarity import GODag, GOSimilarity
+
+
+def random_go(n_terms, n_entities, seed):
+    """Random single-root DAG and 1-3 terms per entity"""
+    rng = np.random.default_rng(seed)
+    children, parents = [], []
+    for term in range(1, n_terms):
+        for parent in rng.choice(term, size=min(term, int(rng.integers(1, 3))), replace=False):
+            children.append(term)
+            parents.append(int(parent))
+    term_ids = [f"GO:{term:07d}" for term in range(n_terms)]
+    dag = GODag(term_ids, term_ids, ["biological_process"] * n_terms, np.array(children), np.array(parents))
+    annotations = {f"g{entity}": [term_ids[term] for term in rng.choice(n_terms, size=int(rng.integers(1, 4)))]
+                   for entity in range(n_entities)}
+    graph = nx.DiGraph(zip(children, parents))
+    graph.add_nodes_from(range(n_terms))
+    ancestors = {term_ids[term]: {term_ids[a] for a in nx.descendants(graph, term)} | {term_ids[term]}
+                 for term in range(n_terms)}
+    return dag, annotations, ancestors
+
+
+def brute_force_similarity(annotations, ancestors):
+    counts = {}
+    for terms in annotations.values():
+        for term in set().union(*(ancestors[term] for term in terms)):
+            counts[term] = counts.get(term, 0) + 1
+    root = max(counts, key=counts.get)
+    ic = {term: -math.log(count / counts[root]) for term, count in counts.items()}
+
+    def resnik(a, b):
+        return max(ic[term] for term in ancestors[a] & ancestors[b])
+
+    def bma(first, second):
+        rows = [max(resnik(a, b) for b in second) for a in first]
+        columns = [max(resnik(a, b) for a in first) for b in second]
+        return (sum(rows) / len(rows) + sum(columns) / len(columns)) / 2
+
+    entities = list(annotations)
+    return np.array([[bma(set(annotations[g]), set(annotations[h])) for h in entities] for g in entities])
+
+
+@pytest.mark.parametrize("swept", ["all", "none"])
+def test_resnik_similarity_matches_ancestor_sets(monkeypatch, swept):
+    dag, annotations, ancestors = random_go(150, 40, seed=11)
+    expected = brute_force_similarity(annotations, ancestors)
+    # Resolve the common ancestors either by column sweeps or by bitsets only
+    if swept == "all":
+        monkeypatch.setattr(GOSimilarity, "_bitset_words", lambda self: 0)
+    else:
+        monkeypatch.setattr(GOSimilarity, "_bitset_words", lambda self: self.bits.shape[1])
+
+    similarity = GOSimilarity(dag, annotations)
+    assert similarity.entity_ids == list(annotations)
+    np.testing.assert_allclose(similarity.similarity_matrix("resnik"), expected, rtol=1e-5, atol=1e-5)
+    pairs = [("g0", "g1"), ("g5", "g5"), ("g2", "unknown")]
+    scores = similarity.pair_similarity(pairs, "resnik")
+    assert scores[0] == pytest.approx(expected[0, 1], abs=1e-5)
+    assert scores[1] == pytest.approx(expected[5, 5], abs=1e-5)
+    assert scores[2] is None
+
+
+def test_lin_and_top_matches():
+    dag, annotations, _ = random_go(60, 12, seed=12)
+    similarity = GOSimilarity(dag, annotations)
+    lin = similarity.similarity_matrix("lin")
+    assert np.all((lin >= 0) & (lin <= 1 + 1e-6))
+    np.testing.assert_allclose(lin, lin.T, atol=1e-6)
+
+    top = similarity.top_matches("lin", top_k=3)
+    for row, entity in enumerate(similarity.entity_ids):
+        scores = [match["score"] for match in top[entity]]
+        others = np.delete(lin[row], row)
+        assert scores == pytest.approx(sorted(others, reverse=True)[:3], abs=1e-6)
+        assert entity not in [match["id"] for match in top[entity]]
+
+
+def test_hypergeometric_tail_matches_scipy():
+    rng = np.random.default_rng(13)
+    population, draws = 5000, 300
+    successes = rng.integers(1, 2000, size=500)
+    k = np.minimum(rng.integers(0, 300, size=500), successes)
+    np.testing.assert_allclose(hypergeometric_sf(k, population, successes, draws),
+                               hypergeom.sf(k - 1, population, successes, draws), rtol=1e-8, atol=1e-300)
+
+
+def test_enrichment_matches_per_term_tests():
+    dag, annotations, ancestors = random_go(120, 400, seed=14)
+    index = EnrichmentIndex.from_go(dag, annotations)
+    genes = list(annotations)
+    study = genes[:60] + ["not-a-gene"]
+    result = index.enrich(study, alpha=None, min_count=1)
+    assert result["unknown_genes"] == ["not-a-gene"]
+    assert (result["study_size"], result["population_size"]) == (60, 400)
+
+    propagated = {gene: set().union(*(ancestors[term] for term in terms)) for gene, terms in annotations.items()}
+    terms = sorted(set().union(*propagated.values()))
+    assert result["tested_terms"] == len(terms)
+    population_counts = {term: sum(term in propagated[gene] for gene in genes) for term in terms}
+    study_counts = {term: sum(term in propagated[gene] for gene in genes[:60]) for term in terms}
+    p_values = {term: hypergeom.sf(study_counts[term] - 1, 400, population_counts[term], 60) for term in terms}
+    adjusted = dict(zip(terms, false_discovery_control([p_values[term] for term in terms])))
+
+    reported = {row["term_id"]: row for row in result["results"]}
+    assert set(reported) == {term for term in terms if study_counts[term] > 0}
+    for term, row in reported.items():
+        assert row["study_count"] == study_counts[term]
+        assert row["population_count"] == population_counts[term]
+        assert row["p_value"] == pytest.approx(p_values[term], rel=1e-8)
+        assert row["fdr"] == pytest.approx(adjusted[term], rel=1e-8)
+        assert row["genes"] == [gene for gene in genes[:60] if term in propagated[gene]]
+    assert [row["p_value"] for row in result["results"]] == sorted(row["p_value"] for row in result["results"])
+
+    significant = index.enrich(study, alpha=0.05, min_count=2)["results"]
+    assert [row["term_id"] for row in significant] == [
+        row["term_id"] for row in result["results"] if row["fdr"] <= 0.05 and row["study_count"] >= 2]
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests of the node embeddings and feature clustering.
+"""
+
+import os
+import sys
+
+import numpy as np
+import scipy.sparse as sp
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import graph_embedding
+from app.services.graph_embedding import cluster_features, embed_nodes, spectral_embedding
+
+
+def two_cliques(first, second):
+    """Adjacency of two disconnected cliques of the given sizes"""
+    blocks = [np.ones((size, size)) - np.eye(size) for size in (first, second)]
+    return sp.csr_matrix(sp.block_diag(blocks))
+
+
+def test_embeddings_and_clusters_are_reproducible_for_a_seed():
+    rng = np.random.default_rng(1)
+    features = np.vstack((rng.normal(0, 1, (40, 3)), rng.normal(6, 1, (40, 3))))
+    adjacency = two_cliques(40, 40)
+
+    for method in ("pca", "spectral", "tsne"):
+        assert np.array_equal(embed_nodes(features, adjacency, method, seed=3),
+                              embed_nodes(features, adjacency, method, seed=3))
+    for method in ("kmeans", "minibatch"):
+        labels, used = cluster_features(features, 2, method, seed=3)
+        assert used == method
+        assert np.array_equal(labels, cluster_features(features, 2, method, seed=3)[0])
+        # The two well separated blobs are recovered
+        assert len(set(labels[:40].tolist())) == len(set(labels[40:].tolist())) == 1
+        assert labels[0] != labels[-1]
+
+
+def test_auto_clustering_switches_to_minibatch_above_the_exact_limit(monkeypatch):
+    features = np.random.default_rng(0).normal(size=(50, 3))
+    assert cluster_features(features, 3)[1] == "kmeans"
+
+    monkeypatch.setattr(graph_embedding, "EXACT_KMEANS_MAX_NODES", 49)
+    assert cluster_features(features, 3)[1] == "minibatch"
+
+
+def test_spectral_embedding_separates_disconnected_cliques():
+    for seed in range(3):
+        leading = spectral_embedding(two_cliques(6, 9), seed=seed)[:, 0]
+        first, second = leading[:6], leading[6:]
+
+        # The leading coordinate is nearly constant within each clique and
+        # differs between them (the second one only splits the cliques)
+        gap = abs(first.mean() - second.mean())
+        assert gap > 0.01
+        assert np.ptp(first) < 0.01 * gap and np.ptp(second) < 0.01 * gap
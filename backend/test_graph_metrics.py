@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests of the sparse centrality measures and hierarchy metrics.
+"""
+
+import os
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.dag_metrics import hierarchy_metrics
+from app.services.graph_centrality import compute_centrality, map_shortest_paths, sparse_centrality, worker_processes
+
+
+@pytest.mark.parametrize("directed", [False, True])
+def test_exact_centrality_matches_networkx(directed):
+    graph = nx.gnp_random_graph(80, 0.05, seed=7, directed=directed)
+    scores = compute_centrality(graph, mode="exact")
+    expected_betweenness = nx.betweenness_centrality(graph)
+    expected_closeness = nx.closeness_centrality(graph)
+    for node in graph:
+        assert scores["betweenness"][node] == pytest.approx(expected_betweenness[node], abs=1e-9)
+        assert scores["closeness"][node] == pytest.approx(expected_closeness[node], abs=1e-9)
+    assert scores["stats"]["method"] == "exact"
+
+
+def test_parallel_and_approximate_centrality():
+    graph = nx.barabasi_albert_graph(300, 2, seed=8)
+    adjacency = sp.csr_matrix(nx.to_scipy_sparse_array(graph, nodelist=list(graph), weight=None, format="csr"))
+    sources = np.arange(300)
+    serial = map_shortest_paths(adjacency, sources, 1)
+    parallel = map_shortest_paths(adjacency, sources, 2)
+    for key in serial:
+        np.testing.assert_allclose(parallel[key], serial[key])
+
+    exact = sparse_centrality(adjacency, mode="exact")["betweenness"]
+    approximate = sparse_centrality(adjacency, mode="approximate", epsilon=0.2, delta=0.5, seed=3)
+    assert approximate["stats"]["method"] == "approximate"
+    assert approximate["stats"]["sources"] < 300
+    assert np.abs(approximate["betweenness"] - exact).max() <= 0.2
+
+
+def test_requested_processes_are_validated_and_capped():
+    cpus = os.cpu_count() or 1
+    assert worker_processes(None) == cpus
+    assert worker_processes("1") == 1
+    assert worker_processes(1000) == cpus
+    for invalid in (0, -2, "many"):
+        with pytest.raises(ValueError):
+            worker_processes(invalid)
+
+    adjacency = sp.csr_matrix(nx.to_scipy_sparse_array(nx.path_graph(5), weight=None, format="csr"))
+    assert sparse_centrality(adjacency, processes="2")["stats"]["processes"] == 1
+    with pytest.raises(ValueError):
+        sparse_centrality(adjacency, processes=0)
+
+
+def random_hierarchy(n, seed):
+    """Random is-a DAG: every node but the first few picks earlier parents"""
+    rng = np.random.default_rng(seed)
+    children, parents = [], []
+    for node in range(3, n):
+        for parent in rng.choice(node, size=min(node, int(rng.integers(1, 4))), replace=False):
+            children.append(node)
+            parents.append(int(parent))
+    return np.array(children), np.array(parents)
+
+
+def test_hierarchy_metrics_match_path_lengths():
+    n = 200
+    children, parents = random_hierarchy(n, seed=9)
+    metrics = hierarchy_metrics(children, parents, n)
+
+    down = nx.DiGraph()
+    down.add_nodes_from(range(n))
+    down.add_edges_from(zip(parents.tolist(), children.tolist()))
+    roots = [node for node in down if down.in_degree(node) == 0]
+    assert metrics["roots"].tolist() == roots
+    assert metrics["leaves"].tolist() == [node for node in down if down.out_degree(node) == 0]
+
+    depth = {root: 0 for root in roots}
+    for node in nx.topological_sort(down):
+        if node not in depth:
+            depth[node] = 1 + max(depth[parent] for parent in down.predecessors(node))
+    assert metrics["depth"].tolist() == [depth[node] for node in range(n)]
+    level = nx.multi_source_dijkstra_path_length(down, roots)
+    assert metrics["level"].tolist() == [level[node] for node in range(n)]
+    height = {}
+    for node in reversed(list(nx.topological_sort(down))):
+        height[node] = max((1 + height[child] for child in down.successors(node)), default=0)
+    assert metrics["height"].tolist() == [height[node] for node in range(n)]
+    assert metrics["max_depth"] == max(depth.values())
+    assert len(metrics["cyclic_nodes"]) == 0 and metrics["cycles"] == []
+
+
+def test_hierarchy_cycles_are_reported():
+    children, parents = random_hierarchy(50, seed=10)
+    # 40 -> 41 -> 42 -> 40 closes a cycle below the DAG
+    children = np.concatenate((children, [40, 41, 42]))
+    parents = np.concatenate((parents, [41, 42, 40]))
+    metrics = hierarchy_metrics(children, parents, 50)
+    assert set(metrics["cyclic_nodes"].tolist()) >= {40, 41, 42}
+    assert metrics["cycles"] and all(len(cycle) > 1 for cycle in metrics["cycles"])
+    assert (metrics["depth"][metrics["cyclic_nodes"]] == -1).all()
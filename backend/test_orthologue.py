@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Tests of the orthologue helpers that map OrthoFinder data onto trees.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.api import orthologue
+from app.services.ancestral_reconstruction import reconstruct_gain_loss
+from app.services.compact_tree import CompactTree, LCAIndex
+from app.services.reconciliation import reconcile
+from app.services.tree_cache import tree_cache
+
+SPECIES_NEWICK = "((A:1,B:1):1,(C:1,D:1):1);"
+
+
+def test_gene_leaves_match_longest_species_prefix(monkeypatch):
+    monkeypatch.setattr(orthologue, "get_orthogroup_genes", lambda orthogroup_id: {"Oryza_sativa": ["Os01g0100"]})
+    gene_tree = CompactTree.from_newick(
+        "((Zea_mays_AGPv3_GRMZM2G001:1,Zea_mays_GRMZM2G002:1):1,(Os01g0100:1,Oryza_sativa_Os02g0200:1):1,x_y:1);"
+    )
+    species_leaves = {"Zea_mays": 1, "Zea_mays_AGPv3": 2, "Oryza_sativa": 3}
+
+    leaf_species = orthologue.map_gene_leaves(gene_tree, "OG0000001", species_leaves)
+    mapped = {gene_tree.names[leaf]: int(leaf_species[leaf]) for leaf in range(gene_tree.n_nodes)
+              if gene_tree.is_leaf[leaf]}
+    assert mapped == {
+        "Zea_mays_AGPv3_GRMZM2G001": 2,
+        "Zea_mays_GRMZM2G002": 1,
+        "Os01g0100": 3,
+        "Oryza_sativa_Os02g0200": 3,
+        "x_y": -1,
+    }
+
+
+def test_species_copy_numbers_with_empty_and_unmapped_species(monkeypatch):
+    orthogroups = pd.DataFrame({
+        "Orthogroup": ["OG1", "OG2"],
+        "A": ["a1, a2", "a3"],
+        "B": [np.nan, np.nan],
+        "C": ["c1", " "],
+    })
+    monkeypatch.setattr(orthologue, "_species_copy_numbers", None)
+    monkeypatch.setattr(orthologue, "load_orthogroups_data", lambda: orthogroups)
+    monkeypatch.setattr(orthologue, "load_species_tree", lambda: SPECIES_NEWICK)
+    monkeypatch.setattr(orthologue, "load_species_mapping", lambda: {"newick_to_full": {}, "full_to_newick": {}})
+
+    data = orthologue.load_species_copy_numbers()
+    tree = CompactTree.from_newick(SPECIES_NEWICK)
+    copy_numbers = {tree.names[leaf]: data["copy_numbers"][leaf].tolist() for leaf in np.flatnonzero(tree.is_leaf)}
+    assert copy_numbers == {"A": [2, 1], "B": [0, 0], "C": [1, 0], "D": [0, 0]}
+    assert data["unmapped_leaves"] == ["D"]
+    assert [tree.names[leaf] for leaf in np.flatnonzero(data["missing_leaves"])] == ["D"]
+
+
+def test_gain_loss_survives_species_tree_eviction(monkeypatch):
+    orthogroups = pd.DataFrame({"Orthogroup": ["OG1"], "A": ["a1"], "B": ["b1"], "C": [np.nan], "D": ["d1"]})
+    monkeypatch.setattr(orthologue, "_species_copy_numbers", None)
+    monkeypatch.setattr(orthologue, "_gain_loss_results", {})
+    monkeypatch.setattr(orthologue, "load_orthogroups_data", lambda: orthogroups)
+    monkeypatch.setattr(orthologue, "load_species_tree", lambda: SPECIES_NEWICK)
+    monkeypatch.setattr(orthologue, "load_species_mapping", lambda: {"newick_to_full": {}, "full_to_newick": {}})
+
+    orthologue.load_species_copy_numbers()
+    tree_cache.clear()
+    result = orthologue.get_gain_loss("dollo")
+    assert result["orthogroup_losses"].tolist() == [1]
+
+    monkeypatch.setattr(orthologue, "_clade_summary", None)
+    tree_cache.clear()
+    assert orthologue.get_clade_summary()["gene_count"].tolist() == [3, 2, 1, 1, 1, 0, 1]
+
+
+def test_missing_leaves_add_no_losses():
+    tree = CompactTree.from_newick(SPECIES_NEWICK)
+    presence = np.zeros((tree.n_nodes, 1), dtype=bool)
+    presence[[tree.name_to_index[name] for name in ("A", "B", "C")]] = True
+    missing = np.zeros(tree.n_nodes, dtype=bool)
+    missing[tree.name_to_index["D"]] = True
+
+    for method in ("dollo", "fitch"):
+        assert reconstruct_gain_loss(tree, presence, method)["orthogroup_losses"].tolist() == [1]
+        result = reconstruct_gain_loss(tree, presence, method, missing_leaves=missing)
+        assert result["orthogroup_losses"].tolist() == [0], method
+        assert result["origin"].tolist() == [0], method
+
+
+def test_reconstruction_matches_dollo_definition_in_any_block_size():
+    tree = CompactTree.from_newick("(((A:1,B:1):1,(C:1,D:1):1):1,((E:1,F:1):1,G:1):1,H:1);")
+    leaves = np.flatnonzero(tree.is_leaf)
+    rng = np.random.default_rng(5)
+    presence = np.zeros((tree.n_nodes, 200), dtype=bool)
+    presence[leaves] = rng.random((len(leaves), 200)) < 0.4
+    index = LCAIndex(tree)
+
+    for method in ("dollo", "fitch"):
+        whole = reconstruct_gain_loss(tree, presence, method)
+        blocked = reconstruct_gain_loss(tree, presence, method, block_size=7)
+        for key in ("branch_gains", "branch_losses", "origin", "orthogroup_losses"):
+            assert whole[key].tolist() == blocked[key].tolist(), (method, key)
+
+    # Dollo: one gain at the LCA of the present leaves, then one loss per
+    # maximal subtree without them
+    dollo = reconstruct_gain_loss(tree, presence, "dollo")
+    for column in range(presence.shape[1]):
+        present = leaves[presence[leaves, column]]
+        if len(present) == 0:
+            assert dollo["origin"][column] == -1
+            continue
+        origin = index.lca_of(present)
+        has_present = tree.postorder_sum(presence[:, column].astype(np.int64)) > 0
+        clade = np.arange(origin + 1, origin + tree.subtree_size[origin])
+        lost = clade[~has_present[clade] & has_present[tree.parent[clade]]]
+        assert dollo["origin"][column] == origin
+        assert dollo["orthogroup_gains"][column] == 1
+        assert dollo["orthogroup_losses"][column] == len(lost)
+
+
+def test_reconciliation_events_and_losses():
+    species = CompactTree.from_newick("((A:1,B:1)AB:1,C:1)root;")
+    index = LCAIndex(species)
+
+    def reconciled(newick):
+        gene_tree = CompactTree.from_newick(newick)
+        leaf_species = np.array([species.name_to_index.get(name[:1].upper(), -1) if gene_tree.is_leaf[node] else -1
+                                 for node, name in enumerate(gene_tree.names)])
+        result = reconcile(gene_tree, index, leaf_species)
+        return {name: (species.names[result["mapping"][node]] if result["mapping"][node] >= 0 else None,
+                       result["events"][node], int(result["losses"][node]))
+                for node, name in enumerate(gene_tree.names)}, result
+
+    events, result = reconciled("(((a1,b1)x,(a2,b2)y)z,c1)r;")
+    assert events["z"] == ("AB", "duplication", 0)
+    assert events["x"] == ("AB", "speciation", 0)
+    assert events["r"] == ("root", "speciation", 0)
+    assert (result["duplications"], result["speciations"], result["total_losses"]) == (1, 3, 0)
+
+    # The duplicated copy keeping only b1 lost the A and C lineages
+    events, result = reconciled("((a1,c1)x,b1,q1)r;")
+    assert events["r"] == ("root", "duplication", 0)
+    assert events["x"] == ("root", "speciation", 0)
+    assert events["a1"] == ("A", "leaf", 1)
+    assert events["b1"] == ("B", "leaf", 2)
+    assert events["q1"] == (None, "unmapped", 0)
+    assert result["total_losses"] == 3
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tests of the /api/phylo endpoints through the FastAPI test client.
+"""
+
+import os
+import sys
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.api import phylo
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_annotate_tree_with_named_internal_nodes():
+    response = client.post("/api/phylo/annotate", json={
+        "newick": "((A:1,B:1)AB:1,C:2)root;",
+        "annotations": {"A": {"habitat": "soil"}, "AB": {"habitat": "mixed"}}
+    })
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["tree"]["name"] == "root"
+    assert [child["name"] for child in result["tree"]["children"]] == ["AB", "C"]
+    habitats = dict(zip(result["names"], result["annotations"]["habitat"]))
+    assert habitats["A"] == "soil" and habitats["AB"] == "mixed"
+
+
+def test_mrca_and_prune_accept_unquoted_species_names():
+    newick = "(('Zea mays AGPv3':1,'Oryza sativa':1)Poaceae:1,Arabidopsis:2);"
+    response = client.post("/api/phylo/mrca", json={"newick": newick, "leaves": ["Zea mays AGPv3", "Oryza sativa"]})
+    assert response.status_code == 200, response.text
+    assert response.json()["mrca"]["name"] == "Poaceae"
+
+    response = client.post("/api/phylo/prune", json={"newick": newick, "leaves": ["Zea mays AGPv3", "Arabidopsis"]})
+    assert response.status_code == 200, response.text
+
+
+def test_patristic_matrix_is_capped(monkeypatch):
+    monkeypatch.setattr(phylo, "MAX_PATRISTIC_LEAVES", 3)
+    newick = "((A:1,B:2):1,(C:1,D:1):2);"
+    response = client.post("/api/phylo/patristic", json={"newick": newick})
+    assert response.status_code == 400
+
+    response = client.post("/api/phylo/patristic", json={"newick": newick, "leaves": ["A", "C"]})
+    assert response.status_code == 200, response.text
+    assert response.json()["leaves"] == ["A", "C"]
+    assert response.json()["matrix"] == [[0.0, 5.0], [5.0, 0.0]]
+
+    response = client.post("/api/phylo/patristic", json={"newick": newick, "leaves": ["A", "B", "C", "D"]})
+    assert response.status_code == 400
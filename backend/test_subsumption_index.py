@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests of the subsumption index against a NetworkX reference closure,
+after the bulk build and after incremental triple updates.
+"""
+
+import os
+import random
+import sys
+
+import networkx as nx
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import subsumption_index
+from app.services.subsumption_index import SubsumptionIndex
+
+
+def triple(source, target, relation="subClassOf"):
+    return {"source": source, "target": target, "type": relation}
+
+
+def assert_matches(index, reference, nodes):
+    """Compare every query of the index with the reference graph (edges
+    from child to parent)"""
+    for node in nodes:
+        below = nx.ancestors(reference, node) if node in reference else set()
+        above = nx.descendants(reference, node) if node in reference else set()
+        if node in index.node_index:
+            assert set(index.descendants(node)) == below, node
+            assert index.descendant_count(node) == len(below), node
+            assert set(index.ancestors(node)) == above, node
+        else:
+            assert not below and not above, node
+        for other in nodes:
+            assert index.is_ancestor(node, other) == (other in below), (node, other)
+
+
+def random_hierarchy(rng, n):
+    nodes = [f"n{i}" for i in range(n)]
+    edges = []
+    for i in range(1, n):
+        for parent in rng.sample(range(i), k=min(i, rng.choice([1, 1, 2, 3]))):
+            edges.append(triple(nodes[i], nodes[parent], rng.choice(["subClassOf", "partOf"])))
+    rng.shuffle(edges)
+    return nodes, edges
+
+
+def test_bulk_build_with_extra_parents():
+    # n4's extra child n6 is labelled right before n4's own range, so the
+    # interval n4 passes up to n2 is a single widened one
+    edges = [triple(source, target) for source, target in (
+        ("n6", "n1"), ("n5", "n0"), ("n3", "n0"), ("n2", "n1"), ("n2", "n0"), ("n5", "n3"), ("n6", "n4"),
+        ("n1", "n0"), ("n7", "n0"), ("n8", "n3"), ("n8", "n5"), ("n4", "n2"), ("n4", "n3"))]
+    index = SubsumptionIndex.from_data({"nodes": [], "edges": edges})
+    reference = nx.DiGraph([(edge["source"], edge["target"]) for edge in edges])
+    assert_matches(index, reference, list(reference))
+
+
+def test_bulk_build_matches_reference():
+    rng = random.Random(1)
+    for _ in range(200):
+        nodes, edges = random_hierarchy(rng, rng.randint(2, 12))
+        index = SubsumptionIndex.from_data({"nodes": [], "edges": edges})
+        reference = nx.DiGraph([(edge["source"], edge["target"]) for edge in edges])
+        assert_matches(index, reference, nodes)
+
+
+def test_cycle_closing_triples_are_rejected():
+    index = SubsumptionIndex.from_data({"nodes": [], "edges": [triple("b", "a"), triple("c", "b")]})
+    result = index.update(add=[triple("a", "c"), triple("d", "c", "partOf")])
+    assert result["added"] == 1
+    assert result["rejected"] == [triple("a", "c")]
+    assert index.is_ancestor("a", "d") and not index.is_ancestor("c", "a")
+
+
+def test_relations_outside_the_index_are_ignored():
+    index = SubsumptionIndex.from_data({"nodes": [], "edges": [triple("b", "a")]}, ("subClassOf",))
+    result = index.update(add=[triple("c", "b", "partOf")], remove=[triple("b", "a", "partOf")])
+    assert result == {"added": 0, "removed": 0, "ignored": 2, "rejected": []}
+    assert index.is_ancestor("a", "b")
+
+
+@pytest.mark.parametrize("compaction_factor", [1.01, 2.0, 1000.0])
+def test_incremental_updates_match_reference(monkeypatch, compaction_factor):
+    monkeypatch.setattr(subsumption_index, "COMPACTION_FACTOR", compaction_factor)
+    rng = random.Random(2)
+    for _ in range(8):
+        n = rng.randint(2, 25)
+        nodes, edges = random_hierarchy(rng, n)
+        index = SubsumptionIndex.from_data({"nodes": [], "edges": edges})
+        present = {(edge["source"], edge["target"], edge["type"]) for edge in edges}
+        reference = nx.DiGraph([(edge["source"], edge["target"]) for edge in edges])
+        nodes = [f"n{i}" for i in range(n + 3)]
+
+        for _ in range(40):
+            if present and rng.random() < 0.45:
+                source, target, relation = rng.choice(sorted(present))
+                assert index.update(remove=[triple(source, target, relation)])["removed"] == 1
+                present.discard((source, target, relation))
+                if not any(other[:2] == (source, target) for other in present):
+                    reference.remove_edge(source, target)
+            else:
+                source, target = rng.sample(nodes, 2)
+                relation = rng.choice(["subClassOf", "partOf"])
+                result = index.update(add=[triple(source, target, relation)])
+                closes_cycle = source in reference and target in reference and nx.has_path(reference, target, source)
+                if closes_cycle:
+                    assert result["rejected"] == [triple(source, target, relation)]
+                else:
+                    assert result["added"] == 1
+                    present.add((source, target, relation))
+                    reference.add_edge(source, target)
+            assert_matches(index, reference, nodes)
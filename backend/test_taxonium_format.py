@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Tests of the Taxonium payload encodings.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.compact_tree import CompactTree
+from app.services.taxonium_format import (
+    DEFAULT_SUPPORT, columns_to_nodes, decode_binary, encode_taxonium, tree_columns
+)
+
+
+def test_rows_columnar_and_binary_encode_the_same_nodes():
+    tree = CompactTree.from_newick("((A:1,B:2)0.9:1,(C:0.5,D:1.5):2,E:3);")
+    columns, metadata_columns = tree_columns(tree)
+    metadata = {"tree_id": "example"}
+
+    rows = encode_taxonium(columns, metadata_columns, metadata, "rows")
+    columnar = encode_taxonium(columns, metadata_columns, metadata, "columnar")
+    binary = encode_taxonium(columns, metadata_columns, metadata, "binary")
+    binary_columns, binary_metadata_columns, binary_metadata = decode_binary(binary)
+
+    assert rows["nodes"] == columns_to_nodes(columnar["columns"], columnar["metadata_columns"])
+    assert rows["nodes"] == columns_to_nodes(binary_columns, binary_metadata_columns)
+    assert rows["metadata"] == columnar["metadata"] == binary_metadata == metadata
+
+    # Every row keeps a support value, with the ETE3 default where none was given
+    by_name = {node["name"]: node for node in rows["nodes"]}
+    assert by_name["A"]["metadata"] == {"support": DEFAULT_SUPPORT}
+    assert by_name["E"]["metadata"] == {"support": DEFAULT_SUPPORT}
+    internal = [node for node in rows["nodes"] if node["name"] not in set("ABCDE")]
+    assert [node["metadata"]["support"] for node in internal] == [DEFAULT_SUPPORT, 0.9, DEFAULT_SUPPORT]
+    assert rows["nodes"][0]["parentId"] is None
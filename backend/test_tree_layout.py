@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests of the tree layout coordinates and level-of-detail summaries.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.compact_tree import CompactTree
+from app.services.tree_layout import compute_layout
+from app.services.tree_lod import LOD_BASE_NODES, LOD_ZOOM_FACTOR, TreeLODService
+
+
+def caterpillar_of_cherries(n_cherries):
+    """Unbalanced tree: a ladder with a two-leaf clade on every rung"""
+    newick = "(A0:1,B0:2)"
+    for i in range(1, n_cherries):
+        newick = f"({newick}:1,(A{i}:1,B{i}:{i % 3 + 1}):1)"
+    return CompactTree.from_newick(newick + ";")
+
+
+def test_layout_spaces_leaves_and_centres_parents():
+    tree = CompactTree.from_newick("((A:1,(B:1,C:2):0.5):1,D:3,(E:1,F:1,G:1):2);")
+    layout = compute_layout(tree)
+    y = layout["y"]
+
+    # Leaves are one unit apart in preorder
+    assert y[tree.is_leaf].tolist() == list(range(7))
+
+    # Each internal node sits at the mean height of its children
+    for node in np.flatnonzero(~tree.is_leaf).tolist():
+        children = np.flatnonzero(tree.parent == node)
+        children = children[children != 0]
+        assert np.isclose(y[node], y[children].mean())
+
+    # Rectangular x is the root distance, or the depth for cladograms
+    assert np.allclose(layout["x"], tree.root_distance)
+    assert np.array_equal(compute_layout(tree, use_branch_lengths=False)["x"], tree.depth)
+
+    # Radial coordinates use x as radius and the leaf position as angle
+    angle = 2 * np.pi * y / 7
+    assert np.allclose(layout["x_radial"], layout["x"] * np.cos(angle))
+    assert np.allclose(layout["y_radial"], layout["x"] * np.sin(angle))
+    assert np.allclose(np.hypot(layout["x_radial"], layout["y_radial"]), layout["x"])
+
+
+def test_lod_levels_partition_the_leaves_within_their_budget():
+    tree = caterpillar_of_cherries(600)
+    lod = TreeLODService(tree, compute_layout(tree))
+    assert lod.max_zoom == 2
+
+    for zoom in range(lod.max_zoom + 1):
+        selection = lod.visible_nodes(zoom)
+        nodes = selection["nodes"]
+        visible = set(nodes.tolist())
+        assert all(int(tree.parent[node]) in visible for node in nodes[1:])
+        if zoom < lod.max_zoom:
+            assert len(nodes) <= LOD_BASE_NODES * LOD_ZOOM_FACTOR ** zoom
+        else:
+            assert len(nodes) == tree.n_nodes
+        # Visible leaves plus the leaves under collapsed clades cover each leaf once
+        shown = nodes[selection["collapsed"] | tree.is_leaf[nodes]]
+        assert tree.leaf_count[shown].sum() == tree.leaf_count[0]
+
+
+def test_lod_viewport_and_zoom_clamping():
+    tree = caterpillar_of_cherries(600)
+    layout = compute_layout(tree)
+    lod = TreeLODService(tree, layout)
+
+    selection = lod.visible_nodes(0, y_min=1150, y_max=1190, max_nodes=150)
+    nodes = selection["nodes"]
+    assert len(nodes) <= 150
+    assert np.all((lod.leaf_last[nodes[1:]] >= 1150) & (lod.leaf_first[nodes[1:]] <= 1190))
+    leaves = nodes[tree.is_leaf[nodes]]
+    assert layout["y"][leaves].min() >= 1150 and layout["y"][leaves].max() <= 1190
+    assert len(leaves) == 41
+
+    payload = lod.to_taxonium(zoom=99)
+    assert payload["metadata"]["zoom"] == payload["metadata"]["max_zoom"] == 2
+    assert len(payload["nodes"]) == tree.n_nodes
+    assert lod.to_taxonium(zoom=-3)["metadata"]["zoom"] == 0
+    collapsed = [node for node in lod.to_taxonium(zoom=0)["nodes"] if node["collapsed"]]
+    assert collapsed and all(node["summary"]["leafCount"] > 1 for node in collapsed)